@@ -148,3 +148,180 @@ SPECTACULAR_SETTINGS = {
 
 OPENAI_ORGANIZATION = os.environ.get('OPENAI_ORGANIZATION')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+
+# Encodings loaded at startup. Set TIKTOKEN_CACHE_DIR to a directory
+# populated by `manage.py preload_tokenizers` to load them offline.
+TIKTOKEN_PRELOAD_ENCODINGS = [
+    name for name in os.environ.get('TIKTOKEN_PRELOAD_ENCODINGS', '').split(',')
+    if name
+]
+
+# Token counts over this many characters are split across TOKEN_COUNT_THREADS.
+TOKEN_COUNT_PARALLEL_THRESHOLD = int(
+    os.environ.get('TOKEN_COUNT_PARALLEL_THRESHOLD', 100000))
+TOKEN_COUNT_THREADS = int(os.environ.get('TOKEN_COUNT_THREADS', 4))
+
+# Memory for cached token counts of texts of TOKEN_CACHE_MIN_LENGTH
+# characters or more. 0 disables the cache.
+TOKEN_CACHE_MAX_BYTES = int(
+    os.environ.get('TOKEN_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+TOKEN_CACHE_MIN_LENGTH = int(os.environ.get('TOKEN_CACHE_MIN_LENGTH', 256))
+
+# Maximum number of items counted by one token count request.
+TOKEN_COUNT_MAX_ITEMS = int(os.environ.get('TOKEN_COUNT_MAX_ITEMS', 10000))
+
+# Seconds after which the Balance held for an unsettled API call, such as
+# one of a crashed worker, is given back.
+BALANCE_HOLD_TTL = int(os.environ.get('BALANCE_HOLD_TTL', 600))
+
+# max_tokens of chat completions that do not set it. None allows
+# completions up to the User's Balance, which is then held in full.
+CHAT_COMPLETION_DEFAULT_MAX_TOKENS = (
+    int(os.environ['CHAT_COMPLETION_DEFAULT_MAX_TOKENS'])
+    if 'CHAT_COMPLETION_DEFAULT_MAX_TOKENS' in os.environ else None
+)
+
+# Memory for cached chat completions, which are requested with
+# "cache": true and a temperature of 0. 0 disables the cache.
+CHAT_COMPLETION_CACHE_MAX_BYTES = int(
+    os.environ.get('CHAT_COMPLETION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Seconds a completion is cached for.
+CHAT_COMPLETION_CACHE_TTL = int(
+    os.environ.get('CHAT_COMPLETION_CACHE_TTL', 24 * 3600))
+# Charge for cached completions: 'full', 'discount' for the full cost
+# less CHAT_COMPLETION_CACHE_DISCOUNT (a fraction), or 'free'.
+CHAT_COMPLETION_CACHE_BILLING = os.environ.get(
+    'CHAT_COMPLETION_CACHE_BILLING', 'full')
+CHAT_COMPLETION_CACHE_DISCOUNT = float(
+    os.environ.get('CHAT_COMPLETION_CACHE_DISCOUNT', 0.5))
+
+# Usage records are added to their rollups in the background, in batches
+# of this size every this many seconds.
+USAGE_LEDGER_BATCH_SIZE = int(os.environ.get('USAGE_LEDGER_BATCH_SIZE', 100))
+USAGE_LEDGER_FLUSH_INTERVAL = float(
+    os.environ.get('USAGE_LEDGER_FLUSH_INTERVAL', 5))
+
+# Caches shared by the workers. Without REDIS_URL each process has its own
+# in-memory cache, which is only suitable for development and tests.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+
+def cache_config(db):
+    """Return the configuration of a cache in a Redis database."""
+    if REDIS_URL:
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f'{REDIS_URL.rstrip("/")}/{db}',
+        }
+
+    return {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'cache-{db}',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+
+
+CACHES = {
+    'default': cache_config(0),
+    # Write-behind journal. Its Redis database must not evict keys.
+    'balance': cache_config(1),
+}
+
+# Deduct Balances in the 'balance' cache, to be applied to the database by
+# `manage.py flush_balance_buffer`. A User's unflushed deductions are
+# written to the database directly once they would exceed
+# BALANCE_WRITE_BEHIND_MAX_PENDING.
+BALANCE_WRITE_BEHIND = os.environ.get('BALANCE_WRITE_BEHIND') == '1'
+BALANCE_WRITE_BEHIND_MAX_PENDING = int(
+    os.environ.get('BALANCE_WRITE_BEHIND_MAX_PENDING', 10000))
+BALANCE_WRITE_BEHIND_BATCH_SIZE = int(
+    os.environ.get('BALANCE_WRITE_BEHIND_BATCH_SIZE', 1000))
+# Seconds after which a journal entry that was never written, such as one
+# of a crashed worker, is skipped.
+BALANCE_WRITE_BEHIND_GAP_TIMEOUT = float(
+    os.environ.get('BALANCE_WRITE_BEHIND_GAP_TIMEOUT', 60))
+
+# Seconds a User's Balance is cached in the default cache, and in the
+# memory of each process. Other processes may see a Balance up to
+# BALANCE_CACHE_LOCAL_TTL seconds old.
+BALANCE_CACHE_TTL = int(os.environ.get('BALANCE_CACHE_TTL', 60))
+BALANCE_CACHE_LOCAL_TTL = float(os.environ.get('BALANCE_CACHE_LOCAL_TTL', 1))
+
+# Number of items of a bulk Balance request applied per transaction.
+BALANCE_BULK_BATCH_SIZE = int(os.environ.get('BALANCE_BULK_BATCH_SIZE', 1000))
+
+# Seconds an Auth token and its User are cached in the default cache, and
+# in the memory of each process. Deleted tokens and changed Users are
+# dropped from the cache, but other processes may still accept them for
+# up to AUTH_TOKEN_CACHE_LOCAL_TTL seconds.
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+AUTH_TOKEN_CACHE_LOCAL_TTL = float(
+    os.environ.get('AUTH_TOKEN_CACHE_LOCAL_TTL', 5))
+
+# Keys of signed access tokens, as "version:secret" pairs. Tokens are
+# signed with ACCESS_TOKEN_KEY_VERSION and verified with the key of their
+# version, so removing a key revokes every token signed with it.
+ACCESS_TOKEN_KEYS = dict(
+    pair.split(':', 1)
+    for pair in os.environ.get('ACCESS_TOKEN_KEYS', '').split(',') if pair
+) or {'1': SECRET_KEY}
+ACCESS_TOKEN_KEY_VERSION = os.environ.get(
+    'ACCESS_TOKEN_KEY_VERSION', list(ACCESS_TOKEN_KEYS)[-1])
+# Seconds signed access and refresh tokens are valid for.
+ACCESS_TOKEN_LIFETIME = int(os.environ.get('ACCESS_TOKEN_LIFETIME', 900))
+REFRESH_TOKEN_LIFETIME = int(
+    os.environ.get('REFRESH_TOKEN_LIFETIME', 14 * 24 * 3600))
+# Seconds after which each process reloads the revoked tokens.
+ACCESS_TOKEN_REVOCATION_REFRESH = float(
+    os.environ.get('ACCESS_TOKEN_REVOCATION_REFRESH', 10))
+
+# Serve the model and chat completion APIs with async views, which wait
+# for the upstream API without holding a thread. Only useful when served
+# over ASGI, e.g. `uvicorn app.asgi:application`.
+OPENAI_ASYNC_VIEWS = os.environ.get('OPENAI_ASYNC_VIEWS') == '1'
+
+# Connections to the OpenAI API kept alive by each process and reused by
+# every view. Async views wait for one of them to be free, sync views open
+# a short-lived connection beyond this many.
+OPENAI_POOL_SIZE = int(os.environ.get('OPENAI_POOL_SIZE', 100))
+# Seconds to wait for a connection to the OpenAI API, and for each read
+# of its response.
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', 300))
+
+# Seconds the models of the OpenAI API are cached by each process. Stale
+# models are served while they are listed again in the background.
+OPENAI_MODEL_CACHE_TTL = int(os.environ.get('OPENAI_MODEL_CACHE_TTL', 3600))
+
+# Chat completions each process makes upstream at once, in total and per
+# User. Requests over either cap are queued, each User's in turn, and
+# refused after waiting OPENAI_QUEUE_TIMEOUT seconds. The sync views refuse
+# a request at once when its User's requests in flight and queued reach
+# OPENAI_MAX_CONCURRENT_PER_USER, as each waits in a worker thread. The
+# async views queue up to OPENAI_MAX_QUEUED_PER_USER requests per User.
+OPENAI_MAX_CONCURRENT = int(os.environ.get('OPENAI_MAX_CONCURRENT', 64))
+OPENAI_MAX_CONCURRENT_PER_USER = int(
+    os.environ.get('OPENAI_MAX_CONCURRENT_PER_USER', 4))
+OPENAI_MAX_QUEUED_PER_USER = int(
+    os.environ.get('OPENAI_MAX_QUEUED_PER_USER', 16))
+OPENAI_QUEUE_TIMEOUT = float(os.environ.get('OPENAI_QUEUE_TIMEOUT', 30))
+
+# Upstream calls failing with rate limits, server errors, timeouts or
+# connection errors are retried up to OPENAI_MAX_RETRIES times, after
+# jittered exponential delays from OPENAI_RETRY_BASE_DELAY up to
+# OPENAI_RETRY_MAX_DELAY seconds, or as told by Retry-After, while they
+# fit in OPENAI_RETRY_BUDGET seconds.
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 3))
+OPENAI_RETRY_BASE_DELAY = float(
+    os.environ.get('OPENAI_RETRY_BASE_DELAY', 0.5))
+OPENAI_RETRY_MAX_DELAY = float(os.environ.get('OPENAI_RETRY_MAX_DELAY', 8))
+OPENAI_RETRY_BUDGET = float(os.environ.get('OPENAI_RETRY_BUDGET', 10))
+# Upstream calls fail fast for OPENAI_BREAKER_RESET_TIMEOUT seconds once
+# OPENAI_BREAKER_ERROR_RATE of the calls of the last OPENAI_BREAKER_WINDOW
+# seconds failed, over at least OPENAI_BREAKER_MIN_CALLS calls.
+OPENAI_BREAKER_ERROR_RATE = float(
+    os.environ.get('OPENAI_BREAKER_ERROR_RATE', 0.5))
+OPENAI_BREAKER_MIN_CALLS = int(os.environ.get('OPENAI_BREAKER_MIN_CALLS', 20))
+OPENAI_BREAKER_WINDOW = float(os.environ.get('OPENAI_BREAKER_WINDOW', 30))
+OPENAI_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get('OPENAI_BREAKER_RESET_TIMEOUT', 30))
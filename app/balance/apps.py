@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BalanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'balance'
+
+    def ready(self):
+        """
+        Drop cached Balances when a Balance is saved, and register the
+        system checks.
+        """
+        import balance.cache  # noqa: F401
+        import balance.checks  # noqa: F401
@@ -0,0 +1,193 @@
+"""
+Write-behind buffer of Balance deductions.
+"""
+import time
+import uuid
+from collections import defaultdict
+
+from balance.cache import balance_cache
+from core.models import (
+    Balance,
+    BalanceHold,
+    WriteBehindCursor,
+)
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import (
+    Case,
+    F,
+    When,
+)
+from django.db.models.functions import Greatest
+
+EPOCH_KEY = 'balance:journal:epoch'
+SEQUENCE_KEY = 'balance:journal:{}:seq'
+ENTRY_KEY = 'balance:journal:{}:{}'
+PENDING_KEY = 'balance:pending:{}'
+
+# Pending totals are dropped after this many seconds, so that one left
+# behind by a crashed flusher does not keep a User's Balance reduced.
+PENDING_TTL = 3600
+
+
+class DeductionBuffer:
+    """
+    Journal of Balance deductions and hold settlements kept in the
+    'balance' cache. flush() applies the journal to the database in order,
+    moving a WriteBehindCursor in the same transaction, so that each entry
+    is applied exactly once even if a flusher crashes. Entries not yet
+    flushed are lost with the cache. The journal then starts again in a
+    new epoch, to which the cursor is moved back.
+    """
+
+    def __init__(self):
+        self._gap = None
+
+    @property
+    def cache(self):
+        return caches['balance']
+
+    def epoch(self):
+        """Return the epoch of the journal, starting one if there is none."""
+        epoch = self.cache.get(EPOCH_KEY)
+        if epoch is None:
+            self.cache.add(EPOCH_KEY, uuid.uuid4().hex, timeout=None)
+            epoch = self.cache.get(EPOCH_KEY)
+
+        return epoch
+
+    def _append(self, user_id, cost, hold_id=None, held=0):
+        """Append an entry to the journal."""
+        epoch = self.epoch()
+        self.cache.add(SEQUENCE_KEY.format(epoch), 0, timeout=None)
+        sequence = self.cache.incr(SEQUENCE_KEY.format(epoch))
+        self.cache.set(
+            ENTRY_KEY.format(epoch, sequence),
+            (user_id, cost, hold_id, held),
+            timeout=None,
+        )
+
+    def pending(self, user_id):
+        """Return the unflushed deductions of a User."""
+        return self.cache.get(PENDING_KEY.format(user_id), 0)
+
+    def deduct(self, user_id, cost):
+        """Buffer a deduction from a User's Balance."""
+        key = PENDING_KEY.format(user_id)
+        self.cache.add(key, 0, timeout=PENDING_TTL)
+        self.cache.incr(key, cost)
+        self._append(user_id, cost)
+
+    def settle(self, hold, cost):
+        """Buffer the settlement of a hold for the actual cost."""
+        self._append(hold.user_id, cost, hold.pk, hold.amount)
+
+    def _read(self, epoch, start, stop):
+        """Return the journal entries from start up to the first missing."""
+        keys = [ENTRY_KEY.format(epoch, seq) for seq in range(start, stop)]
+        found = self.cache.get_many(keys)
+
+        entries = []
+        for seq, key in enumerate(keys, start):
+            if key in found:
+                entries.append(found[key])
+                continue
+
+            # The entry is still being written, unless its worker crashed.
+            if self._gap is None or self._gap[0] != seq:
+                self._gap = (seq, time.monotonic())
+            if time.monotonic() - self._gap[1] < \
+                    settings.BALANCE_WRITE_BEHIND_GAP_TIMEOUT:
+                break
+            entries.append(None)
+
+        return entries
+
+    def _apply(self, entries):
+        """Apply the net deductions of journal entries to the Balances."""
+        hold_ids = [entry[2] for entry in entries if entry[2] is not None]
+        # Holds released as expired were already given back in full.
+        held = set(BalanceHold.objects.select_for_update().filter(
+            pk__in=hold_ids).values_list('pk', flat=True))
+        BalanceHold.objects.filter(pk__in=held).delete()
+
+        totals = defaultdict(int)
+        for user_id, cost, hold_id, amount in entries:
+            totals[user_id] += cost
+            if hold_id in held:
+                totals[user_id] -= amount
+
+        totals = {user_id: total for user_id, total in totals.items() if total}
+        # Sharded Balances are updated through their shards.
+        for user_id in Balance.objects.filter(
+                user_id__in=totals, shards__gt=0).values_list(
+                    'user_id', flat=True):
+            total = totals.pop(user_id)
+            if total > 0:
+                Balance.objects.take_at_most(user_id, total)
+            else:
+                Balance.objects.give(user_id, -total)
+
+        if totals:
+            Balance.objects.filter(user_id__in=totals, shards=0).update(
+                balance=Greatest(Case(*[
+                    When(user_id=user_id, then=F('balance') - total)
+                    for user_id, total in totals.items()
+                ]), 0),
+            )
+
+    def flush(self):
+        """
+        Apply a batch of journal entries to the database.
+        Return the number of entries applied.
+        """
+        with transaction.atomic():
+            cursor, _ = WriteBehindCursor.objects.select_for_update() \
+                .get_or_create(name='balance')
+            epoch = self.cache.get(EPOCH_KEY)
+            if epoch is None:
+                return 0
+
+            head = self.cache.get(SEQUENCE_KEY.format(epoch), 0)
+            if cursor.epoch != epoch or head < cursor.position:
+                # The cache lost the journal, which started again.
+                cursor.epoch = epoch
+                cursor.position = 0
+                self._gap = None
+
+            stop = min(head, cursor.position +
+                       settings.BALANCE_WRITE_BEHIND_BATCH_SIZE) + 1
+            entries = self._read(epoch, cursor.position + 1, stop)
+            if not entries:
+                return 0
+
+            self._apply([entry for entry in entries if entry is not None])
+            start = cursor.position + 1
+            cursor.position += len(entries)
+            cursor.save()
+
+        for user_id in {entry[0] for entry in entries if entry is not None}:
+            balance_cache.delete(user_id)
+        self.cache.delete_many([
+            ENTRY_KEY.format(epoch, seq)
+            for seq in range(start, start + len(entries))
+        ])
+
+        flushed = defaultdict(int)
+        for entry in entries:
+            if entry is not None and entry[2] is None:
+                flushed[entry[0]] += entry[1]
+        for user_id, total in flushed.items():
+            try:
+                if self.cache.decr(PENDING_KEY.format(user_id), total) < 0:
+                    self.cache.set(PENDING_KEY.format(user_id), 0,
+                                   timeout=PENDING_TTL)
+            except ValueError:
+                # The pending total expired.
+                pass
+
+        return len(entries)
+
+
+deduction_buffer = DeductionBuffer()
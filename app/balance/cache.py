@@ -0,0 +1,31 @@
+"""
+Cache of Balances read by the Balance and OpenAI APIs.
+"""
+from core.cache import TwoLevelCache
+from core.models import Balance
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+
+class BalanceCache(TwoLevelCache):
+    """
+    Cache of the total of each User's Balance, by User id. Cached Balances
+    only decide whether to try an API call, the Balance is taken with
+    conditional UPDATEs in the database.
+    """
+    prefix = 'balance'
+    ttl_setting = 'BALANCE_CACHE_TTL'
+    local_ttl_setting = 'BALANCE_CACHE_LOCAL_TTL'
+
+    def load(self, user_id):
+        """Return the total of a User's Balance from the database."""
+        return Balance.objects.total(user_id)
+
+
+balance_cache = BalanceCache()
+
+
+@receiver(post_save, sender=Balance)
+def invalidate_balance(sender, instance, **kwargs):
+    """Drop a Balance saved outside of the cache."""
+    balance_cache.delete(instance.user_id)
@@ -0,0 +1,35 @@
+"""
+System checks of the Balance app.
+"""
+from django.conf import settings
+from django.core.checks import (
+    Error,
+    register,
+)
+
+# Cache backends whose entries are only seen by the process writing them.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register()
+def check_write_behind_cache(app_configs, **kwargs):
+    """
+    Check the write-behind journal is kept in a cache shared with the
+    flusher, which runs in another process.
+    """
+    if not settings.BALANCE_WRITE_BEHIND:
+        return []
+
+    backend = settings.CACHES.get('balance', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            'BALANCE_WRITE_BEHIND requires a shared \'balance\' cache.',
+            hint='Set REDIS_URL, so that flush_balance_buffer can read '
+                 'the deductions of every worker.',
+            id='balance.E001',
+        )]
+
+    return []
@@ -0,0 +1,96 @@
+"""
+Usage ledger of the Balance API.
+"""
+import logging
+import threading
+import time
+
+from core.models import (
+    UsageRecord,
+    UsageRollup,
+)
+from django.conf import settings
+from django.db import (
+    close_old_connections,
+    transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UsageLedger:
+    """
+    Ledger of UsageRecords. Records are written to the database as they
+    are recorded, so none are lost with a process. A background thread
+    adds them to their UsageRollups every USAGE_LEDGER_FLUSH_INTERVAL
+    seconds, in batches of USAGE_LEDGER_BATCH_SIZE. Records that could
+    not be rolled up are kept for the next flush.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.flush_errors = 0
+
+    def record(self, **fields):
+        """Write a new UsageRecord, to be rolled up in the background."""
+        UsageRecord.objects.create(**fields)
+
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run,
+                    name='usage-ledger',
+                    daemon=True,
+                )
+                self._flusher.start()
+
+    def flush(self):
+        """
+        Add a batch of UsageRecords to their UsageRollups.
+        Return the number of records rolled up.
+        """
+        with transaction.atomic():
+            # Flushers of other processes skip the records being rolled up.
+            records = list(UsageRecord.objects.select_for_update(
+                skip_locked=True,
+            ).filter(rolled_up=False).order_by('pk')[
+                :settings.USAGE_LEDGER_BATCH_SIZE])
+            if not records:
+                return 0
+
+            UsageRollup.objects.add(records)
+            UsageRecord.objects.filter(
+                pk__in=[record.pk for record in records],
+            ).update(rolled_up=True)
+
+        return len(records)
+
+    def try_flush(self):
+        """
+        Flush a batch of UsageRecords, logging instead of raising.
+        Return the number of records rolled up.
+        """
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception('Failed to flush the usage ledger.')
+            with self._lock:
+                self.flush_errors += 1
+
+        return 0
+
+    def _run(self):
+        """Roll up UsageRecords in the background."""
+        while True:
+            time.sleep(max(settings.USAGE_LEDGER_FLUSH_INTERVAL, 0.1))
+            while self.try_flush() >= settings.USAGE_LEDGER_BATCH_SIZE:
+                pass
+            close_old_connections()
+
+    def pending(self):
+        """Return the number of UsageRecords not yet rolled up."""
+        return UsageRecord.objects.filter(rolled_up=False).count()
+
+
+usage_ledger = UsageLedger()
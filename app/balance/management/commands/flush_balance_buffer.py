@@ -0,0 +1,42 @@
+"""
+Django command to apply buffered Balance deductions to the database.
+"""
+import time
+
+from balance.buffer import deduction_buffer
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Django command to flush the write-behind journal of Balance deductions.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait when the journal is empty.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Flush the journal once and exit.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        while True:
+            applied = 0
+            while True:
+                flushed = deduction_buffer.flush()
+                if not flushed:
+                    break
+                applied += flushed
+
+            if applied:
+                self.stdout.write(f'Applied {applied} journal entries.')
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Balance journal flushed.'))
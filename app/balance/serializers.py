@@ -2,7 +2,11 @@
 Serializers for the Balance app
 """
 from rest_framework import serializers
-from core.models import Balance
+from core.models import (
+    Balance,
+    MAX_BALANCE,
+    UsageRollup,
+)
 
 
 class BalanceSerializer(serializers.ModelSerializer):
@@ -11,3 +15,66 @@ class BalanceSerializer(serializers.ModelSerializer):
         model = Balance
         fields = ('user', 'balance')
         read_only_fields = tuple('user')
+
+
+class BulkBalanceItemSerializer(serializers.Serializer):
+    """Serializer for items of BulkBalanceView requests"""
+    user = serializers.IntegerField()
+    delta = serializers.IntegerField(
+        required=False, min_value=-MAX_BALANCE, max_value=MAX_BALANCE)
+    balance = serializers.IntegerField(
+        required=False, min_value=0, max_value=MAX_BALANCE)
+
+    def validate(self, attrs):
+        """Validate that the item has either a delta or a balance."""
+        if ('delta' in attrs) == ('balance' in attrs):
+            raise serializers.ValidationError(
+                'Provide either delta or balance.')
+
+        return attrs
+
+
+class BulkBalanceRequestSerializer(serializers.Serializer):
+    """Serializer for BulkBalanceView JSON requests"""
+    items = BulkBalanceItemSerializer(many=True)
+
+
+class BulkBalanceFailureSerializer(serializers.Serializer):
+    """Serializer for failed items of BulkBalanceView responses"""
+    index = serializers.IntegerField()
+    errors = serializers.JSONField()
+
+
+class BulkBalanceResponseSerializer(serializers.Serializer):
+    """Serializer for BulkBalanceView responses"""
+    applied = serializers.IntegerField()
+    failures = BulkBalanceFailureSerializer(many=True)
+
+
+class UsageQuerySerializer(serializers.Serializer):
+    """Serializer for UsageView query parameters"""
+    period = serializers.ChoiceField(
+        choices=UsageRollup.Period.choices, default=UsageRollup.Period.DAY)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    group_by = serializers.MultipleChoiceField(
+        choices=['start', 'model', 'user'], required=False)
+    user = serializers.IntegerField(required=False)
+
+
+class UsageSerializer(serializers.Serializer):
+    """Serializer for usage totals of UsageView responses"""
+    start = serializers.DateTimeField(required=False)
+    model = serializers.CharField(required=False)
+    user = serializers.IntegerField(required=False)
+    requests = serializers.IntegerField()
+    prompt_tokens = serializers.IntegerField()
+    completion_tokens = serializers.IntegerField()
+    cost = serializers.IntegerField()
+
+
+class UsageResponseSerializer(serializers.Serializer):
+    """Serializer for UsageView responses"""
+    period = serializers.CharField()
+    results = UsageSerializer(many=True)
+    total = UsageSerializer()
@@ -1,11 +1,15 @@
 """
 Tests for the Balance API
 """
+from unittest.mock import patch
+
 from balance.serializers import (
     BalanceSerializer,
 )
+from balance.views import get_balance
 from core.models import (
-    Balance
+    Balance,
+    UsageRecord,
 )
 from django.test import TestCase
 from django.contrib.auth import get_user_model
@@ -150,6 +154,65 @@ class PrivilegedBalanceApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(balance.balance, payload['balance'])
 
+    def test_update_balance_recorded(self):
+        """Test updating a Balance records the change in the ledger."""
+        user2 = create_user(
+            email='test2@example.com',
+            password="testpass456",
+            name='Test Name 2',
+        )
+        url = detail_url(user2.id)
+        self.client.patch(url, {'balance': 125})
+        self.client.patch(url, {'balance': 100})
+
+        records = UsageRecord.objects.filter(user=user2).order_by('id')
+
+        self.assertEqual([record.cost for record in records], [-125, 25])
+        self.assertTrue(all(
+            record.kind == UsageRecord.Kind.ADJUSTMENT for record in records
+        ))
+
+    def test_sharded_balance(self):
+        """Test a sharded Balance is retrieved and updated as one total."""
+        user2 = create_user(
+            email='test2@example.com',
+            password="testpass456",
+            name='Test Name 2',
+        )
+        Balance.objects.filter(user=user2).update(balance=100)
+        Balance.objects.shard(user2, 3)
+        url = detail_url(user2.id)
+
+        res = self.client.get(url)
+        self.assertEqual(res.data['balance'], 100)
+
+        res = self.client.patch(url, {'balance': 90})
+        self.assertEqual(res.data['balance'], 90)
+        self.assertEqual(Balance.objects.total(user2), 90)
+        self.assertEqual(Balance.objects.get(user=user2).balance, 0)
+        record = UsageRecord.objects.get(user=user2)
+        self.assertEqual(record.cost, 10)
+
+    def test_balance_sharded_during_update(self):
+        """Test an update keeps shards added after the Balance was read."""
+        user2 = create_user(
+            email='test2@example.com',
+            password="testpass456",
+            name='Test Name 2',
+        )
+        Balance.objects.filter(user=user2).update(balance=100)
+
+        def get_and_shard(user):
+            balance = get_balance(user)
+            Balance.objects.shard(user, 3)
+            return balance
+
+        with patch('balance.views.get_balance', side_effect=get_and_shard):
+            self.client.patch(detail_url(user2.id), {'balance': 90})
+
+        self.assertEqual(Balance.objects.get(user=user2).shards, 3)
+        self.assertEqual(Balance.objects.total(user2), 90)
+
     def test_update_balance_user_returns_error(self):
         """Test changing the Balance user is not allowed."""
         user2 = create_user(
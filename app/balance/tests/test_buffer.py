@@ -0,0 +1,210 @@
+"""
+Tests for the write-behind buffer of Balance deductions.
+"""
+from datetime import timedelta
+from types import SimpleNamespace
+
+from balance.buffer import (
+    deduction_buffer,
+    DeductionBuffer,
+    SEQUENCE_KEY,
+)
+from balance.checks import check_write_behind_cache
+from balance.views import DeductBalanceMixin
+from core.models import (
+    Balance,
+    BalanceHold,
+    WriteBehindCursor,
+)
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import (
+    override_settings,
+    SimpleTestCase,
+    TestCase,
+)
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+def get_balance(user):
+    """
+    Helper function to return a User's Balance from the database.
+    """
+    return Balance.objects.get(user=user).balance
+
+
+@override_settings(BALANCE_WRITE_BEHIND=True)
+class DeductionBufferTests(TestCase):
+    """Test buffering Balance deductions."""
+
+    def setUp(self):
+        caches['balance'].clear()
+        self.buffer = DeductionBuffer()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+
+    def test_deduct_flushed(self):
+        """Test deductions are applied to the database by a flush."""
+        self.buffer.deduct(self.user.id, 10)
+        self.buffer.deduct(self.user.id, 5)
+
+        self.assertEqual(get_balance(self.user), 100)
+        self.assertEqual(self.buffer.pending(self.user.id), 15)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(get_balance(self.user), 85)
+        self.assertEqual(self.buffer.pending(self.user.id), 0)
+        self.assertEqual(WriteBehindCursor.objects.get().position, 2)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(get_balance(self.user), 85)
+
+    def test_settle_flushed(self):
+        """Test the unused part of a settled hold is given back."""
+        hold = BalanceHold.objects.reserve(self.user, 50)
+        self.buffer.settle(hold, 20)
+
+        self.assertEqual(get_balance(self.user), 50)
+        self.buffer.flush()
+        self.assertEqual(get_balance(self.user), 80)
+        self.assertFalse(BalanceHold.objects.exists())
+
+    def test_settle_released_hold(self):
+        """Test a hold released as expired is charged its full cost."""
+        hold = BalanceHold.objects.reserve(self.user, 50)
+        self.buffer.settle(hold, 20)
+        BalanceHold.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+        BalanceHold.objects.release_expired()
+
+        self.buffer.flush()
+
+        self.assertEqual(get_balance(self.user), 80)
+
+    def test_missing_entry_skipped(self):
+        """Test an entry that is never written holds the flush back until
+        it times out."""
+        key = SEQUENCE_KEY.format(self.buffer.epoch())
+        caches['balance'].add(key, 0, timeout=None)
+        caches['balance'].incr(key)
+        self.buffer.deduct(self.user.id, 10)
+
+        self.assertEqual(self.buffer.flush(), 0)
+        with override_settings(BALANCE_WRITE_BEHIND_GAP_TIMEOUT=0):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(get_balance(self.user), 90)
+
+    def test_cache_lost(self):
+        """Test entries journaled after the cache was lost are applied."""
+        self.buffer.deduct(self.user.id, 10)
+        self.buffer.deduct(self.user.id, 5)
+        self.buffer.flush()
+
+        caches['balance'].clear()
+        self.buffer.deduct(self.user.id, 30)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(get_balance(self.user), 55)
+        self.assertEqual(self.buffer.pending(self.user.id), 0)
+
+    def test_sequence_lost(self):
+        """Test entries are applied after the sequence alone was lost."""
+        self.buffer.deduct(self.user.id, 10)
+        self.buffer.deduct(self.user.id, 5)
+        self.buffer.flush()
+
+        caches['balance'].delete(SEQUENCE_KEY.format(self.buffer.epoch()))
+        self.buffer.deduct(self.user.id, 30)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(get_balance(self.user), 55)
+
+
+@override_settings(BALANCE_WRITE_BEHIND=True,
+                   BALANCE_WRITE_BEHIND_MAX_PENDING=20)
+class DeductBalanceMixinTests(TestCase):
+    """Test deducting Balances in write-behind mode."""
+
+    def setUp(self):
+        caches['balance'].clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+        self.view = DeductBalanceMixin()
+        self.view.request = SimpleNamespace(user=self.user)
+
+    def test_pending_checked(self):
+        """Test balance checks include the unflushed deductions."""
+        self.assertIsNone(self.view.deduct_balance(15))
+
+        self.assertEqual(get_balance(self.user), 100)
+        self.assertEqual(self.view.available_balance(), 85)
+        self.assertTrue(self.view.check_balance(85))
+        self.assertFalse(self.view.check_balance(86))
+
+    def test_pending_bounded(self):
+        """Test deductions over the pending bound are written directly."""
+        self.view.deduct_balance(15)
+        self.view.deduct_balance(10)
+
+        self.assertEqual(get_balance(self.user), 90)
+        self.assertEqual(deduction_buffer.pending(self.user.id), 15)
+
+    def test_pending_listed(self):
+        """Test the User's Balance is listed less unflushed deductions."""
+        self.view.deduct_balance(15)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        res = client.get(reverse('balance:balance-list'))
+
+        self.assertEqual(res.data['balance'], 85)
+
+
+class WriteBehindCheckTests(SimpleTestCase):
+    """Test the system check of the write-behind journal's cache."""
+
+    @override_settings(BALANCE_WRITE_BEHIND=True, CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'balance': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    })
+    def test_local_cache_refused(self):
+        """Test write-behind is refused with a per-process cache."""
+        errors = check_write_behind_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['balance.E001'])
+
+    @override_settings(BALANCE_WRITE_BEHIND=True, CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+        },
+        'balance': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/1',
+        },
+    })
+    def test_shared_cache_accepted(self):
+        """Test write-behind is accepted with a shared cache."""
+        self.assertEqual(check_write_behind_cache(None), [])
@@ -0,0 +1,155 @@
+"""
+Tests for the bulk Balance API.
+"""
+import json
+
+from core.models import (
+    Balance,
+    MAX_BALANCE,
+    UsageRecord,
+)
+from django.contrib.auth import get_user_model
+from django.test import (
+    override_settings,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+BULK_URL = reverse('balance:balance-bulk')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+def get_balance(user):
+    """
+    Helper function to return a User's Balance from the database.
+    """
+    return Balance.objects.total(user)
+
+
+class BulkBalanceApiTests(TestCase):
+    """Test bulk Balance API requests."""
+
+    def setUp(self):
+        """Create client and Users for testing."""
+        self.admin = create_user(
+            email='admin@example.com',
+            password='testpass123',
+            name='Test Admin',
+            is_superuser=True,
+        )
+        self.users = [
+            create_user(
+                email=f'test{index}@example.com',
+                password='testpass123',
+                name=f'Test Name {index}',
+            )
+            for index in range(3)
+        ]
+        Balance.objects.filter(user__in=self.users).update(balance=10)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_not_superuser(self):
+        """Test the bulk API is for superusers only."""
+        self.client.force_authenticate(user=self.users[0])
+        payload = {'items': [{'user': self.users[0].id, 'delta': 5}]}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(get_balance(self.users[0]), 10)
+
+    @override_settings(BALANCE_BULK_BATCH_SIZE=2)
+    def test_bulk_update(self):
+        """Test deltas and balances are applied and failures reported."""
+        payload = {'items': [
+            {'user': self.users[0].id, 'delta': 5},
+            {'user': self.users[1].id, 'balance': 100},
+            {'user': 0, 'delta': 5},
+            {'user': self.users[2].id, 'delta': -20},
+            {'user': self.users[2].id},
+            {'user': self.users[0].id, 'delta': 1},
+        ]}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['applied'], 3)
+        self.assertEqual(
+            [failure['index'] for failure in res.data['failures']],
+            [2, 3, 4],
+        )
+        self.assertEqual(
+            [get_balance(user) for user in self.users], [16, 100, 10])
+        records = UsageRecord.objects.filter(
+            kind=UsageRecord.Kind.ADJUSTMENT).order_by('id')
+        self.assertEqual([record.cost for record in records], [-5, -90, -1])
+
+    def test_bulk_update_sharded(self):
+        """Test sharded Balances are set as one total."""
+        Balance.objects.shard(self.users[0], 2)
+        payload = {'items': [
+            {'user': self.users[0].id, 'delta': 5},
+            {'user': self.users[1].id, 'delta': 5},
+        ]}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.data['applied'], 2)
+        self.assertEqual(get_balance(self.users[0]), 15)
+        self.assertEqual(Balance.objects.get(user=self.users[0]).balance, 0)
+        self.assertEqual(get_balance(self.users[1]), 15)
+
+    def test_bulk_update_streamed(self):
+        """Test items streamed as newline-delimited JSON."""
+        lines = [
+            json.dumps({'user': user.id, 'delta': 1000})
+            for user in self.users
+        ] + ['not json', '']
+
+        res = self.client.post(
+            BULK_URL,
+            '\n'.join(lines),
+            content_type='application/x-ndjson',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['applied'], 3)
+        self.assertEqual(
+            [failure['index'] for failure in res.data['failures']], [3])
+        self.assertEqual(
+            [get_balance(user) for user in self.users], [1010] * 3)
+
+    def test_bulk_update_overflow(self):
+        """Test Balances above the largest Balance are refused."""
+        Balance.objects.filter(user=self.users[0]).update(
+            balance=MAX_BALANCE - 5)
+        payload = {'items': [
+            {'user': self.users[0].id, 'delta': 10},
+            {'user': self.users[1].id, 'balance': MAX_BALANCE + 1},
+            {'user': self.users[2].id, 'delta': MAX_BALANCE + 1},
+        ]}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['applied'], 0)
+        self.assertEqual(
+            [failure['index'] for failure in res.data['failures']],
+            [0, 1, 2],
+        )
+        self.assertEqual(get_balance(self.users[0]), MAX_BALANCE - 5)
+
+    def test_bulk_update_invalid(self):
+        """Test a JSON request needs a list of items."""
+        res = self.client.post(BULK_URL, {'items': 5}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,138 @@
+"""
+Tests for the Balance cache.
+"""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from balance.cache import (
+    balance_cache,
+    BalanceCache,
+)
+from balance.views import DeductBalanceMixin
+from core.models import Balance
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import (
+    override_settings,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+BALANCE_URL = reverse('balance:balance-list')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+class BalanceCacheTests(TestCase):
+    """Test caching Balances."""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+
+    def test_get_cached(self):
+        """Test a Balance is read from the database once."""
+        cache = BalanceCache()
+
+        self.assertEqual(cache.get(self.user.id), 100)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(self.user.id), 100)
+            with override_settings(BALANCE_CACHE_LOCAL_TTL=0):
+                cache.delete(self.user.id)
+                cache.set(self.user.id, 90)
+                self.assertEqual(cache.get(self.user.id), 90)
+
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['local_hits'], 1)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+    @override_settings(BALANCE_CACHE_LOCAL_TTL=0)
+    def test_load_racing_write(self):
+        """Test a Balance loaded before a write is not served after it."""
+        cache = BalanceCache()
+
+        def load_then_write(user_id):
+            balance = Balance.objects.total(user_id)
+            Balance.objects.filter(user_id=user_id).update(balance=50)
+            cache.delete(user_id)
+            return balance
+
+        with patch.object(cache, 'load', side_effect=load_then_write):
+            self.assertEqual(cache.get(self.user.id), 100)
+
+        self.assertEqual(cache.get(self.user.id), 50)
+
+    @override_settings(BALANCE_CACHE_LOCAL_TTL=0)
+    def test_load_before_commit(self):
+        """Test a Balance loaded before a write commits is dropped then."""
+        cache = BalanceCache()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Balance.objects.filter(user=self.user).update(balance=50)
+                cache.delete(self.user.id)
+                # Another process reads the Balance before the commit.
+                with patch.object(cache, 'load', return_value=100):
+                    cache.get(self.user.id)
+
+        self.assertEqual(cache.get(self.user.id), 50)
+
+    def test_save_invalidates(self):
+        """Test saving a Balance drops it from the cache."""
+        balance_cache.get(self.user.id)
+
+        self.user.balance.balance = 50
+        self.user.balance.save()
+
+        self.assertEqual(balance_cache.get(self.user.id), 50)
+
+    def test_deduct_writes_through(self):
+        """Test a deduction writes the new Balance to the cache."""
+        view = DeductBalanceMixin()
+        view.request = SimpleNamespace(user=self.user)
+
+        view.deduct_balance(30)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(view.available_balance(), 70)
+
+    def test_poll_balance(self):
+        """Test polling the Balance does not read the database."""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.get(BALANCE_URL)
+
+        with self.assertNumQueries(0):
+            res = client.get(BALANCE_URL)
+
+        self.assertEqual(res.data['balance'], 100)
+
+    def test_update_writes_through(self):
+        """Test updating a Balance as superuser writes it to the cache."""
+        admin = create_user(
+            email='admin@example.com',
+            password='testpass123',
+            name='Test Admin',
+            is_superuser=True,
+        )
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        url = reverse('balance:balance-detail', args=[self.user.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch(url, {'balance': 125})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(balance_cache.get(self.user.id), 125)
+        self.assertEqual(Balance.objects.total(self.user), 125)
@@ -0,0 +1,121 @@
+"""
+Tests for the usage ledger.
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from balance.ledger import UsageLedger
+from balance.views import DeductBalanceMixin
+from core.models import (
+    Balance,
+    BalanceHold,
+    UsageRecord,
+    UsageRollup,
+)
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import (
+    override_settings,
+    TestCase,
+)
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+class UsageLedgerTests(TestCase):
+    """Tests for the usage ledger."""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+
+    def test_records_written_when_recorded(self):
+        """Test records are written at once and rolled up later."""
+        ledger = UsageLedger()
+
+        ledger.record(user_id=self.user.id, model='gpt-4', cost=10)
+
+        self.assertEqual(UsageRecord.objects.count(), 1)
+        self.assertEqual(ledger.pending(), 1)
+        self.assertFalse(UsageRollup.objects.exists())
+
+    @override_settings(USAGE_LEDGER_BATCH_SIZE=2)
+    def test_records_rolled_up_in_batches(self):
+        """Test records are added to their rollups in batches."""
+        ledger = UsageLedger()
+        for cost in [10, 20, 30]:
+            ledger.record(user_id=self.user.id, model='gpt-4', cost=cost)
+
+        self.assertEqual(ledger.flush(), 2)
+        self.assertEqual(ledger.pending(), 1)
+        self.assertEqual(ledger.flush(), 1)
+        self.assertEqual(ledger.flush(), 0)
+
+        rollup = UsageRollup.objects.get(period=UsageRollup.Period.DAY)
+        self.assertEqual(rollup.requests, 3)
+        self.assertEqual(rollup.cost, 60)
+
+    def test_failed_flush_keeps_records(self):
+        """Test records that failed to be rolled up are kept and logged."""
+        ledger = UsageLedger()
+        ledger.record(user_id=self.user.id, model='gpt-4', cost=10)
+
+        with patch('core.models.UsageRollupManager.add',
+                   side_effect=RuntimeError):
+            with self.assertLogs('balance.ledger', 'ERROR'):
+                self.assertEqual(ledger.try_flush(), 0)
+        self.assertEqual(ledger.pending(), 1)
+        self.assertEqual(ledger.flush_errors, 1)
+
+        self.assertEqual(ledger.flush(), 1)
+        self.assertEqual(ledger.pending(), 0)
+        self.assertTrue(UsageRollup.objects.exists())
+
+    def test_usage_recorded_with_settle(self):
+        """Test usage is recorded in the transaction settling its hold."""
+        Balance.objects.filter(user=self.user).update(balance=100)
+        hold = BalanceHold.objects.reserve(self.user, 50)
+        mixin = DeductBalanceMixin()
+
+        with patch('core.models.BalanceHoldManager.settle',
+                   side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                mixin.settle_balance(hold, 30, model='gpt-4')
+        self.assertFalse(UsageRecord.objects.exists())
+
+        mixin.settle_balance(hold, 30, model='gpt-4')
+        record = UsageRecord.objects.get()
+        self.assertEqual(record.cost, 30)
+        self.assertEqual(record.model, 'gpt-4')
+
+    def test_audit_ledger(self):
+        """Test the audit proves Balances from the ledger and holds."""
+        UsageRecord.objects.create(
+            user=self.user, kind=UsageRecord.Kind.ADJUSTMENT, cost=-100)
+        Balance.objects.filter(user=self.user).update(balance=100)
+        hold = BalanceHold.objects.reserve(self.user, 50)
+        BalanceHold.objects.settle(hold, 30)
+        UsageRecord.objects.create(user=self.user, model='gpt-4', cost=30)
+        BalanceHold.objects.reserve(self.user, 20)
+        out = StringIO()
+
+        call_command('audit_ledger', stdout=out)
+
+        self.assertIn('All Balances match the ledger.', out.getvalue())
+
+    def test_audit_ledger_mismatch(self):
+        """Test the audit reports Balances that do not match the ledger."""
+        Balance.objects.filter(user=self.user).update(balance=100)
+        out = StringIO()
+
+        call_command('audit_ledger', stdout=out)
+
+        self.assertIn(f'User {self.user.id}: balance 100, ledger 0',
+                      out.getvalue())
@@ -0,0 +1,127 @@
+"""
+Tests for usage rollups and the usage API.
+"""
+from datetime import (
+    datetime,
+    timezone,
+)
+
+from balance.ledger import UsageLedger
+from core.models import UsageRollup
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+USAGE_URL = reverse('balance:balance-usage')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+def at(day, hour, minute=0):
+    """
+    Helper function to return a time of October 2026 in UTC.
+    """
+    return datetime(2026, 10, day, hour, minute, tzinfo=timezone.utc)
+
+
+class UsageApiTests(TestCase):
+    """Test usage rollups and usage API requests."""
+
+    def setUp(self):
+        """Create client and usage for testing."""
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        ledger = UsageLedger()
+        for model, created_at, cost in [
+            ('gpt-4', at(1, 10, 5), 10),
+            ('gpt-4', at(1, 10, 50), 20),
+            ('gpt-3.5-turbo', at(1, 23), 5),
+        ]:
+            ledger.record(
+                user_id=self.user.id,
+                model=model,
+                prompt_tokens=cost - 1,
+                completion_tokens=1,
+                cost=cost,
+                created_at=created_at,
+            )
+        ledger.flush()
+        ledger.record(user_id=self.user.id, model='gpt-4',
+                      cost=40, created_at=at(2, 9))
+        ledger.flush()
+
+    def test_rollups_added(self):
+        """Test usage is summed into hourly and daily rollups."""
+        hour = UsageRollup.objects.get(
+            period=UsageRollup.Period.HOUR, start=at(1, 10))
+        self.assertEqual(hour.requests, 2)
+        self.assertEqual(hour.cost, 30)
+        self.assertEqual(hour.prompt_tokens, 28)
+
+        days = UsageRollup.objects.filter(
+            period=UsageRollup.Period.DAY, model='gpt-4').order_by('start')
+        self.assertEqual([day.cost for day in days], [30, 40])
+
+    def test_usage_by_day(self):
+        """Test retrieving the usage of each day."""
+        res = self.client.get(USAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['start'], row['cost']) for row in res.data['results']],
+            [(at(1, 0), 35), (at(2, 0), 40)],
+        )
+        self.assertEqual(res.data['total']['cost'], 75)
+        self.assertEqual(res.data['total']['requests'], 4)
+
+    def test_usage_by_model_in_range(self):
+        """Test retrieving the usage of each model over a range of hours."""
+        params = {
+            'period': 'hour',
+            'group_by': 'model',
+            'start': at(1, 10).isoformat(),
+            'end': at(2, 0).isoformat(),
+        }
+
+        res = self.client.get(USAGE_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['model'], row['cost']) for row in res.data['results']],
+            [('gpt-3.5-turbo', 5), ('gpt-4', 30)],
+        )
+
+    def test_other_user_usage(self):
+        """Test only superusers can retrieve the usage of other Users."""
+        user2 = create_user(
+            email='test2@example.com',
+            password='testpass456',
+            name='Test Name 2',
+        )
+        self.client.force_authenticate(user=user2)
+
+        res = self.client.get(USAGE_URL, {'user': self.user.id})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = self.client.get(USAGE_URL)
+        self.assertEqual(res.data['total']['cost'], 0)
+
+        user2.is_superuser = True
+        res = self.client.get(USAGE_URL, {'group_by': 'user'})
+        self.assertEqual(
+            [(row['user'], row['cost']) for row in res.data['results']],
+            [(self.user.id, 75)],
+        )
@@ -15,5 +15,7 @@ router.register('', views.ManageBalanceView, basename='balance')
 app_name = 'balance'
 
 urlpatterns = [
+    path('bulk/', views.BulkBalanceView.as_view(), name='balance-bulk'),
+    path('usage/', views.UsageView.as_view(), name='balance-usage'),
     path('', include(router.urls)),
 ]
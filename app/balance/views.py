@@ -1,30 +1,81 @@
 """
 Views for the Balance API.
 """
-from balance.serializers import BalanceSerializer
+import json
+
+from balance.buffer import deduction_buffer
+from balance.cache import balance_cache
+from balance.ledger import usage_ledger
+from balance.serializers import (
+    BalanceSerializer,
+    BulkBalanceItemSerializer,
+    BulkBalanceRequestSerializer,
+    BulkBalanceResponseSerializer,
+    UsageQuerySerializer,
+    UsageResponseSerializer,
+)
 from core.models import (
-    User
+    Balance,
+    BalanceHold,
+    UsageRecord,
+    UsageRollup,
+    User,
+)
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
 )
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
 from django.shortcuts import get_object_or_404
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiResponse,
+)
 from rest_framework import (
     mixins,
     permissions,
     status,
     viewsets,
 )
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import (
+    PermissionDenied,
+    ValidationError,
+)
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+def get_balance(user):
+    """Return a User's Balance with its shards summed."""
+    balance = Balance.objects.with_totals().get(user=user)
+    balance.balance = balance.total
+
+    return balance
+
+
+def get_available_balance(user_id):
+    """Return a User's cached Balance less its unflushed deductions."""
+    balance = balance_cache.get(user_id)
+
+    if settings.BALANCE_WRITE_BEHIND:
+        balance -= deduction_buffer.pending(user_id)
+
+    return balance
 
 
 class DeductBalanceMixin:
     """Mixin that deducts the cost of the API call from the User's Balance."""
 
+    def available_balance(self):
+        """Return the User's Balance less its unflushed deductions."""
+        return get_available_balance(self.request.user.id)
+
     def check_balance(self, cost: int):
         """Check if the User has sufficient Balance for a given cost."""
-        user = self.request.user
-
-        if user.balance.balance < cost:
+        if self.available_balance() < cost:
             return False
 
         return True
@@ -33,14 +84,58 @@ class DeductBalanceMixin:
         """Deduct the cost of the API call from the User's Balance."""
         user = self.request.user
 
-        if user.balance.balance < cost:
+        if settings.BALANCE_WRITE_BEHIND and \
+                deduction_buffer.pending(user.id) + cost <= \
+                settings.BALANCE_WRITE_BEHIND_MAX_PENDING:
+            if not self.check_balance(cost):
+                return Response({
+                    'message': 'Insufficient balance.',
+                }, status=status.HTTP_402_PAYMENT_REQUIRED
+                )
+
+            deduction_buffer.deduct(user.id, cost)
+            return
+
+        balance = Balance.objects.deduct(user, cost)
+
+        if balance is None:
             return Response({
                 'message': 'Insufficient balance.',
             }, status=status.HTTP_402_PAYMENT_REQUIRED
             )
 
-        user.balance.balance -= cost
-        user.balance.save()
+        balance_cache.set(user.id, balance)
+
+    def reserve_balance(self, amount: int):
+        """
+        Hold an amount of the User's Balance for an API call in progress.
+        Return the hold, or None if the Balance is insufficient.
+        """
+        hold = BalanceHold.objects.reserve(self.request.user, amount)
+        if hold is not None:
+            balance_cache.delete(self.request.user.id)
+
+        return hold
+
+    def settle_balance(self, hold, cost: int, **usage):
+        """
+        Settle a hold for the actual cost of the API call, recording its
+        usage, if given, in the usage ledger in the same transaction.
+        """
+        with transaction.atomic():
+            if usage:
+                usage_ledger.record(user_id=hold.user_id, cost=cost, **usage)
+            if settings.BALANCE_WRITE_BEHIND:
+                deduction_buffer.settle(hold, cost)
+            else:
+                BalanceHold.objects.settle(hold, cost)
+
+        if not settings.BALANCE_WRITE_BEHIND:
+            balance_cache.delete(hold.user_id)
+
+    def record_usage(self, **fields):
+        """Record the usage of the API call in the usage ledger."""
+        usage_ledger.record(user_id=self.request.user.id, **fields)
 
 
 class BalanceView(
@@ -49,13 +144,18 @@ class BalanceView(
 ):
     """Views for viewing the current User's Balance."""
     serializer_class = BalanceSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
         """Retrieve the current User's Balance."""
-        user = request.user
-        balance = user.balance
+        balance = Balance(
+            user=request.user,
+            balance=get_available_balance(request.user.id),
+        )
         serializer = self.get_serializer(balance)
         return Response(serializer.data)
 
@@ -74,7 +174,10 @@ class ManageBalanceView(
 ):
     """Views for managing a specific User's Balance. (Superuser only)"""
     serializer_class = BalanceSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated, IsSuperUser]
     queryset = User.objects.all()
 
@@ -82,7 +185,28 @@ class ManageBalanceView(
         """Retrieve the Balance for the specified User."""
         user_id = self.kwargs['pk']
         user = get_object_or_404(User, id=user_id)
-        return user.balance
+        return get_balance(user)
+
+    def perform_update(self, serializer):
+        """Update the Balance, recording the change in the usage ledger."""
+        with transaction.atomic():
+            instance = serializer.instance
+            previous = Balance.objects.lock(instance.user)
+            instance.balance = serializer.validated_data.get(
+                'balance', previous)
+            # The shards may have changed since the Balance was read.
+            instance.save(update_fields=['balance'])
+            Balance.objects.spread(instance.user)
+
+            transaction.on_commit(lambda: balance_cache.set(
+                instance.user_id, instance.balance))
+
+            if instance.balance != previous:
+                UsageRecord.objects.create(
+                    user=instance.user,
+                    kind=UsageRecord.Kind.ADJUSTMENT,
+                    cost=previous - instance.balance,
+                )
 
     def retrieve(self, request, *args, **kwargs):
         """Retrieve and return the Balance for the specified User."""
@@ -109,3 +233,139 @@ class ManageBalanceView(
         self.perform_update(serializer)
 
         return Response(serializer.data)
+
+
+class BulkBalanceView(APIView):
+    """
+    Top up or set the Balances of many Users at once. (Superuser only)
+    Items are sent as {"items": [...]}, or streamed one per line with the
+    application/x-ndjson content type for very large batches.
+    """
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated, IsSuperUser]
+    serializer_class = BulkBalanceItemSerializer
+
+    def get_items(self, request):
+        """Yield the items of the request as they are read."""
+        if request.content_type.startswith('application/x-ndjson'):
+            for line in request.stream or []:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        else:
+            items = request.data.get('items') \
+                if isinstance(request.data, dict) else None
+            if not isinstance(items, list):
+                raise ValidationError({'items': 'Expected a list of items.'})
+            yield from items
+
+    def apply(self, batch, failures):
+        """Apply a batch of valid items. Return the number applied."""
+        errors = Balance.objects.adjust_many([
+            (item['user'], item.get('delta'), item.get('balance'))
+            for _, item in batch
+        ])
+        balance_cache.delete_many({item['user'] for _, item in batch})
+
+        for (index, _), error in zip(batch, errors):
+            if error:
+                failures.append({'index': index, 'errors': [error]})
+
+        return errors.count(None)
+
+    @extend_schema(
+        request=BulkBalanceRequestSerializer,
+        responses={
+            200: OpenApiResponse(response=BulkBalanceResponseSerializer)
+        },
+    )
+    def post(self, request):
+        """
+        Add a delta to, or set, each User's Balance, in batches of
+        BALANCE_BULK_BATCH_SIZE items. Invalid items are reported by index.
+        """
+        applied = 0
+        failures = []
+        batch = []
+        for index, item in enumerate(self.get_items(request)):
+            serializer = self.serializer_class(data=item)
+            if not serializer.is_valid():
+                failures.append({'index': index, 'errors': serializer.errors})
+                continue
+
+            batch.append((index, serializer.validated_data))
+            if len(batch) >= settings.BALANCE_BULK_BATCH_SIZE:
+                applied += self.apply(batch, failures)
+                batch = []
+
+        if batch:
+            applied += self.apply(batch, failures)
+
+        return Response({
+            'applied': applied,
+            'failures': sorted(failures, key=lambda f: f['index']),
+        }, status=status.HTTP_200_OK)
+
+
+class UsageView(APIView):
+    """
+    Usage summed from the hourly or daily rollups, over a range of
+    periods and broken down by start, model or User.
+    """
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    serializer_class = UsageQuerySerializer
+
+    @extend_schema(
+        parameters=[UsageQuerySerializer],
+        responses={
+            200: OpenApiResponse(response=UsageResponseSerializer)
+        },
+    )
+    def get(self, request):
+        """
+        Retrieve the usage of the current User, or of any or all Users for
+        superusers, in the periods starting from start until end.
+        """
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        rollups = UsageRollup.objects.filter(period=params['period'])
+        if not request.user.is_superuser:
+            if params.get('user', request.user.id) != request.user.id:
+                raise PermissionDenied()
+            rollups = rollups.filter(user=request.user)
+        elif 'user' in params:
+            rollups = rollups.filter(user=params['user'])
+        if 'start' in params:
+            rollups = rollups.filter(start__gte=params['start'])
+        if 'end' in params:
+            rollups = rollups.filter(start__lt=params['end'])
+
+        sums = {
+            field: Sum(field) for field in
+            ('requests', 'prompt_tokens', 'completion_tokens', 'cost')
+        }
+        group_by = [
+            field for field in ('start', 'model', 'user')
+            if field in (params.get('group_by') or ['start'])
+        ]
+        results = rollups.values(*group_by).annotate(**sums).order_by(
+            *group_by)
+        total = rollups.aggregate(**sums)
+
+        return Response({
+            'period': params['period'],
+            'results': list(results),
+            'total': {field: value or 0 for field, value in total.items()},
+        }, status=status.HTTP_200_OK)
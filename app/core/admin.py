@@ -4,6 +4,7 @@ Django admin customization.
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from core import models
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 
 
@@ -39,13 +40,13 @@ class UserAdmin(BaseUserAdmin):
 class BalanceAdmin(admin.ModelAdmin):
     """Define the admin pages for Balances."""
     ordering = ['id']
-    list_display = ['user', 'balance']
+    list_display = ['user', 'balance', 'shards']
 
     # Editing
     fieldsets = [
-        (None, {'fields': ('user', 'balance')}),
+        (None, {'fields': ('user', 'balance', 'shards')}),
     ]
-    readonly_fields = ['user']
+    readonly_fields = ['user', 'shards']
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -53,7 +54,55 @@ class BalanceAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
+    def get_object(self, request, object_id, from_field=None):
+        """Retrieve the Balance with its shards summed."""
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            obj.balance = models.Balance.objects.total(obj.user)
+
+        return obj
+
+    def save_model(self, request, obj, form, change):
+        """Save the Balance, recording the change in the usage ledger."""
+        with transaction.atomic():
+            previous = models.Balance.objects.lock(obj.user)
+            # The shards may have changed since the Balance was read.
+            obj.save(update_fields=['balance'])
+            models.Balance.objects.spread(obj.user)
+
+            if obj.balance != previous:
+                models.UsageRecord.objects.create(
+                    user=obj.user,
+                    kind=models.UsageRecord.Kind.ADJUSTMENT,
+                    cost=previous - obj.balance,
+                )
+
+
+class ConversationAdmin(admin.ModelAdmin):
+    """Define the admin pages for Conversations."""
+    ordering = ['-id']
+    list_display = ['id', 'user', 'model', 'num_tokens', 'updated_at']
+    readonly_fields = ['user', 'num_tokens', 'created_at', 'updated_at']
+
+
+class UsageRecordAdmin(admin.ModelAdmin):
+    """Define the admin pages for UsageRecords."""
+    ordering = ['-id']
+    list_display = ['created_at', 'user', 'kind', 'model', 'cost']
+    list_filter = ['kind']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 # Register models here.
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Balance, BalanceAdmin)
+admin.site.register(models.Conversation, ConversationAdmin)
+admin.site.register(models.UsageRecord, UsageRecordAdmin)
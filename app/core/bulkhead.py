@@ -0,0 +1,235 @@
+"""
+Concurrency limits with fair queuing.
+"""
+import asyncio
+import threading
+import time
+from collections import (
+    Counter,
+    OrderedDict,
+    deque,
+)
+from contextlib import (
+    asynccontextmanager,
+    contextmanager,
+)
+
+# Number of recent queue waits the percentiles are computed from.
+RECENT_WAITS = 1024
+
+
+class QueueFull(Exception):
+    """Raised when a key has as many calls queued as it may."""
+
+
+class _Waiter:
+    """A call waiting for a slot in a thread."""
+
+    def __init__(self):
+        self.admitted = False
+        self._event = threading.Event()
+
+    def admit(self):
+        self.admitted = True
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    """A call waiting for a slot in an event loop."""
+
+    def __init__(self):
+        self.admitted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def admit(self):
+        # Slots may be released from other threads.
+        self.admitted = True
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class Bulkhead:
+    """
+    Caps the calls in flight, in total and per key such as a User. Calls
+    over either cap wait in a queue per key, and the queues are served in
+    turn, so that one key with many calls cannot delay the others by more
+    than one call. Calls give up after waiting for their timeout, and are
+    refused at once when max_queued_per_key calls of their key are queued.
+    Threads and event loops share the slots.
+    """
+
+    def __init__(self, max_concurrent, max_per_key, max_queued_per_key=None):
+        self.max_concurrent = max_concurrent
+        self.max_per_key = max_per_key
+        self.max_queued_per_key = max_queued_per_key
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_key = Counter()
+        # Key -> waiters, in the order the keys are served.
+        self._queues = OrderedDict()
+        self._waits = deque(maxlen=RECENT_WAITS)
+        self.admitted = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _admit(self, key):
+        self._active += 1
+        self._active_by_key[key] += 1
+        self.admitted += 1
+
+    def _dispatch(self):
+        """Admit waiters in turn while there are free slots."""
+        while self._active < self.max_concurrent:
+            for key, queue in self._queues.items():
+                if self._active_by_key[key] < self.max_per_key:
+                    break
+            else:
+                return
+
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._admit(key)
+            waiter.admit()
+
+    def _join(self, key, waiter, wait_over_share=True):
+        """
+        Admit key if a slot is free, or queue its waiter.
+        Return whether it was admitted.
+        """
+        with self._lock:
+            if key not in self._queues and \
+                    self._active < self.max_concurrent and \
+                    self._active_by_key[key] < self.max_per_key:
+                self._admit(key)
+                self._waits.append(0)
+                return True
+
+            queued = len(self._queues.get(key, ()))
+            if not wait_over_share and \
+                    self._active_by_key[key] + queued >= self.max_per_key or \
+                    self.max_queued_per_key is not None and \
+                    queued >= self.max_queued_per_key:
+                self.rejected += 1
+                raise QueueFull(f'Too many calls queued for {key!r}.')
+
+            self._queues.setdefault(key, deque()).append(waiter)
+            self.queued += 1
+            return False
+
+    def _leave(self, key, waiter, started):
+        """
+        Drop a waiter that is done waiting from its queue, unless it was
+        admitted. Return whether it was admitted.
+        """
+        with self._lock:
+            # A slot may have been given just as the wait ended.
+            if waiter.admitted:
+                self._waits.append(time.monotonic() - started)
+                return True
+
+            queue = self._queues[key]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[key]
+            self.timeouts += 1
+            return False
+
+    def acquire(self, key, timeout=None, wait_over_share=True):
+        """
+        Take a slot for key, waiting in its queue if none is free.
+        Raise QueueFull if its queue is full, or TimeoutError if no slot
+        is free within timeout seconds. Unless wait_over_share, a call of
+        a key whose calls in flight and queued already reach max_per_key
+        raises QueueFull at once, so that a key never holds more than
+        max_per_key waiting threads.
+        """
+        waiter = _Waiter()
+        if self._join(key, waiter, wait_over_share):
+            return
+
+        started = time.monotonic()
+        waiter.wait(timeout)
+        if not self._leave(key, waiter, started):
+            raise TimeoutError(f'No free slot for {key!r}.')
+
+    async def aacquire(self, key, timeout=None):
+        """Take a slot for key like acquire(), without blocking the loop."""
+        waiter = _AsyncWaiter()
+        if self._join(key, waiter):
+            return
+
+        started = time.monotonic()
+        try:
+            await waiter.wait(timeout)
+        except asyncio.CancelledError:
+            if self._leave(key, waiter, started):
+                self.release(key)
+            raise
+
+        if not self._leave(key, waiter, started):
+            raise TimeoutError(f'No free slot for {key!r}.')
+
+    def release(self, key):
+        """Give back a slot of key."""
+        with self._lock:
+            self._active -= 1
+            self._active_by_key[key] -= 1
+            if not self._active_by_key[key]:
+                del self._active_by_key[key]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, key, timeout=None):
+        """Hold a slot of key for the duration of the block."""
+        self.acquire(key, timeout)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    @asynccontextmanager
+    async def aslot(self, key, timeout=None):
+        """Hold a slot of key for the duration of the async block."""
+        await self.aacquire(key, timeout)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def stats(self):
+        """Return the counters of the bulkhead."""
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                'max_per_key': self.max_per_key,
+                'max_queued_per_key': self.max_queued_per_key,
+                'queue_depth': sum(len(q) for q in self._queues.values()),
+                'queued_keys': len(self._queues),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'wait_p50_ms': waits[len(waits) // 2] * 1000
+                if waits else None,
+                'wait_p99_ms': waits[len(waits) * 99 // 100] * 1000
+                if waits else None,
+            }
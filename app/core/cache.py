@@ -0,0 +1,140 @@
+"""
+Two-level caches shared by the apps.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class TwoLevelCache:
+    """
+    Cache of values in the memory of this process for local_ttl_setting
+    seconds, then in the default cache for ttl_setting seconds. Missing
+    values are loaded with load(). Writes go through to both levels, so
+    other processes may read a value up to local_ttl_setting seconds old
+    from their memory.
+
+    Values in the default cache are stored with the generation of their
+    key, which every write bumps. Values dropped in a transaction are
+    dropped again once it commits. A value loaded before a write, and
+    cached after it, has an older generation and is ignored, so the
+    default cache never serves a value older than the last committed
+    write.
+    """
+    prefix = None
+    ttl_setting = None
+    local_ttl_setting = None
+    # Number of values kept in the memory of this process.
+    max_local_entries = 10000
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def load(self, key):
+        """Return the value of a key from the database, or None."""
+        raise NotImplementedError
+
+    def make_key(self, key):
+        """Return the key of a value in the default cache."""
+        return f'{self.prefix}:{key}'
+
+    def _generation_key(self, key):
+        return f'{self.make_key(key)}:generation'
+
+    def _bump(self, key):
+        """Bump the generation of a key. Return the new generation."""
+        generation_key = self._generation_key(key)
+        try:
+            return cache.incr(generation_key)
+        except ValueError:
+            # Start from a random generation, unlike that of an old value.
+            generation = random.getrandbits(48)
+            cache.set(generation_key, generation,
+                      getattr(settings, self.ttl_setting))
+            return generation
+
+    def _invalidate(self, keys):
+        """Bump the generations of keys, and drop their local values."""
+        for key in keys:
+            self._bump(key)
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _invalidate_on_commit(self, keys):
+        """Invalidate keys again once the current transaction commits."""
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._invalidate(keys))
+
+    def _set_local(self, key, value):
+        expires = time.monotonic() + getattr(settings, self.local_ttl_setting)
+        with self._lock:
+            self._local[key] = (expires, value)
+            self._local.move_to_end(key)
+            if len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key):
+        """Return the value of a key, or None if it has none."""
+        with self._lock:
+            expires, value = self._local.get(key, (0, None))
+            if expires > time.monotonic():
+                self.local_hits += 1
+                return value
+
+        generation_key = self._generation_key(key)
+        found = cache.get_many([self.make_key(key), generation_key])
+        generation = found.get(generation_key)
+        entry = found.get(self.make_key(key))
+        if entry is not None and entry[0] == generation:
+            value = entry[1]
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            value = self.load(key)
+            if value is None:
+                return None
+            cache.set(self.make_key(key), (generation, value),
+                      getattr(settings, self.ttl_setting))
+
+        self._set_local(key, value)
+        return value
+
+    def set(self, key, value):
+        """Write the new, committed value of a key through the cache."""
+        cache.set(self.make_key(key), (self._bump(key), value),
+                  getattr(settings, self.ttl_setting))
+        self._set_local(key, value)
+
+    def delete(self, key):
+        """Drop the value of a key, after it changed by an unknown amount."""
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        """Drop the values of many keys."""
+        cache.delete_many([self.make_key(key) for key in keys])
+        self._invalidate(keys)
+        self._invalidate_on_commit(keys)
+
+    def stats(self):
+        """Return the counters of the cache."""
+        with self._lock:
+            reads = self.local_hits + self.shared_hits + self.misses
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': 1 - self.misses / reads if reads else None,
+                'local_entries': len(self._local),
+            }
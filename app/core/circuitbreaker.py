@@ -0,0 +1,106 @@
+"""
+Circuit breaker for calls to a failing service.
+"""
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the circuit is open."""
+
+    def __init__(self, retry_after):
+        super().__init__('The upstream service is unavailable.')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens once at least error_rate of the calls of the last window
+    seconds failed, over at least min_calls calls. While open, calls fail
+    fast for reset_timeout seconds. Then one trial call is let through,
+    which closes the circuit if it succeeds or opens it again if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, error_rate, min_calls, window, reset_timeout):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        # (time, failed) of the calls of the last window seconds.
+        self._calls = deque()
+        self._opened_at = None
+        self._trial = False
+        self.rejected = 0
+        self.trips = 0
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] <= now - self.window:
+            self._calls.popleft()
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.trips += 1
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may be made now."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN and \
+                    now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+
+            self.rejected += 1
+            retry_after = self.reset_timeout - (now - self._opened_at)
+            raise CircuitOpen(max(retry_after, 0))
+
+    def record(self, failed):
+        """
+        Record the outcome of a call made after before_call(). Every call
+        must be recorded, even if it was cancelled, or a trial call would
+        keep the circuit half open.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                return
+
+            self._calls.append((now, failed))
+            self._prune(now)
+            failures = sum(failed for _, failed in self._calls)
+            if len(self._calls) >= self.min_calls and \
+                    failures >= self.error_rate * len(self._calls):
+                self._open(now)
+
+    def stats(self):
+        """Return the state and counters of the breaker."""
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = len(self._calls)
+            failures = sum(failed for _, failed in self._calls)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'error_rate': failures / calls if calls else None,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,48 @@
+"""
+Django command to check every Balance against the usage ledger.
+"""
+from core.models import (
+    Balance,
+    BalanceHold,
+    BalanceShard,
+    UsageRecord,
+)
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+
+def totals_by_user(queryset, field):
+    """Return the sum of a field for each User of a queryset."""
+    return dict(queryset.values('user').annotate(
+        total=Sum(field)).values_list('user', 'total'))
+
+
+class Command(BaseCommand):
+    """
+    Django command to prove each Balance from the usage ledger: the Balance
+    plus its holds is what was credited minus what was spent. Records still
+    buffered by running workers show up as temporary mismatches.
+    """
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        spent = totals_by_user(UsageRecord.objects, 'cost')
+        held = totals_by_user(BalanceHold.objects, 'amount')
+        sharded = totals_by_user(BalanceShard.objects, 'balance')
+
+        mismatches = 0
+        balances = Balance.objects.values_list('user', 'balance')
+        for user_id, balance in balances.iterator():
+            balance += sharded.get(user_id, 0)
+            expected = -spent.get(user_id, 0) - held.get(user_id, 0)
+            if balance != expected:
+                mismatches += 1
+                self.stdout.write(
+                    f'User {user_id}: balance {balance}, ledger {expected}')
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'{mismatches} Balances do not match the ledger.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'All Balances match the ledger.'))
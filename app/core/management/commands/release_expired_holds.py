@@ -0,0 +1,17 @@
+"""
+Django command to give expired Balance holds back to their Users.
+"""
+from core.models import BalanceHold
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Django command to release the holds of API calls that never settled.
+    """
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        released = BalanceHold.objects.release_expired()
+
+        self.stdout.write(self.style.SUCCESS(f'Released {released} holds.'))
@@ -0,0 +1,36 @@
+"""
+Django command to split a User's Balance across shards.
+"""
+from core.models import (
+    Balance,
+    User,
+)
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+
+class Command(BaseCommand):
+    """
+    Django command to split the Balance of a User under many concurrent
+    API calls across shards, or to merge it back with a count of 0.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('count', type=int)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            user = User.objects.get(id=options['user_id'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user_id"]} does not exist.')
+        if options['count'] < 0:
+            raise CommandError('The number of shards cannot be negative.')
+
+        Balance.objects.shard(user, options['count'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Balance of {user} split across {options["count"]} shards.'))
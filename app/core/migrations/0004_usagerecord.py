@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def record_opening_balances(apps, schema_editor):
+    """Record existing Balances and holds as opening adjustments."""
+    Balance = apps.get_model('core', 'Balance')
+    BalanceHold = apps.get_model('core', 'BalanceHold')
+    UsageRecord = apps.get_model('core', 'UsageRecord')
+
+    held = {}
+    for hold in BalanceHold.objects.all():
+        held[hold.user_id] = held.get(hold.user_id, 0) + hold.amount
+
+    UsageRecord.objects.bulk_create([
+        UsageRecord(
+            user_id=balance.user_id,
+            kind='adjustment',
+            cost=-(balance.balance + held.get(balance.user_id, 0)),
+        )
+        for balance in Balance.objects.all()
+        if balance.balance or held.get(balance.user_id)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_balancehold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('usage', 'Usage'), ('adjustment', 'Adjustment')], default='usage', max_length=16)),
+                ('model', models.CharField(blank=True, max_length=255)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cost', models.BigIntegerField()),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('request_id', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='core_usager_user_id_1685ae_idx'), models.Index(fields=['created_at'], name='core_usager_created_a90f45_idx')],
+            },
+        ),
+        migrations.RunPython(
+            record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_usagerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WriteBehindCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('position', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
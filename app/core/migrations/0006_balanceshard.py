@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_writebehindcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balance',
+            name='shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shards', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='balanceshard',
+            constraint=models.UniqueConstraint(fields=('user', 'index'), name='unique_balance_shard'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:40
+
+from datetime import timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def rollup_usage(apps, schema_editor):
+    """Roll up the usage recorded before the rollups existed."""
+    UsageRecord = apps.get_model('core', 'UsageRecord')
+    UsageRollup = apps.get_model('core', 'UsageRollup')
+
+    for period, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        rows = UsageRecord.objects.filter(kind='usage').annotate(
+            start=trunc('created_at', tzinfo=timezone.utc),
+        ).values('user', 'model', 'start').annotate(
+            requests=Count('id'),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            cost=Sum('cost'),
+        ).order_by()
+        UsageRollup.objects.bulk_create([
+            UsageRollup(
+                user_id=row['user'],
+                model=row['model'],
+                period=period,
+                start=row['start'],
+                requests=row['requests'],
+                prompt_tokens=row['prompt_tokens'],
+                completion_tokens=row['completion_tokens'],
+                cost=row['cost'],
+            )
+            for row in rows.iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_balanceshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(blank=True, max_length=255)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('start', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cost', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'start'], name='core_usager_period_07b54d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usagerollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'start', 'model'), name='unique_usage_rollup'),
+        ),
+        migrations.RunPython(rollup_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_usedrefreshtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='writebehindcursor',
+            name='epoch',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_writebehindcursor_epoch'),
+    ]
+
+    operations = [
+        # Existing records were already added to their rollups.
+        migrations.AddField(
+            model_name='usagerecord',
+            name='rolled_up',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='usagerecord',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='usagerecord',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='usage_record_not_rolled_up'),
+        ),
+    ]
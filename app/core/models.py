@@ -1,14 +1,44 @@
 """
 Models for the Database.
 """
+import random
+from collections import defaultdict
+from datetime import (
+    timedelta,
+    timezone as dt_timezone,
+)
+
 from django.conf import settings
-from django.db import models
+from django.db import (
+    connections,
+    models,
+    router,
+    transaction,
+)
+from django.db.models import (
+    Case,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import (
+    Coalesce,
+    Greatest,
+)
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin
 )
 from django.dispatch import receiver
+from django.utils import timezone
+
+# Largest Balance, the maximum of a PositiveIntegerField on every database.
+MAX_BALANCE = 2147483647
 
 
 class UserManager(BaseUserManager):
@@ -48,6 +78,188 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+class BalanceManager(models.Manager):
+    """
+    Manager for Balances. The Balance of a User with shards is the sum of
+    its row and its BalanceShards, and is updated through the shards.
+    """
+
+    def take(self, user, amount):
+        """
+        Take an amount from a User's Balance with one conditional UPDATE.
+        Return whether the Balance was sufficient.
+        """
+        updated = self.filter(user=user, shards=0, balance__gte=amount) \
+            .update(balance=F('balance') - amount)
+
+        if not updated and self.is_sharded(user):
+            return BalanceShard.objects.take(user, amount)
+
+        return bool(updated)
+
+    def take_at_most(self, user, amount):
+        """Take an amount from a User's Balance, stopping at zero."""
+        updated = self.filter(user=user, shards=0).update(
+            balance=Greatest(F('balance') - amount, 0))
+
+        if not updated:
+            BalanceShard.objects.take(user, amount, at_most=True)
+
+    def give(self, user, amount):
+        """Give an amount back to a User's Balance."""
+        updated = self.filter(user=user, shards=0).update(
+            balance=F('balance') + amount)
+
+        if not updated:
+            BalanceShard.objects.give(user, amount)
+
+    def deduct(self, user, cost):
+        """
+        Deduct a cost from a User's Balance with one conditional UPDATE.
+        Return the new balance, or None if the Balance is insufficient.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        if connection.vendor == 'postgresql':
+            return self._deduct_returning(connection, user, cost)
+
+        if not self.take(user, cost):
+            return None
+
+        return self.total(user)
+
+    def _deduct_returning(self, connection, user, cost):
+        """
+        Deduct a cost like deduct(), reading the new balance of an
+        unsharded Balance from the UPDATE itself.
+        """
+        meta = self.model._meta
+        table = connection.ops.quote_name(meta.db_table)
+        balance, user_id, shards = (
+            connection.ops.quote_name(meta.get_field(name).column)
+            for name in ('balance', 'user', 'shards')
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {balance} = {balance} - %s '
+                f'WHERE {user_id} = %s AND {shards} = 0 AND {balance} >= %s '
+                f'RETURNING {balance}',
+                [cost, user.pk, cost],
+            )
+            row = cursor.fetchone()
+
+        if row is not None:
+            return row[0]
+        if not self.is_sharded(user) or \
+                not BalanceShard.objects.take(user, cost):
+            return None
+
+        return self.total(user)
+
+    def is_sharded(self, user):
+        """Return whether a User's Balance is split across shards."""
+        return self.filter(user=user, shards__gt=0).exists()
+
+    def with_totals(self):
+        """Annotate the total of each Balance and its shards."""
+        shards = BalanceShard.objects.filter(user=OuterRef('user')) \
+            .values('user').annotate(total=Sum('balance')).values('total')
+
+        return self.annotate(
+            total=F('balance') + Coalesce(Subquery(shards), 0))
+
+    def total(self, user):
+        """Return a User's Balance, summed with one consistent read."""
+        return self.with_totals().filter(user=user).values_list(
+            'total', flat=True).get()
+
+    def lock(self, user):
+        """Lock a User's Balance and its shards. Return the total."""
+        balance = self.select_for_update().get(user=user)
+        shards = BalanceShard.objects.select_for_update().filter(
+            user=user).order_by('index').values_list('balance', flat=True)
+
+        return balance.balance + sum(shards)
+
+    def spread(self, user):
+        """
+        Replace the shards of a locked Balance with the total saved to its
+        row, after the row was set directly.
+        """
+        if BalanceShard.objects.filter(user=user).update(balance=0):
+            BalanceShard.objects.rebalance(user)
+
+    def adjust_many(self, adjustments):
+        """
+        Add a delta to, or set, the Balances of many Users with set-based
+        UPDATEs in one transaction, recording each change in the usage
+        ledger. adjustments are (user_id, delta, balance) tuples, with
+        either delta or balance None. Return the error of each adjustment,
+        or None if it was applied.
+        """
+        with transaction.atomic():
+            balances = {}
+            rows = self.select_for_update().filter(
+                user_id__in={user_id for user_id, _, _ in adjustments},
+            ).order_by('user_id').values_list('user_id', 'balance', 'shards')
+            sharded = set()
+            for user_id, balance, shards in rows:
+                if shards:
+                    balance = self.lock(user_id)
+                    sharded.add(user_id)
+                balances[user_id] = balance
+
+            errors = []
+            records = []
+            for user_id, delta, balance in adjustments:
+                if user_id not in balances:
+                    errors.append('User does not exist.')
+                    continue
+                if balance is None:
+                    balance = balances[user_id] + delta
+                if balance < 0:
+                    errors.append('Balance cannot be negative.')
+                    continue
+                if balance > MAX_BALANCE:
+                    errors.append(f'Balance cannot exceed {MAX_BALANCE}.')
+                    continue
+
+                errors.append(None)
+                if balance != balances[user_id]:
+                    records.append(UsageRecord(
+                        user_id=user_id,
+                        kind=UsageRecord.Kind.ADJUSTMENT,
+                        cost=balances[user_id] - balance,
+                    ))
+                    balances[user_id] = balance
+
+            changed = {record.user_id for record in records}
+            if changed - sharded:
+                self.filter(user_id__in=changed - sharded).update(
+                    balance=Case(*[
+                        When(user_id=user_id, then=Value(balances[user_id]))
+                        for user_id in changed - sharded
+                    ], output_field=models.PositiveIntegerField()),
+                )
+            for user_id in changed & sharded:
+                self.filter(user_id=user_id).update(balance=balances[user_id])
+                self.spread(user_id)
+            UsageRecord.objects.bulk_create(records)
+
+        return errors
+
+    def shard(self, user, count):
+        """Split a User's Balance across a number of shards, or 0 for none."""
+        with transaction.atomic():
+            total = self.lock(user)
+            BalanceShard.objects.filter(user=user, index__gte=count).delete()
+            BalanceShard.objects.bulk_create([
+                BalanceShard(user=user, index=index)
+                for index in range(count)
+            ], ignore_conflicts=True)
+            self.filter(user=user).update(shards=count, balance=total)
+            self.spread(user)
+
+
 class Balance(models.Model):
     """Balance model for the API."""
     user = models.OneToOneField(
@@ -55,6 +267,10 @@ class Balance(models.Model):
         on_delete=models.CASCADE
     )
     balance = models.PositiveIntegerField(default=0)
+    # Number of BalanceShards the Balance is split across, 0 for none.
+    shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = BalanceManager()
 
     @receiver(models.signals.post_save, sender=User)
     def create_user_balance(sender, instance, created, **kwargs):
@@ -65,3 +281,328 @@ class Balance(models.Model):
     def __str__(self):
         """Return the string representation of the model."""
         return str(self.user)
+
+
+class BalanceShardManager(models.Manager):
+    """Manager for BalanceShards."""
+
+    def take(self, user, amount, at_most=False):
+        """
+        Take an amount from a random shard of a User's Balance. When the
+        shard runs dry, the shards are rebalanced. Return whether the
+        Balance was sufficient.
+        """
+        count = Balance.objects.filter(user=user).values_list(
+            'shards', flat=True).get()
+        updated = self.filter(
+            user=user,
+            index=random.randrange(count),
+            balance__gte=amount,
+        ).update(balance=F('balance') - amount)
+
+        return bool(updated) or self.rebalance(user, amount, at_most)
+
+    def give(self, user, amount):
+        """Give an amount back to a random shard of a User's Balance."""
+        count = Balance.objects.filter(user=user).values_list(
+            'shards', flat=True).get()
+        self.filter(user=user, index=random.randrange(count)).update(
+            balance=F('balance') + amount)
+
+    def rebalance(self, user, amount=0, at_most=False):
+        """
+        Take an amount from the total of a User's Balance, then spread
+        the rest evenly across its shards. Return whether the Balance was
+        sufficient.
+        """
+        with transaction.atomic():
+            total = Balance.objects.lock(user)
+            if total < amount and not at_most:
+                return False
+
+            total -= min(total, amount)
+            shards = list(self.filter(user=user).order_by('index'))
+            for shard in shards:
+                shard.balance = total // len(shards) + \
+                    (shard.index < total % len(shards))
+            self.bulk_update(shards, ['balance'])
+            Balance.objects.filter(user=user).update(balance=0)
+
+            return True
+
+
+class BalanceShard(models.Model):
+    """Part of the Balance of a User under many concurrent API calls."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='balance_shards',
+    )
+    index = models.PositiveSmallIntegerField()
+    balance = models.PositiveIntegerField(default=0)
+
+    objects = BalanceShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'index'], name='unique_balance_shard'),
+        ]
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.user} ({self.index})'
+
+
+class BalanceHoldManager(models.Manager):
+    """Manager for BalanceHolds."""
+
+    def _create(self, user, amount):
+        """Take an amount from a User's Balance into a new hold, or None."""
+        with transaction.atomic():
+            if not Balance.objects.take(user, amount):
+                return None
+
+            return self.create(
+                user=user,
+                amount=amount,
+                expires_at=timezone.now() + timedelta(
+                    seconds=settings.BALANCE_HOLD_TTL),
+            )
+
+    def reserve(self, user, amount):
+        """
+        Move an amount of a User's Balance into a new hold.
+        Return the hold, or None if the Balance is insufficient.
+        """
+        hold = self._create(user, amount)
+
+        # Holds left behind by crashed workers may be using the Balance.
+        if hold is None and self.release_expired(user=user):
+            hold = self._create(user, amount)
+
+        return hold
+
+    def settle(self, hold, cost):
+        """
+        Settle a hold for the actual cost of its API call. The unused part
+        goes back to the Balance and any excess is taken from it.
+        """
+        with transaction.atomic():
+            deleted, _ = self.filter(pk=hold.pk).delete()
+            # An expired hold was already given back in full.
+            held = hold.amount if deleted else 0
+
+            if held > cost:
+                Balance.objects.give(hold.user_id, held - cost)
+            elif held < cost:
+                Balance.objects.take_at_most(hold.user_id, cost - held)
+
+    def release_expired(self, user=None):
+        """
+        Give expired holds back to their Balances.
+        Return the number of holds released.
+        """
+        expired = self.filter(expires_at__lt=timezone.now())
+        if user is not None:
+            expired = expired.filter(user=user)
+
+        released = 0
+        for hold in expired.iterator():
+            with transaction.atomic():
+                deleted, _ = self.filter(pk=hold.pk).delete()
+                if deleted:
+                    Balance.objects.give(hold.user_id, hold.amount)
+                    released += 1
+
+        return released
+
+
+class BalanceHold(models.Model):
+    """Part of a User's Balance held for an API call in progress."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='balance_holds',
+    )
+    amount = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = BalanceHoldManager()
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.user} ({self.amount})'
+
+
+class WriteBehindCursor(models.Model):
+    """Position of the last write-behind journal entry applied."""
+    name = models.CharField(max_length=64, unique=True)
+    # Journal the position is in, which starts again if its cache is lost.
+    epoch = models.CharField(max_length=32, blank=True)
+    position = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.name} ({self.position})'
+
+
+class RevokedToken(models.Model):
+    """Signed access or refresh token explicitly revoked before it expires."""
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return self.jti
+
+
+class UsedRefreshToken(models.Model):
+    """Signed refresh token already exchanged for new tokens."""
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return self.jti
+
+
+class Conversation(models.Model):
+    """Conversation whose history is kept by the API."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='conversations',
+    )
+    model = models.CharField(max_length=255)
+    messages = models.JSONField(default=list)
+    num_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.user} ({self.model})'
+
+
+class UsageRecord(models.Model):
+    """
+    Append-only record of a change to a User's Balance. Costs are taken
+    from the Balance, so credits are recorded with a negative cost.
+    """
+    class Kind(models.TextChoices):
+        USAGE = 'usage'
+        ADJUSTMENT = 'adjustment'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='usage_records',
+    )
+    kind = models.CharField(
+        max_length=16, choices=Kind.choices, default=Kind.USAGE)
+    model = models.CharField(max_length=255, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cost = models.BigIntegerField()
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    request_id = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Whether the record was added to its UsageRollups.
+    rolled_up = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+            models.Index(
+                fields=['id'],
+                condition=Q(rolled_up=False),
+                name='usage_record_not_rolled_up',
+            ),
+        ]
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.user} ({self.kind}: {self.cost})'
+
+
+class UsageRollupManager(models.Manager):
+    """Manager for UsageRollups."""
+
+    def add(self, records):
+        """Add usage UsageRecords to their hourly and daily rollups."""
+        totals = defaultdict(lambda: [0, 0, 0, 0])
+        for record in records:
+            if record.kind != UsageRecord.Kind.USAGE:
+                continue
+
+            hour = record.created_at.astimezone(dt_timezone.utc).replace(
+                minute=0, second=0, microsecond=0)
+            for period, start in (
+                (UsageRollup.Period.HOUR, hour),
+                (UsageRollup.Period.DAY, hour.replace(hour=0)),
+            ):
+                total = totals[(record.user_id, record.model, period, start)]
+                total[0] += 1
+                total[1] += record.prompt_tokens
+                total[2] += record.completion_tokens
+                total[3] += record.cost
+
+        # Create the missing rollups, then add to all of them in place, in
+        # the same order in every flush so that concurrent ones cannot
+        # deadlock on each other's rows.
+        keys = sorted(totals)
+        self.bulk_create([
+            UsageRollup(user_id=user_id, model=model, period=period,
+                        start=start)
+            for user_id, model, period, start in keys
+        ], ignore_conflicts=True)
+        for user_id, model, period, start in keys:
+            total = totals[(user_id, model, period, start)]
+            self.filter(
+                user_id=user_id, model=model, period=period, start=start,
+            ).update(
+                requests=F('requests') + total[0],
+                prompt_tokens=F('prompt_tokens') + total[1],
+                completion_tokens=F('completion_tokens') + total[2],
+                cost=F('cost') + total[3],
+            )
+
+
+class UsageRollup(models.Model):
+    """Usage of a User and model summed over an hour or a day (UTC)."""
+    class Period(models.TextChoices):
+        HOUR = 'hour'
+        DAY = 'day'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='usage_rollups',
+    )
+    model = models.CharField(max_length=255, blank=True)
+    period = models.CharField(max_length=8, choices=Period.choices)
+    start = models.DateTimeField()
+    requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    cost = models.BigIntegerField(default=0)
+
+    objects = UsageRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'start', 'model'],
+                name='unique_usage_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'start']),
+        ]
+
+    def __str__(self):
+        """Return the string representation of the model."""
+        return f'{self.user} ({self.model}, {self.period} {self.start})'
@@ -0,0 +1,76 @@
+"""
+Coalescing of identical concurrent calls.
+"""
+import threading
+
+
+class _Call:
+    """A call in flight and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Group of idempotent calls, where concurrent calls with the same key
+    share one call in flight and all receive its result or its error.
+    Each waiter gives up after its own timeout without affecting the call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        """
+        Return func(*args, **kwargs), or the result of the call in flight
+        for the same key. Raise TimeoutError if waiting for it takes
+        longer than timeout seconds.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+            return call.result
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f'Timed out waiting for {key!r}.')
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+    def stats(self):
+        """Return the counters of the group."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'shared': self.shared,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._calls),
+            }
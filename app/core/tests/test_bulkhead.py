@@ -0,0 +1,155 @@
+"""
+Tests for concurrency limits with fair queuing.
+"""
+import asyncio
+import threading
+
+from core.bulkhead import (
+    Bulkhead,
+    QueueFull,
+)
+from django.test import SimpleTestCase
+
+
+class BulkheadTests(SimpleTestCase):
+    """Tests for Bulkhead."""
+
+    def wait_for_queue(self, bulkhead, depth):
+        """Wait until depth calls are queued."""
+        while bulkhead.stats()['queue_depth'] < depth:
+            threading.Event().wait(0.001)
+
+    def test_per_key_cap(self):
+        """Test a key over its cap waits while other keys go ahead."""
+        bulkhead = Bulkhead(max_concurrent=10, max_per_key=1)
+        bulkhead.acquire('a')
+
+        with self.assertRaises(TimeoutError):
+            bulkhead.acquire('a', timeout=0.01)
+        bulkhead.acquire('b', timeout=0.01)
+
+        stats = bulkhead.stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_round_robin(self):
+        """Test queued keys are served in turn."""
+        bulkhead = Bulkhead(max_concurrent=1, max_per_key=10)
+        bulkhead.acquire('holder')
+        order = []
+
+        def call(key):
+            with bulkhead.slot(key, timeout=5):
+                order.append(key)
+
+        threads = []
+        for depth, key in enumerate(['a', 'a', 'a', 'b'], start=1):
+            thread = threading.Thread(target=call, args=(key,))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queue(bulkhead, depth)
+
+        bulkhead.release('holder')
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['a', 'b', 'a', 'a'])
+        stats = bulkhead.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['queued'], 4)
+        self.assertGreater(stats['wait_p99_ms'], 0)
+
+    def test_slot_released_on_error(self):
+        """Test a slot is given back when the call fails."""
+        bulkhead = Bulkhead(max_concurrent=1, max_per_key=1)
+
+        with self.assertRaises(ValueError):
+            with bulkhead.slot('a'):
+                raise ValueError()
+
+        bulkhead.acquire('a', timeout=0.01)
+
+    def test_queue_full(self):
+        """Test a key with a full queue is refused without waiting."""
+        bulkhead = Bulkhead(max_concurrent=10, max_per_key=1,
+                            max_queued_per_key=1)
+        bulkhead.acquire('a')
+        thread = threading.Thread(target=bulkhead.acquire, args=('a', 5))
+        thread.start()
+        self.wait_for_queue(bulkhead, 1)
+
+        with self.assertRaises(QueueFull):
+            bulkhead.acquire('a', timeout=5)
+        bulkhead.acquire('b', timeout=0.01)
+
+        bulkhead.release('a')
+        thread.join()
+        self.assertEqual(bulkhead.stats()['rejected'], 1)
+
+    def test_no_wait_over_share(self):
+        """Test a key at its share is refused at once, not queued."""
+        bulkhead = Bulkhead(max_concurrent=2, max_per_key=2)
+        bulkhead.acquire('a')
+        bulkhead.acquire('b')
+        thread = threading.Thread(
+            target=bulkhead.acquire, args=('a', 5, False))
+        thread.start()
+        self.wait_for_queue(bulkhead, 1)
+
+        with self.assertRaises(QueueFull):
+            bulkhead.acquire('a', timeout=5, wait_over_share=False)
+
+        bulkhead.release('b')
+        thread.join()
+        stats = bulkhead.stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['rejected'], 1)
+
+    def test_async_slot(self):
+        """Test async calls share the slots and queues of threads."""
+        bulkhead = Bulkhead(max_concurrent=1, max_per_key=1)
+        bulkhead.acquire('a')
+        order = []
+
+        async def call(key):
+            async with bulkhead.aslot(key, timeout=5):
+                order.append(key)
+
+        async def main():
+            with self.assertRaises(TimeoutError):
+                await bulkhead.aacquire('b', timeout=0.01)
+
+            task = asyncio.create_task(call('b'))
+            while bulkhead.stats()['queue_depth'] < 1:
+                await asyncio.sleep(0.001)
+            # Released from another thread, like the sync views do.
+            threading.Thread(target=bulkhead.release, args=('a',)).start()
+            await task
+
+        asyncio.run(main())
+
+        self.assertEqual(order, ['b'])
+        stats = bulkhead.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_async_cancelled(self):
+        """Test a cancelled async call leaves its queue."""
+        bulkhead = Bulkhead(max_concurrent=1, max_per_key=1)
+        bulkhead.acquire('a')
+
+        async def main():
+            task = asyncio.create_task(bulkhead.aacquire('b', timeout=5))
+            while bulkhead.stats()['queue_depth'] < 1:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        bulkhead.release('a')
+
+        self.assertEqual(bulkhead.stats()['active'], 0)
+        self.assertEqual(bulkhead.stats()['queue_depth'], 0)
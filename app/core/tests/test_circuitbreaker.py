@@ -0,0 +1,72 @@
+"""
+Tests for the circuit breaker.
+"""
+from unittest.mock import patch
+
+from core.circuitbreaker import (
+    CircuitBreaker,
+    CircuitOpen,
+)
+from django.test import SimpleTestCase
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Tests for CircuitBreaker."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(
+            error_rate=0.5, min_calls=4, window=30, reset_timeout=10)
+
+    def call(self, failed):
+        """Record a call made through the breaker."""
+        self.breaker.before_call()
+        self.breaker.record(failed)
+
+    def test_trips_on_error_rate(self):
+        """Test the circuit opens once enough calls failed."""
+        self.call(False)
+        self.call(True)
+        self.call(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.call(True)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen) as cm:
+            self.breaker.before_call()
+        self.assertLessEqual(cm.exception.retry_after, 10)
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_min_calls(self):
+        """Test a few failed calls do not open the circuit."""
+        for _ in range(3):
+            self.call(True)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial(self):
+        """Test one trial call closes the circuit after the timeout."""
+        for _ in range(4):
+            self.call(True)
+
+        with patch('core.circuitbreaker.time.monotonic',
+                   return_value=10 ** 9):
+            self.breaker.before_call()
+            # Other calls fail fast while the trial is in flight.
+            with self.assertRaises(CircuitOpen):
+                self.breaker.before_call()
+            self.breaker.record(False)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial_fails(self):
+        """Test a failed trial call opens the circuit again."""
+        for _ in range(4):
+            self.call(True)
+
+        with patch('core.circuitbreaker.time.monotonic',
+                   return_value=10 ** 9):
+            self.call(True)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()['trips'], 2)
@@ -1,8 +1,19 @@
 """
 Tests Models.
 """
+from datetime import timedelta
+
+from unittest import skipUnless
+
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from core.models import (
+    Balance,
+    BalanceHold,
+    BalanceShard,
+)
 
 
 class ModelTests(TestCase):
@@ -54,3 +65,153 @@ class ModelTests(TestCase):
 
         self.assertEqual(user.balance.user, user)
         self.assertEqual(user.balance.balance, 0)
+
+    def test_deduct_balance(self):
+        """Test deducting from a Balance returns the new balance."""
+        user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123'
+        )
+        Balance.objects.filter(user=user).update(balance=100)
+
+        new_balance = Balance.objects.deduct(user, 30)
+
+        user.balance.refresh_from_db()
+        self.assertEqual(new_balance, 70)
+        self.assertEqual(user.balance.balance, 70)
+
+    def test_deduct_balance_insufficient(self):
+        """Test deducting more than a Balance leaves it unchanged."""
+        user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123'
+        )
+        Balance.objects.filter(user=user).update(balance=10)
+
+        new_balance = Balance.objects.deduct(user, 30)
+
+        user.balance.refresh_from_db()
+        self.assertIsNone(new_balance)
+        self.assertEqual(user.balance.balance, 10)
+
+    @skipUnless(connection.vendor == 'postgresql', 'UPDATE ... RETURNING')
+    def test_deduct_balance_one_query(self):
+        """Test a deduction returns the new balance from its UPDATE."""
+        user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123'
+        )
+        Balance.objects.filter(user=user).update(balance=100)
+
+        with self.assertNumQueries(1):
+            new_balance = Balance.objects.deduct(user, 30)
+
+        self.assertEqual(new_balance, 70)
+
+
+class BalanceHoldTests(TestCase):
+    """Tests for BalanceHolds."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123'
+        )
+        Balance.objects.filter(user=self.user).update(balance=100)
+
+    def get_balance(self):
+        """Return the User's balance in the database."""
+        return Balance.objects.get(user=self.user).balance
+
+    def test_reserve_and_settle(self):
+        """Test a hold takes its amount and gives back the unused part."""
+        hold = BalanceHold.objects.reserve(self.user, 60)
+        self.assertEqual(self.get_balance(), 40)
+
+        BalanceHold.objects.settle(hold, 25)
+
+        self.assertEqual(self.get_balance(), 75)
+        self.assertFalse(BalanceHold.objects.exists())
+
+    def test_reserve_insufficient(self):
+        """Test a hold larger than the Balance is refused."""
+        BalanceHold.objects.reserve(self.user, 60)
+
+        hold = BalanceHold.objects.reserve(self.user, 60)
+
+        self.assertIsNone(hold)
+        self.assertEqual(self.get_balance(), 40)
+
+    def test_reserve_releases_expired_holds(self):
+        """Test expired holds are given back to make room for a hold."""
+        BalanceHold.objects.reserve(self.user, 60)
+        BalanceHold.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+
+        hold = BalanceHold.objects.reserve(self.user, 60)
+
+        self.assertIsNotNone(hold)
+        self.assertEqual(self.get_balance(), 40)
+        self.assertEqual(BalanceHold.objects.count(), 1)
+
+    def test_settle_expired_hold(self):
+        """Test settling a released hold charges its cost once."""
+        hold = BalanceHold.objects.reserve(self.user, 60)
+        BalanceHold.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+        BalanceHold.objects.release_expired()
+        self.assertEqual(self.get_balance(), 100)
+
+        BalanceHold.objects.settle(hold, 25)
+
+        self.assertEqual(self.get_balance(), 75)
+
+
+class BalanceShardTests(TestCase):
+    """Tests for sharded Balances."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123'
+        )
+        Balance.objects.filter(user=self.user).update(balance=100)
+        Balance.objects.shard(self.user, 4)
+
+    def get_shards(self):
+        """Return the balances of the User's shards."""
+        shards = BalanceShard.objects.filter(user=self.user).order_by('index')
+        return list(shards.values_list('balance', flat=True))
+
+    def test_shard_balance(self):
+        """Test sharding spreads the Balance evenly across its shards."""
+        self.assertEqual(self.get_shards(), [25, 25, 25, 25])
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 0)
+        self.assertEqual(Balance.objects.total(self.user), 100)
+
+    def test_deduct_sharded(self):
+        """Test deductions are taken from a single shard."""
+        balance = Balance.objects.deduct(self.user, 10)
+
+        self.assertEqual(balance, 90)
+        self.assertEqual(sorted(self.get_shards()), [15, 25, 25, 25])
+
+    def test_deduct_rebalances(self):
+        """Test a deduction larger than a shard rebalances the shards."""
+        balance = Balance.objects.deduct(self.user, 30)
+
+        self.assertEqual(balance, 70)
+        self.assertEqual(self.get_shards(), [18, 18, 17, 17])
+        self.assertIsNone(Balance.objects.deduct(self.user, 71))
+        self.assertEqual(Balance.objects.total(self.user), 70)
+
+    def test_holds_sharded(self):
+        """Test holds are taken from and settled to the shards."""
+        hold = BalanceHold.objects.reserve(self.user, 20)
+        BalanceHold.objects.settle(hold, 5)
+
+        self.assertEqual(Balance.objects.total(self.user), 95)
+
+    def test_unshard_balance(self):
+        """Test merging the shards back into the Balance."""
+        Balance.objects.deduct(self.user, 10)
+
+        Balance.objects.shard(self.user, 0)
+
+        self.assertFalse(BalanceShard.objects.exists())
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 90)
@@ -0,0 +1,96 @@
+"""
+Tests for coalescing identical concurrent calls.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.singleflight import SingleFlight
+from django.test import SimpleTestCase
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Tests for SingleFlight."""
+
+    def setUp(self):
+        self.group = SingleFlight()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def blocking_call(self, result=None, error=None):
+        """Return a call that blocks until released."""
+        calls = []
+
+        def call():
+            calls.append(1)
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+
+        return call, calls
+
+    def wait_for_waiters(self, count):
+        """Wait until count calls are waiting for the call in flight."""
+        while self.group.stats()['shared'] < count:
+            self.release.wait(0.001)
+
+    def test_concurrent_calls_shared(self):
+        """Test concurrent calls with the same key share one call."""
+        call, calls = self.blocking_call(result='result')
+
+        with ThreadPoolExecutor(4) as executor:
+            futures = [
+                executor.submit(self.group.do, 'key', call)
+                for _ in range(4)
+            ]
+            self.started.wait(5)
+            self.wait_for_waiters(3)
+            self.release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.group.stats()['in_flight'], 0)
+
+    def test_error_raised_to_each_waiter(self):
+        """Test the error of a shared call is raised to every caller."""
+        call, calls = self.blocking_call(error=ValueError('Upstream'))
+
+        with ThreadPoolExecutor(3) as executor:
+            futures = [
+                executor.submit(self.group.do, 'key', call)
+                for _ in range(3)
+            ]
+            self.started.wait(5)
+            self.wait_for_waiters(2)
+            self.release.set()
+
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result()
+
+        # Later calls are not served the error.
+        self.assertEqual(self.group.do('key', lambda: 'retried'), 'retried')
+
+    def test_waiter_timeout(self):
+        """Test a waiter gives up without cancelling the call."""
+        call, calls = self.blocking_call(result='result')
+
+        with ThreadPoolExecutor(1) as executor:
+            leader = executor.submit(self.group.do, 'key', call)
+            self.started.wait(5)
+
+            with self.assertRaises(TimeoutError):
+                self.group.do('key', call, timeout=0.01)
+
+            self.release.set()
+            self.assertEqual(leader.result(), 'result')
+
+        self.assertEqual(self.group.stats()['timeouts'], 1)
+
+    def test_different_keys_not_shared(self):
+        """Test calls with different keys are made separately."""
+        self.assertEqual(self.group.do('a', lambda: 1), 1)
+        self.assertEqual(self.group.do('b', lambda: 2), 2)
+        self.assertEqual(self.group.stats()['calls'], 2)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class OpenaiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'openai_app'
+
+    def ready(self):
+        """Preload the configured tokenizers."""
+        from openai_app.tokens import preload_encodings
+        preload_encodings(settings.TIKTOKEN_PRELOAD_ENCODINGS,
+                          fail_silently=True)
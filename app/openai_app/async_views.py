@@ -0,0 +1,332 @@
+"""
+Async views for the OpenAI API, served natively over ASGI.
+"""
+import time
+
+import openai
+import openai_app.serializers as serializers
+from asgiref.sync import sync_to_async
+from django.http import (
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.decorators import classonlymethod
+from django.views import View
+from openai_app.catalog import model_catalog
+from openai_app.streaming import (
+    CompletionMeter,
+    DONE,
+    format_error,
+    format_event,
+)
+from openai_app.tokens import num_tokens_from_messages
+from openai_app.upstream import (
+    acall_upstream,
+    async_upstream_sessions,
+    get_timeout,
+)
+from openai_app.views import (
+    DeductibleCompletionMixin,
+    describe_error,
+)
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+)
+
+
+def error_response(error):
+    """Return the JsonResponse for a failed upstream call."""
+    data, status_code, headers = describe_error(error)
+
+    return JsonResponse(data, status=status_code, headers=headers)
+
+
+async def acreate_chat_completion(**params):
+    """
+    Create a chat completion and return it with its status code and
+    headers.
+    """
+    try:
+        response = await acall_upstream(
+            openai.ChatCompletion.acreate,
+            request_timeout=get_timeout(),
+            **params,
+        )
+
+        return response, status.HTTP_200_OK, {}
+    except Exception as e:
+        return describe_error(e)
+
+
+class AsyncAPIView(View):
+    """
+    Base of async views. Requests are authenticated and parsed like those
+    of APIViews, so that the views await the upstream API instead of
+    holding a worker thread for the whole call.
+    """
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        """Return the view, exempt from CSRF checks like APIViews."""
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Authenticate the request, then dispatch it to its handler."""
+        request = Request(
+            request,
+            parsers=[JSONParser()],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+
+        try:
+            # Authentication may read the caches or the database.
+            user = await sync_to_async(lambda: request.user)()
+            if user.is_authenticated:
+                # Parse the body while its errors can still be returned.
+                request.data
+        except APIException as e:
+            return JsonResponse(
+                {'detail': str(e.detail)}, status=e.status_code)
+
+        if not user.is_authenticated:
+            return JsonResponse({
+                'detail': 'Authentication credentials were not provided.',
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Upstream calls reuse the connections of this event loop.
+        openai.aiosession.set(async_upstream_sessions.get())
+
+        self.request = request
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncModelListAPIView(AsyncAPIView):
+    """Async ModelListAPIView."""
+    serializer_class = serializers.ModelListSerializer
+
+    async def get(self, request):
+        """Lists the currently available models, and provides basic\
+        information about each one such as the owner and availability."""
+        try:
+            data = await sync_to_async(
+                model_catalog.list, thread_sensitive=False)()
+
+            return JsonResponse(data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return error_response(e)
+
+
+class AsyncModelAPIView(AsyncAPIView):
+    """Async ModelAPIView."""
+    serializer_class = serializers.ModelSerializer
+
+    async def get(self, request, model=None):
+        """Retrieves a model instance, providing basic information\
+        about the model such as the owner and permissioning."""
+        try:
+            data = await sync_to_async(
+                model_catalog.retrieve, thread_sensitive=False)(model)
+
+            return JsonResponse(data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return error_response(e)
+
+
+class AsyncChatCompletionAPIView(DeductibleCompletionMixin, AsyncAPIView):
+    """
+    Async DeductibleChatCompletionAPIView. The Balance is still held and
+    settled in database transactions, which run in a worker thread as the
+    async ORM cannot run transactions. Requests wait for their turn in the
+    same queues as those of the sync views.
+    """
+    serializer_class = serializers.ChatCompletionRequestSerializer
+
+    async def post(self, request):
+        """Creates a model response for the given chat conversation."""
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = request.data.get('model', None)
+        messages = request.data.get('messages', None)
+        params = self.get_sampling_params(serializer.validated_data)
+
+        user_balance = await sync_to_async(self.available_balance)()
+
+        key = self.get_cache_key(
+            model, messages, serializer.validated_data, params)
+        if key is not None:
+            res = await sync_to_async(self.create_cached_completion)(
+                model,
+                key,
+                user_balance,
+                serializer.validated_data.get('max_tokens'),
+            )
+            if res is not None:
+                response = JsonResponse(res.data, status=res.status_code)
+                if res.has_header('X-Cache'):
+                    response['X-Cache'] = res['X-Cache']
+                return response
+        # Counting tokens is CPU bound, so it runs outside the event loop.
+        input_cost, exact_input_cost = await sync_to_async(
+            self.estimate_input_cost, thread_sensitive=False,
+        )(model, messages, user_balance)
+
+        if user_balance < input_cost:
+            return JsonResponse({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        max_tokens = self.get_max_tokens(
+            user_balance,
+            input_cost,
+            serializer.validated_data.get('max_tokens'),
+        )
+
+        if serializer.validated_data.get('stream'):
+            if not exact_input_cost:
+                # Streamed completions report no usage to charge it from.
+                input_cost = await sync_to_async(
+                    num_tokens_from_messages, thread_sensitive=False,
+                )(messages, model=model)
+
+            return await self.stream_completion(
+                model, messages, input_cost, max_tokens, **params)
+
+        hold = await sync_to_async(self.reserve_balance)(
+            self.get_hold_amount(model, input_cost, max_tokens))
+
+        if hold is None:
+            return JsonResponse({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        cost = 0
+        usage = {}
+        try:
+            if not await self.aacquire_upstream_slot():
+                return JsonResponse({
+                    'message': 'Too many concurrent requests.',
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+            try:
+                started = time.monotonic()
+                completion, status_code, headers = \
+                    await acreate_chat_completion(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        **params,
+                    )
+                latency = time.monotonic() - started
+            finally:
+                self.release_upstream_slot()
+
+            if status_code == status.HTTP_200_OK:
+                input_cost, output_cost = self.get_usage(
+                    completion, input_cost, exact_input_cost)
+                cost = input_cost + output_cost
+            if cost:
+                usage = {
+                    'model': model,
+                    'prompt_tokens': input_cost,
+                    'completion_tokens': output_cost,
+                    'latency_ms': int(latency * 1000),
+                    'request_id': completion.get('id') or '',
+                }
+        finally:
+            await sync_to_async(self.settle_balance)(hold, cost, **usage)
+
+        if key is not None and status_code == status.HTTP_200_OK:
+            self.cache_completion(key, completion)
+
+        return JsonResponse(completion, status=status_code, headers=headers)
+
+    async def stream_completion(self, model, messages, input_cost,
+                                max_tokens, **params):
+        """
+        Stream a chat completion as server-sent events, paid for from the
+        User's Balance as its tokens arrive.
+        """
+        hold = await sync_to_async(self.reserve_balance)(
+            self.get_hold_amount(model, input_cost, max_tokens))
+
+        if hold is None:
+            return JsonResponse({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        if not await self.aacquire_upstream_slot():
+            await sync_to_async(self.settle_balance)(hold, 0)
+            return JsonResponse({
+                'message': 'Too many concurrent requests.',
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        try:
+            started = time.monotonic()
+            chunks = await acall_upstream(
+                openai.ChatCompletion.acreate,
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                request_timeout=get_timeout(),
+                **params,
+            )
+        except Exception as e:
+            self.release_upstream_slot()
+            await sync_to_async(self.settle_balance)(hold, 0)
+            return error_response(e)
+
+        meter = CompletionMeter(model, input_cost, hold.amount)
+        response = StreamingHttpResponse(
+            self.stream_events(model, hold, chunks, meter, started),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Keep proxies from buffering the events.
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    async def stream_events(self, model, hold, chunks, meter, started):
+        """
+        Yield the chunks of a completion as events, and cut the stream off
+        once it costs more than the hold. The hold is settled for the
+        tokens counted when the stream ends or is closed.
+        """
+        try:
+            async for chunk in chunks:
+                if not meter.add(chunk):
+                    yield format_error('Insufficient balance.')
+                    return
+                yield format_event(chunk)
+            yield DONE
+        except Exception as e:
+            yield format_error(str(e))
+        finally:
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+            self.release_upstream_slot()
+            await sync_to_async(self.settle_balance)(
+                hold,
+                meter.cost,
+                model=model,
+                prompt_tokens=meter.input_cost,
+                completion_tokens=meter.completion_tokens,
+                latency_ms=int((time.monotonic() - started) * 1000),
+                request_id=meter.request_id,
+            )
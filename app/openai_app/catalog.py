@@ -0,0 +1,142 @@
+"""
+Cache of the models of the OpenAI API.
+"""
+import logging
+import threading
+import time
+
+import openai
+import openai_app.serializers as serializers
+from django.conf import settings
+from openai_app.upstream import (
+    call_upstream,
+    coalesce,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """
+    Models listed by the OpenAI API, kept in the memory of this process for
+    OPENAI_MODEL_CACHE_TTL seconds. Once stale, they are still served while
+    one background thread per process lists them again. Models are looked
+    up in the same listing as the list, so both always agree.
+    """
+
+    def __init__(self):
+        self._list = None
+        self._models = {}
+        # Models retrieved although not listed, until the next listing.
+        self._unlisted = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _fetch(self):
+        """List the models upstream and replace the cached listing."""
+        data = serializers.ModelListSerializer(
+            call_upstream(openai.Model.list)).data
+        with self._lock:
+            self._list = data
+            self._models = {model['id']: model for model in data['data']}
+            self._unlisted = {}
+            self._fetched_at = time.monotonic()
+            self.refreshes += 1
+
+    def _retrieve(self, model):
+        """Retrieve a model that is not listed upstream and cache it."""
+        data = serializers.ModelSerializer(
+            call_upstream(openai.Model.retrieve, model)).data
+        with self._lock:
+            self._unlisted[model] = data
+
+        return data
+
+    def _refresh(self):
+        """List the models again, keeping the stale listing on errors."""
+        try:
+            coalesce('models', self._fetch)
+        except Exception:
+            logger.exception('Failed to refresh the model catalog.')
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _get(self):
+        """Return the cached list and models, listing them if needed."""
+        with self._lock:
+            fetched_at = self._fetched_at
+            if fetched_at is not None:
+                age = time.monotonic() - fetched_at
+                if age < settings.OPENAI_MODEL_CACHE_TTL:
+                    self.hits += 1
+                    return self._list, self._models
+
+                self.stale_hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh,
+                        name='model-catalog',
+                        daemon=True,
+                    ).start()
+                return self._list, self._models
+
+            self.misses += 1
+
+        # Concurrent first requests share a single listing.
+        coalesce('models', self._fetch)
+
+        with self._lock:
+            return self._list, self._models
+
+    def list(self):
+        """Return the serialized list of models."""
+        return self._get()[0]
+
+    def retrieve(self, model):
+        """Return a serialized model."""
+        data = self._get()[1].get(model)
+        if data is not None:
+            return data
+
+        with self._lock:
+            data = self._unlisted.get(model)
+        if data is None:
+            # A new model is requested by many clients at once.
+            data = coalesce(('model', model), self._retrieve, model)
+
+        return data
+
+    def clear(self):
+        """Drop the cached models."""
+        with self._lock:
+            self._list = None
+            self._models = {}
+            self._unlisted = {}
+            self._fetched_at = None
+
+    def stats(self):
+        """Return the counters of the catalog."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'models': len(self._models),
+                'age': time.monotonic() - self._fetched_at
+                if self._fetched_at is not None else None,
+            }
+
+
+model_catalog = ModelCatalog()
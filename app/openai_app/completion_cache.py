@@ -0,0 +1,99 @@
+"""
+Cache of deterministic chat completions.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class CompletionCache:
+    """
+    Bounded LRU cache of chat completions keyed by a hash of their model,
+    messages and sampling parameters. Entries expire after ttl seconds,
+    and its size is accounted in bytes of the completions' JSON.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, messages, params):
+        """Return the cache key of a chat completion request."""
+        canonical = json.dumps(
+            [model, messages, params],
+            sort_keys=True,
+            separators=(',', ':'),
+        )
+        return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+    def _pop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        """Return the cached completion for a key, or None."""
+        with self._lock:
+            expires, _, completion = self._entries.get(key, (0, 0, None))
+            if expires <= time.monotonic():
+                if completion is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return completion
+
+    def set(self, key, completion):
+        """Cache a completion, evicting the least recently used entries."""
+        encoded = json.dumps(completion)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (
+                time.monotonic() + self.ttl, size, json.loads(encoded))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the counters of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+completion_cache = CompletionCache(
+    settings.CHAT_COMPLETION_CACHE_MAX_BYTES,
+    settings.CHAT_COMPLETION_CACHE_TTL,
+)
@@ -0,0 +1,84 @@
+"""
+Django command to benchmark the per-call overhead of token counting.
+"""
+import time
+
+import tiktoken
+from django.core.management.base import BaseCommand
+from openai_app.tokens import num_tokens_from_messages
+
+MESSAGES = [
+    {'role': 'system', 'content': 'You are a helpful assistant.'},
+    {'role': 'user', 'content': 'Hello!'},
+]
+
+
+def legacy_num_tokens_from_messages(messages, model='gpt-3.5-turbo-0613'):
+    """Count tokens the way the views did before the tokenizer registry."""
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    if model in {
+        "gpt-3.5-turbo-0613",
+        "gpt-3.5-turbo-16k-0613",
+        "gpt-4-0314",
+        "gpt-4-32k-0314",
+        "gpt-4-0613",
+        "gpt-4-32k-0613",
+    }:
+        tokens_per_message = 3
+        tokens_per_name = 1
+    elif model == "gpt-3.5-turbo-0301":
+        tokens_per_message = 4
+        tokens_per_name = -1
+    elif "gpt-3.5-turbo" in model:
+        return legacy_num_tokens_from_messages(
+            messages, model="gpt-3.5-turbo-0613")
+    elif "gpt-4" in model:
+        return legacy_num_tokens_from_messages(messages, model="gpt-4-0613")
+    else:
+        raise NotImplementedError(model)
+    num_tokens = 0
+    for message in messages:
+        num_tokens += tokens_per_message
+        for key, value in message.items():
+            num_tokens += len(encoding.encode(value))
+            if key == "name":
+                num_tokens += tokens_per_name
+    num_tokens += 3
+    return num_tokens
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare token counting before and after the registry.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='gpt-3.5-turbo')
+        parser.add_argument('--iterations', type=int, default=100000)
+
+    def time_per_call(self, func, model, iterations):
+        """Return the mean time of a call to func in microseconds."""
+        func(MESSAGES, model=model)  # load the encoding outside the timing
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(MESSAGES, model=model)
+
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        model = options['model']
+        iterations = options['iterations']
+
+        before = self.time_per_call(
+            legacy_num_tokens_from_messages, model, iterations)
+        after = self.time_per_call(num_tokens_from_messages, model, iterations)
+
+        self.stdout.write(f'Model: {model} ({iterations} calls)')
+        self.stdout.write(f'Before: {before:.2f} us/call')
+        self.stdout.write(f'After: {after:.2f} us/call')
+        self.stdout.write(self.style.SUCCESS(
+            f'Speedup: {before / after:.2f}x'))
@@ -0,0 +1,24 @@
+"""
+Django command to load tokenizers into the local BPE store.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from openai_app.tokens import preload_encodings
+
+
+class Command(BaseCommand):
+    """
+    Django command to load encodings, storing them in TIKTOKEN_CACHE_DIR.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('encodings', nargs='*')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        names = options['encodings'] or settings.TIKTOKEN_PRELOAD_ENCODINGS
+        for name in names:
+            preload_encodings([name])
+            self.stdout.write(f'Loaded {name}')
+
+        self.stdout.write(self.style.SUCCESS('Tokenizers loaded!'))
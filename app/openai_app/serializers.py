@@ -1,6 +1,8 @@
 """
 Serializers for the OpenAI app
 """
+from core.models import Conversation
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -38,6 +40,21 @@ class ChatCompletionRequestSerializer(serializers.Serializer):
     """Serializer for ChatCompletionAPIView requests"""
     model = serializers.CharField(required=True)
     messages = MessageSerializer(many=True, required=True)
+    max_tokens = serializers.IntegerField(required=False, min_value=1)
+    stream = serializers.BooleanField(required=False, default=False)
+    temperature = serializers.FloatField(
+        required=False, min_value=0, max_value=2)
+    top_p = serializers.FloatField(required=False, min_value=0, max_value=1)
+    stop = serializers.ListField(
+        child=serializers.CharField(trim_whitespace=False),
+        required=False,
+        max_length=4,
+    )
+    presence_penalty = serializers.FloatField(
+        required=False, min_value=-2, max_value=2)
+    frequency_penalty = serializers.FloatField(
+        required=False, min_value=-2, max_value=2)
+    cache = serializers.BooleanField(required=False, default=False)
 
 
 class ChoiceSerializer(serializers.Serializer):
@@ -62,3 +79,69 @@ class ChatCompletionResponseSerializer(serializers.Serializer):
     model = serializers.CharField()
     choices = ChoiceSerializer(many=True)
     usage = UsageSerializer()
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """Serializer for the Conversation model"""
+    messages = MessageSerializer(many=True, required=False)
+
+    class Meta:
+        model = Conversation
+        fields = (
+            'id',
+            'model',
+            'messages',
+            'num_tokens',
+            'created_at',
+            'updated_at',
+        )
+        read_only_fields = ('id', 'num_tokens', 'created_at', 'updated_at')
+
+    def create(self, validated_data):
+        """Create and return a Conversation."""
+        return Conversation.objects.create(**validated_data)
+
+
+class ConversationMessagesSerializer(serializers.Serializer):
+    """Serializer for new messages of a Conversation"""
+    messages = MessageSerializer(many=True, required=True)
+    max_tokens = serializers.IntegerField(required=False, min_value=1)
+
+
+class TokenCountItemSerializer(serializers.Serializer):
+    """Serializer for items in TokenCountRequestSerializer"""
+    model = serializers.CharField(required=True)
+    messages = serializers.ListField(
+        child=serializers.DictField(
+            child=serializers.CharField(
+                allow_blank=True, trim_whitespace=False),
+        ),
+        required=False,
+    )
+    text = serializers.CharField(
+        required=False, allow_blank=True, trim_whitespace=False)
+
+    def validate(self, attrs):
+        """Validate that the item has either messages or a text."""
+        if ('messages' in attrs) == ('text' in attrs):
+            raise serializers.ValidationError(
+                'Provide either messages or text.')
+
+        return attrs
+
+
+class TokenCountRequestSerializer(serializers.Serializer):
+    """Serializer for TokenCountAPIView requests"""
+    items = TokenCountItemSerializer(
+        many=True, max_length=settings.TOKEN_COUNT_MAX_ITEMS)
+
+
+class TokenCountSerializer(serializers.Serializer):
+    """Serializer for counts in TokenCountResponseSerializer"""
+    tokens = serializers.IntegerField()
+
+
+class TokenCountResponseSerializer(serializers.Serializer):
+    """Serializer for TokenCountAPIView responses"""
+    items = TokenCountSerializer(many=True)
+    total = serializers.IntegerField()
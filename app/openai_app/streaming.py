@@ -0,0 +1,77 @@
+"""
+Server-sent events for streamed chat completions.
+"""
+import json
+
+from openai_app.tokens import get_profile
+
+# Last event of a stream, as sent by the OpenAI API.
+DONE = 'data: [DONE]\n\n'
+
+
+def format_event(data):
+    """Return a chunk of a streamed completion as a server-sent event."""
+    return f'data: {json.dumps(data)}\n\n'
+
+
+def format_error(message):
+    """Return an error ending a stream as a server-sent event."""
+    return format_event({'error': {'message': message}})
+
+
+class EventStream:
+    """
+    Events of a streamed completion. on_close is called once, when the
+    events end or the response is closed, even before the first event is
+    read, so that a stream is always paid for and its resources freed.
+    """
+
+    def __init__(self, events, on_close):
+        self._events = events
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            yield from self._events
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the events and call on_close, once."""
+        if self._closed:
+            return
+
+        self._closed = True
+        self._events.close()
+        self._on_close()
+
+
+class CompletionMeter:
+    """
+    Running cost of a streamed chat completion. Its completion tokens are
+    counted from the content of the deltas as they arrive, as streamed
+    completions report no usage.
+    """
+
+    def __init__(self, model, input_cost, limit):
+        self.encoding = get_profile(model).encoding
+        self.input_cost = input_cost
+        self.limit = limit
+        self.completion_tokens = 0
+        self.request_id = ''
+
+    @property
+    def cost(self):
+        """Return the cost of the completion so far."""
+        return self.input_cost + self.completion_tokens
+
+    def add(self, chunk):
+        """Count the tokens of a chunk. Return False once over the limit."""
+        self.request_id = chunk.get('id') or self.request_id
+        for choice in chunk.get('choices') or []:
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                self.completion_tokens += len(self.encoding.encode(content))
+
+        return self.cost <= self.limit
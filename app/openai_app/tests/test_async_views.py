@@ -0,0 +1,203 @@
+"""
+Tests for the async views of the OpenAI API.
+"""
+import json
+from unittest.mock import (
+    AsyncMock,
+    patch,
+)
+
+from core.bulkhead import Bulkhead
+from core.models import Balance
+from django.contrib.auth import get_user_model
+from django.test import (
+    AsyncRequestFactory,
+    TestCase,
+)
+from openai_app import tokens
+from openai_app.async_views import (
+    AsyncChatCompletionAPIView,
+    AsyncModelAPIView,
+)
+from openai_app.catalog import model_catalog
+from openai_app.completion_cache import completion_cache
+from openai_app.tests.test_catalog import create_model_list
+from openai_app.tests.test_chat_completion_api import create_chunks
+from openai_app.tests.test_conversation_api import create_completion
+from openai_app.tests.test_tokens import FakeEncoding
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+PAYLOAD = {
+    'model': 'gpt-4-0613',
+    'messages': [{'role': 'user', 'content': 'Hello there'}],
+}
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+async def stream(chunks):
+    """
+    Helper function to stream chunks like the async OpenAI API.
+    """
+    for chunk in chunks:
+        yield chunk
+
+
+@patch('openai_app.tokens.tiktoken.encoding_for_model',
+       return_value=FakeEncoding())
+class AsyncViewTests(TestCase):
+    """Test requests to the async views."""
+
+    def setUp(self):
+        """Create a User with a Balance and an Auth token for testing."""
+        tokens._profiles.clear()
+        completion_cache.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+        self.token = Token.objects.create(user=self.user)
+        self.factory = AsyncRequestFactory()
+        # The upstream sessions would outlive the event loop of the test.
+        patcher = patch('openai_app.async_views.async_upstream_sessions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, view, payload):
+        """Post a payload to an async view as the User."""
+        request = self.factory.post(
+            '/', json.dumps(payload), content_type='application/json',
+            headers={'Authorization': f'Token {self.token.key}'})
+        return view.as_view()(request)
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_chat_completion(self, patched_acreate,
+                                   patched_encoding_for_model):
+        """Test a chat completion is awaited and paid for."""
+        patched_acreate.return_value = create_completion('Hi there', 2)
+
+        res = await self.post(AsyncChatCompletionAPIView, PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content)['id'], 'chatcmpl-123')
+        self.assertEqual(patched_acreate.call_args.kwargs['max_tokens'], 91)
+        balance = await Balance.objects.aget(user=self.user)
+        self.assertEqual(balance.balance, 100 - 9 - 2)
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_cached_completion(self, patched_acreate,
+                                     patched_encoding_for_model):
+        """Test a deterministic completion is reused and charged."""
+        patched_acreate.return_value = create_completion('Hi there', 2)
+        payload = {**PAYLOAD, 'temperature': 0, 'cache': True}
+
+        await self.post(AsyncChatCompletionAPIView, payload)
+        res = await self.post(AsyncChatCompletionAPIView, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(json.loads(res.content)['id'], 'chatcmpl-123')
+        patched_acreate.assert_awaited_once()
+        self.assertNotIn('cache', patched_acreate.call_args.kwargs)
+        balance = await Balance.objects.aget(user=self.user)
+        # The cached completion costs its upstream usage.
+        self.assertEqual(balance.balance, 100 - 9 - 2 - 17)
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_stream(self, patched_acreate, patched_encoding_for_model):
+        """Test a streamed completion is sent and paid for by its deltas."""
+        patched_acreate.return_value = stream(create_chunks('Hi', ' there'))
+
+        res = await self.post(
+            AsyncChatCompletionAPIView, {**PAYLOAD, 'stream': True})
+        content = b''.join([chunk async for chunk in res.streaming_content])
+
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        self.assertTrue(content.endswith(b'data: [DONE]\n\n'))
+        balance = await Balance.objects.aget(user=self.user)
+        self.assertEqual(balance.balance, 100 - 9 - 2)
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_chat_completion_insufficient_balance(
+            self, patched_acreate, patched_encoding_for_model):
+        """Test a request whose input exceeds the Balance is refused."""
+        payload = {**PAYLOAD, 'messages': PAYLOAD['messages'] * 20}
+
+        res = await self.post(AsyncChatCompletionAPIView, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_402_PAYMENT_REQUIRED)
+        patched_acreate.assert_not_awaited()
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_chat_completion_queue_full(
+            self, patched_acreate, patched_encoding_for_model):
+        """Test a User with a full queue is refused at once."""
+        bulkhead = Bulkhead(
+            max_concurrent=10, max_per_key=1, max_queued_per_key=0)
+        bulkhead.acquire(self.user.id)
+
+        with patch('openai_app.views.upstream_bulkhead', bulkhead):
+            res = await self.post(AsyncChatCompletionAPIView, PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        patched_acreate.assert_not_awaited()
+        balance = await Balance.objects.aget(user=self.user)
+        self.assertEqual(balance.balance, 100)
+
+    @patch('openai_app.async_views.openai.ChatCompletion.acreate',
+           new_callable=AsyncMock)
+    async def test_stream_releases_slot(self, patched_acreate,
+                                        patched_encoding_for_model):
+        """Test a streamed completion gives back its slot once sent."""
+        patched_acreate.return_value = stream(create_chunks('Hi'))
+        bulkhead = Bulkhead(max_concurrent=10, max_per_key=1)
+
+        with patch('openai_app.views.upstream_bulkhead', bulkhead):
+            res = await self.post(
+                AsyncChatCompletionAPIView, {**PAYLOAD, 'stream': True})
+            self.assertEqual(bulkhead.stats()['active'], 1)
+            [chunk async for chunk in res.streaming_content]
+
+        self.assertEqual(bulkhead.stats()['active'], 0)
+
+    async def test_chat_completion_invalid(self, patched_encoding_for_model):
+        """Test an invalid request is refused before the upstream call."""
+        res = await self.post(AsyncChatCompletionAPIView, {'model': 'gpt-4'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_auth_required(self, patched_encoding_for_model):
+        """Test authentication is required for the async views."""
+        request = self.factory.get('/')
+
+        res = await AsyncModelAPIView.as_view()(request, model='gpt-4')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch('openai_app.catalog.openai.Model.list')
+    async def test_retrieve_model(self, patched_list,
+                                  patched_encoding_for_model):
+        """Test a model is retrieved from the model catalog."""
+        patched_list.return_value = create_model_list('gpt-4')
+        model_catalog.clear()
+        request = self.factory.get(
+            '/', headers={'Authorization': f'Token {self.token.key}'})
+
+        res = await AsyncModelAPIView.as_view()(request, model='gpt-4')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content)['id'], 'gpt-4')
@@ -0,0 +1,174 @@
+"""
+Tests for the model catalog.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    override_settings,
+    TestCase,
+)
+from django.urls import reverse
+from openai_app.catalog import (
+    model_catalog,
+    ModelCatalog,
+)
+from openai_app.upstream import upstream_calls
+from rest_framework import status
+from rest_framework.test import APIClient
+
+MODEL_LIST_URL = reverse('openai:model-list')
+
+
+def model_url(model):
+    """
+    Helper function to return a model's detail URL.
+    """
+    return reverse('openai:model-detail', args=[model])
+
+
+def create_model(model):
+    """
+    Helper function to return an upstream model.
+    """
+    return {
+        'id': model,
+        'object': 'model',
+        'owned_by': 'openai',
+        'permission': [],
+    }
+
+
+def create_model_list(*models):
+    """
+    Helper function to return an upstream list of models.
+    """
+    return {
+        'object': 'list',
+        'data': [create_model(model) for model in models],
+    }
+
+
+def wait_for_refresh():
+    """
+    Helper function to wait for the background refresh of the catalog.
+    """
+    for thread in threading.enumerate():
+        if thread.name == 'model-catalog':
+            thread.join()
+
+
+@patch('openai_app.catalog.openai.Model.retrieve')
+@patch('openai_app.catalog.openai.Model.list')
+class ModelCatalogTests(TestCase):
+    """Tests for caching the models of the OpenAI API."""
+
+    def setUp(self):
+        model_catalog.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_cached(self, patched_list, patched_retrieve):
+        """Test the models are listed upstream once."""
+        patched_list.return_value = create_model_list('gpt-4')
+
+        self.client.get(MODEL_LIST_URL)
+        res = self.client.get(MODEL_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['data'][0]['id'], 'gpt-4')
+        patched_list.assert_called_once()
+
+    def test_detail_from_list(self, patched_list, patched_retrieve):
+        """Test a listed model is served from the same listing."""
+        patched_list.return_value = create_model_list('gpt-4', 'gpt-3.5')
+
+        res = self.client.get(model_url('gpt-3.5'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], 'gpt-3.5')
+        patched_retrieve.assert_not_called()
+
+    def test_unlisted_model_retrieved(self, patched_list, patched_retrieve):
+        """Test a model missing from the listing is retrieved once."""
+        patched_list.return_value = create_model_list('gpt-4')
+        patched_retrieve.return_value = create_model('ft-model')
+
+        self.client.get(model_url('ft-model'))
+        res = self.client.get(model_url('ft-model'))
+
+        self.assertEqual(res.data['id'], 'ft-model')
+        patched_retrieve.assert_called_once_with('ft-model')
+
+    def test_new_model_retrieved_once(self, patched_list, patched_retrieve):
+        """Test concurrent requests for a new model share one call."""
+        catalog = ModelCatalog()
+        patched_list.return_value = create_model_list('gpt-4')
+        catalog.list()
+        release = threading.Event()
+
+        def retrieve(model):
+            release.wait(5)
+            return create_model(model)
+
+        patched_retrieve.side_effect = retrieve
+        shared = upstream_calls.stats()['shared']
+        with ThreadPoolExecutor(8) as executor:
+            futures = [
+                executor.submit(catalog.retrieve, 'gpt-5') for _ in range(8)
+            ]
+            while upstream_calls.stats()['shared'] < shared + 7:
+                release.wait(0.001)
+            release.set()
+            models = [future.result()['id'] for future in futures]
+
+        self.assertEqual(models, ['gpt-5'] * 8)
+        patched_retrieve.assert_called_once_with('gpt-5')
+
+    @override_settings(OPENAI_MODEL_CACHE_TTL=0)
+    def test_stale_served_while_refreshing(self, patched_list,
+                                           patched_retrieve):
+        """Test stale models are served while one refresh lists them."""
+        catalog = ModelCatalog()
+        patched_list.return_value = create_model_list('gpt-4')
+        catalog.list()
+        refreshing = threading.Event()
+        release = threading.Event()
+
+        def list_models():
+            refreshing.set()
+            release.wait(5)
+            return create_model_list('gpt-4', 'gpt-4-32k')
+
+        patched_list.side_effect = list_models
+        stale = [catalog.list() for _ in range(3)]
+        refreshing.wait(5)
+        release.set()
+        wait_for_refresh()
+
+        self.assertEqual([len(data['data']) for data in stale], [1, 1, 1])
+        self.assertEqual(patched_list.call_count, 2)
+        self.assertEqual(catalog.stats()['refreshes'], 2)
+        self.assertEqual(catalog.stats()['models'], 2)
+
+    @override_settings(OPENAI_MODEL_CACHE_TTL=0)
+    def test_refresh_error_keeps_stale(self, patched_list, patched_retrieve):
+        """Test a failed refresh keeps serving the stale models."""
+        catalog = ModelCatalog()
+        patched_list.return_value = create_model_list('gpt-4')
+        catalog.list()
+
+        patched_list.side_effect = Exception('Upstream error')
+        with self.assertLogs('openai_app.catalog'):
+            catalog.list()
+            wait_for_refresh()
+
+        self.assertEqual(catalog.retrieve('gpt-4')['id'], 'gpt-4')
+        self.assertEqual(catalog.stats()['refresh_errors'], 1)
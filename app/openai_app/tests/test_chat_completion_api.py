@@ -0,0 +1,374 @@
+"""
+Tests for the chat completion API.
+"""
+import json
+from unittest.mock import patch
+
+import openai
+from core.bulkhead import Bulkhead
+from core.circuitbreaker import CircuitBreaker
+from core.models import (
+    Balance,
+    UsageRecord,
+)
+from django.contrib.auth import get_user_model
+from django.test import (
+    override_settings,
+    TestCase,
+)
+from django.urls import reverse
+from openai_app import tokens
+from openai_app.completion_cache import completion_cache
+from openai_app.tests.test_conversation_api import create_completion
+from openai_app.tests.test_tokens import FakeEncoding
+from rest_framework import status
+from rest_framework.test import APIClient
+
+CHAT_COMPLETION_URL = reverse('openai:chat-completion')
+
+PAYLOAD = {
+    'model': 'gpt-4-0613',
+    'messages': [{'role': 'user', 'content': 'Hello there'}],
+}
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+def create_chunks(*contents):
+    """
+    Helper function to return the chunks of a streamed chat completion.
+    """
+    deltas = [{'role': 'assistant'}] + [
+        {'content': content} for content in contents]
+    chunks = [{
+        'id': 'chatcmpl-123',
+        'object': 'chat.completion.chunk',
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}],
+    } for delta in deltas]
+    chunks.append({
+        'id': 'chatcmpl-123',
+        'object': 'chat.completion.chunk',
+        'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+    })
+
+    return chunks
+
+
+def read_events(res):
+    """
+    Helper function to return the data of the events of a streamed response.
+    """
+    events = b''.join(res.streaming_content).decode().split('\n\n')
+
+    return [event[len('data: '):] for event in events if event]
+
+
+@patch('openai_app.views.openai.ChatCompletion.create')
+@patch('openai_app.tokens.tiktoken.encoding_for_model',
+       return_value=FakeEncoding())
+class ChatCompletionApiTests(TestCase):
+    """Test chat completion API requests."""
+
+    def setUp(self):
+        """Create client for testing."""
+        tokens._profiles.clear()
+        completion_cache.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def set_balance(self, balance):
+        """Set the Balance of the User."""
+        self.user.balance.balance = balance
+        self.user.balance.save()
+
+    def test_chat_completion(self, patched_encoding_for_model,
+                             patched_create):
+        """Test the input is counted exactly when the Balance is close."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+
+        res = self.client.post(CHAT_COMPLETION_URL, PAYLOAD, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.balance.refresh_from_db()
+        # 3 per message + 'user' + 'Hello there' + 3 for the reply
+        self.assertEqual(self.user.balance.balance, 100 - 9 - 2)
+        self.assertEqual(patched_create.call_args.kwargs['max_tokens'], 91)
+
+        record = UsageRecord.objects.get(user=self.user)
+        self.assertEqual(record.model, 'gpt-4-0613')
+        self.assertEqual(record.prompt_tokens, 9)
+        self.assertEqual(record.completion_tokens, 2)
+        self.assertEqual(record.cost, 11)
+        self.assertEqual(record.request_id, 'chatcmpl-123')
+
+    def test_balance_held_during_call(self, patched_encoding_for_model,
+                                      patched_create):
+        """Test the most the call can cost is held while it is made."""
+        balances = []
+
+        def create(**params):
+            balances.append(Balance.objects.get(user=self.user).balance)
+            return create_completion('Hi there', 2)
+
+        patched_create.side_effect = create
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'max_tokens': 10}
+
+        res = self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(balances, [100 - 9 - 10])
+        self.assertEqual(patched_create.call_args.kwargs['max_tokens'], 10)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 9 - 2)
+
+    def test_balance_released_on_error(self, patched_encoding_for_model,
+                                       patched_create):
+        """Test the hold is given back when the upstream call fails."""
+        patched_create.side_effect = Exception('Upstream error')
+        self.set_balance(100)
+
+        res = self.client.post(CHAT_COMPLETION_URL, PAYLOAD, format='json')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100)
+        self.assertFalse(UsageRecord.objects.exists())
+
+    def test_chat_completion_large_balance(self, patched_encoding_for_model,
+                                           patched_create):
+        """Test the input is charged from the usage when the Balance is far
+        above any possible cost."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100000)
+
+        with patch('openai_app.views.num_tokens_from_messages') as patched:
+            res = self.client.post(
+                CHAT_COMPLETION_URL, PAYLOAD, format='json')
+            patched.assert_not_called()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100000 - 15 - 2)
+
+    def test_chat_completion_insufficient_balance(
+            self, patched_encoding_for_model, patched_create):
+        """Test a request whose input exceeds the Balance is refused."""
+        self.set_balance(5)
+
+        with patch('openai_app.views.num_tokens_from_messages') as patched:
+            res = self.client.post(
+                CHAT_COMPLETION_URL, PAYLOAD, format='json')
+            patched.assert_not_called()
+
+        self.assertEqual(res.status_code, status.HTTP_402_PAYMENT_REQUIRED)
+        patched_create.assert_not_called()
+
+    def test_stream(self, patched_encoding_for_model, patched_create):
+        """Test a streamed completion is sent and paid for by its deltas."""
+        patched_create.return_value = iter(create_chunks('Hi', ' there'))
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'stream': True}
+
+        res = self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        events = read_events(res)
+        self.assertEqual(len(events), 5)
+        self.assertEqual(
+            json.loads(events[1])['choices'][0]['delta']['content'], 'Hi')
+        self.assertEqual(events[-1], '[DONE]')
+        self.assertTrue(patched_create.call_args.kwargs['stream'])
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 9 - 2)
+
+        record = UsageRecord.objects.get(user=self.user)
+        self.assertEqual(record.completion_tokens, 2)
+        self.assertEqual(record.request_id, 'chatcmpl-123')
+
+    def test_stream_cut_off(self, patched_encoding_for_model, patched_create):
+        """Test a stream is cut off once it costs more than the Balance."""
+        patched_create.return_value = iter(
+            create_chunks('a', ' b', ' c', ' d', ' e'))
+        self.set_balance(12)
+        payload = {**PAYLOAD, 'stream': True}
+
+        res = self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        events = read_events(res)
+        # The role and 3 tokens fit in the Balance, the 4th does not.
+        self.assertEqual(len(events), 5)
+        self.assertEqual(json.loads(events[-1])['error']['message'],
+                         'Insufficient balance.')
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 0)
+
+    def test_stream_disconnect(self, patched_encoding_for_model,
+                               patched_create):
+        """Test a stream closed by the client is paid for until then."""
+        patched_create.return_value = iter(create_chunks('Hi', ' there'))
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'stream': True}
+
+        res = self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+        content = iter(res.streaming_content)
+        next(content)
+        next(content)
+        res.close()
+
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 9 - 1)
+
+    def test_sampling_params_forwarded(self, patched_encoding_for_model,
+                                       patched_create):
+        """Test sampling parameters are sent upstream."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'temperature': 0.2, 'stop': ['\n']}
+
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.assertEqual(patched_create.call_args.kwargs['temperature'], 0.2)
+        self.assertEqual(patched_create.call_args.kwargs['stop'], ['\n'])
+        self.assertNotIn('cache', patched_create.call_args.kwargs)
+
+    def test_cached_completion(self, patched_encoding_for_model,
+                               patched_create):
+        """Test a deterministic completion is reused and charged in full."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'temperature': 0, 'cache': True}
+
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+        res = self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data['id'], 'chatcmpl-123')
+        patched_create.assert_called_once()
+        self.user.balance.refresh_from_db()
+        # The cached completion costs its upstream usage.
+        self.assertEqual(self.user.balance.balance, 100 - 11 - 17)
+
+    @override_settings(CHAT_COMPLETION_CACHE_BILLING='discount',
+                       CHAT_COMPLETION_CACHE_DISCOUNT=0.5)
+    def test_cached_completion_discount(self, patched_encoding_for_model,
+                                        patched_create):
+        """Test cached completions can be charged at a discount."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'temperature': 0, 'cache': True}
+
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 11 - 9)
+
+    @override_settings(CHAT_COMPLETION_CACHE_BILLING='free')
+    def test_cached_completion_free(self, patched_encoding_for_model,
+                                    patched_create):
+        """Test cached completions can be free."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'temperature': 0, 'cache': True}
+
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 11)
+
+    def test_nondeterministic_not_cached(self, patched_encoding_for_model,
+                                         patched_create):
+        """Test completions are not cached unless the temperature is 0."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'temperature': 1, 'cache': True}
+
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+        self.client.post(CHAT_COMPLETION_URL, payload, format='json')
+
+        self.assertEqual(patched_create.call_count, 2)
+
+    @override_settings(OPENAI_QUEUE_TIMEOUT=30)
+    def test_concurrency_limited(self, patched_encoding_for_model,
+                                 patched_create):
+        """Test a User at the concurrency cap is refused without waiting."""
+        bulkhead = Bulkhead(max_concurrent=10, max_per_key=1)
+        bulkhead.acquire(self.user.id)
+        self.set_balance(100)
+
+        with patch('openai_app.views.upstream_bulkhead', bulkhead):
+            res = self.client.post(
+                CHAT_COMPLETION_URL, PAYLOAD, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        patched_create.assert_not_called()
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100)
+
+    def test_stream_closed_unread(self, patched_encoding_for_model,
+                                  patched_create):
+        """Test a stream closed before it is read still frees its slot."""
+        patched_create.return_value = iter(create_chunks('Hi'))
+        bulkhead = Bulkhead(max_concurrent=10, max_per_key=1)
+        self.set_balance(100)
+        payload = {**PAYLOAD, 'stream': True}
+
+        with patch('openai_app.views.upstream_bulkhead', bulkhead):
+            res = self.client.post(
+                CHAT_COMPLETION_URL, payload, format='json')
+            res.close()
+
+        self.assertEqual(bulkhead.stats()['active'], 0)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 9)
+
+    @patch('openai_app.upstream.time.sleep')
+    def test_retried_once_charged(self, patched_sleep,
+                                  patched_encoding_for_model, patched_create):
+        """Test a retried completion is charged once."""
+        patched_create.side_effect = [
+            openai.error.RateLimitError('Rate limited'),
+            create_completion('Hi there', 2),
+        ]
+        self.set_balance(100)
+
+        res = self.client.post(CHAT_COMPLETION_URL, PAYLOAD, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(patched_create.call_count, 2)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100 - 9 - 2)
+        self.assertEqual(UsageRecord.objects.filter(user=self.user).count(), 1)
+
+    def test_circuit_open(self, patched_encoding_for_model, patched_create):
+        """Test requests fail fast while the upstream API is down."""
+        breaker = CircuitBreaker(
+            error_rate=0.5, min_calls=1, window=30, reset_timeout=30)
+        breaker.record(True)
+        self.set_balance(100)
+
+        with patch('openai_app.upstream.upstream_breaker', breaker):
+            res = self.client.post(
+                CHAT_COMPLETION_URL, PAYLOAD, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+        patched_create.assert_not_called()
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100)
@@ -0,0 +1,51 @@
+"""
+Tests for the completion cache.
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from openai_app.completion_cache import CompletionCache
+
+
+class CompletionCacheTests(SimpleTestCase):
+    """Tests for CompletionCache."""
+
+    def test_key_canonical(self):
+        """Test the key does not depend on the order of the parameters."""
+        messages = [{'role': 'user', 'content': 'Hi'}]
+
+        self.assertEqual(
+            CompletionCache.make_key(
+                'gpt-4', messages, {'temperature': 0, 'top_p': 1}),
+            CompletionCache.make_key(
+                'gpt-4', messages, {'top_p': 1, 'temperature': 0}),
+        )
+        self.assertNotEqual(
+            CompletionCache.make_key('gpt-4', messages, {}),
+            CompletionCache.make_key('gpt-4-0613', messages, {}),
+        )
+
+    def test_size_bounded(self):
+        """Test the least recently used completions are evicted."""
+        cache = CompletionCache(max_bytes=50, ttl=60)
+
+        cache.set('a', {'text': 'a' * 10})
+        cache.set('b', {'text': 'b' * 10})
+        cache.get('a')
+        cache.set('c', {'text': 'c' * 10})
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], 50)
+
+    def test_ttl(self):
+        """Test completions expire after the TTL."""
+        cache = CompletionCache(max_bytes=1000, ttl=60)
+        cache.set('a', {'text': 'a'})
+
+        with patch('openai_app.completion_cache.time.monotonic',
+                   return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertEqual(cache.stats()['entries'], 0)
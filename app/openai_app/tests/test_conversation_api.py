@@ -0,0 +1,149 @@
+"""
+Tests for the Conversation API.
+"""
+from unittest.mock import patch
+
+from core.models import Conversation
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from openai_app import tokens
+from openai_app.tests.test_tokens import FakeEncoding
+from rest_framework import status
+from rest_framework.test import APIClient
+
+CONVERSATIONS_URL = reverse('openai:conversation-list')
+
+
+def messages_url(conversation_id):
+    """
+    Helper function to return a Conversation's messages URL.
+    """
+    return reverse('openai:conversation-messages', args=[conversation_id])
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+def create_completion(content, completion_tokens):
+    """
+    Helper function to return an upstream chat completion.
+    """
+    return {
+        'id': 'chatcmpl-123',
+        'object': 'chat.completion',
+        'created': 1677652288,
+        'model': 'gpt-4-0613',
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {
+            'prompt_tokens': 15,
+            'completion_tokens': completion_tokens,
+            'total_tokens': 15 + completion_tokens,
+        },
+    }
+
+
+@patch('openai_app.tokens.tiktoken.encoding_for_model',
+       return_value=FakeEncoding())
+class ConversationApiTests(TestCase):
+    """Test Conversation API requests."""
+
+    def setUp(self):
+        """Create client for testing."""
+        tokens._profiles.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_conversation(self):
+        """Create a Conversation with a system message through the API."""
+        payload = {
+            'model': 'gpt-4-0613',
+            'messages': [{'role': 'system', 'content': 'Be brief.'}],
+        }
+        return self.client.post(CONVERSATIONS_URL, payload, format='json')
+
+    def test_create_conversation(self, patched_encoding_for_model):
+        """Test creating a Conversation counts its messages."""
+        res = self.create_conversation()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        conversation = Conversation.objects.get(id=res.data['id'])
+        self.assertEqual(conversation.user, self.user)
+        # 3 per message + 'system' + 'Be brief.'
+        self.assertEqual(conversation.num_tokens, 6)
+
+    def test_create_conversation_unknown_model(
+            self, patched_encoding_for_model):
+        """Test creating a Conversation for an unknown model fails."""
+        payload = {'model': 'davinci'}
+        res = self.client.post(CONVERSATIONS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Conversation.objects.exists())
+
+    @patch('openai_app.views.openai.ChatCompletion.create')
+    def test_post_messages(self, patched_create, patched_encoding_for_model):
+        """Test posting messages sends the history and counts the delta."""
+        patched_create.return_value = create_completion('Hi there', 2)
+        conversation_id = self.create_conversation().data['id']
+        payload = {'messages': [{'role': 'user', 'content': 'Hello there'}]}
+
+        res = self.client.post(
+            messages_url(conversation_id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        sent = patched_create.call_args.kwargs['messages']
+        self.assertEqual([m['role'] for m in sent], ['system', 'user'])
+        self.user.balance.refresh_from_db()
+        # 6 stored + 6 new + 3 for the reply, then 2 completion tokens
+        self.assertEqual(self.user.balance.balance, 100 - 17)
+        conversation = Conversation.objects.get(id=conversation_id)
+        self.assertEqual(len(conversation.messages), 3)
+        self.assertEqual(conversation.messages[-1]['content'], 'Hi there')
+        self.assertEqual(conversation.num_tokens, 18)
+
+    @patch('openai_app.views.openai.ChatCompletion.create')
+    def test_post_messages_insufficient_balance(self, patched_create,
+                                                patched_encoding_for_model):
+        """Test posting messages without enough Balance is refused."""
+        conversation_id = self.create_conversation().data['id']
+        self.user.balance.balance = 10
+        self.user.balance.save()
+        payload = {'messages': [{'role': 'user', 'content': 'Hello there'}]}
+
+        res = self.client.post(
+            messages_url(conversation_id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_402_PAYMENT_REQUIRED)
+        patched_create.assert_not_called()
+
+    def test_other_user_conversation(self, patched_encoding_for_model):
+        """Test another User's Conversation is not found."""
+        conversation_id = self.create_conversation().data['id']
+        user2 = create_user(
+            email='test2@example.com',
+            password='testpass456',
+            name='Test Name 2',
+        )
+        self.client.force_authenticate(user=user2)
+        payload = {'messages': [{'role': 'user', 'content': 'Hello there'}]}
+
+        res = self.client.post(
+            messages_url(conversation_id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,76 @@
+"""
+Tests for the token count API.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from openai_app import tokens
+from openai_app.tests.test_tokens import FakeEncoding
+from rest_framework import status
+from rest_framework.test import APIClient
+
+TOKEN_COUNT_URL = reverse('openai:token-count')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+@patch('openai_app.tokens.tiktoken.encoding_for_model',
+       return_value=FakeEncoding())
+class TokenCountApiTests(TestCase):
+    """Test token count API requests."""
+
+    def setUp(self):
+        """Create client for testing."""
+        tokens._profiles.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.user.balance.balance = 100
+        self.user.balance.save()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_count_tokens(self, patched_encoding_for_model):
+        """Test counting conversations and texts of several models."""
+        payload = {'items': [
+            {
+                'model': 'gpt-4-0613',
+                'messages': [{'role': 'user', 'content': 'Hello there'}],
+            },
+            {'model': 'gpt-3.5-turbo', 'text': 'one two three'},
+            {'model': 'gpt-4-0613', 'text': '  one  '},
+        ]}
+
+        res = self.client.post(TOKEN_COUNT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['tokens'] for item in res.data['items']], [9, 3, 1])
+        self.assertEqual(res.data['total'], 13)
+        self.user.balance.refresh_from_db()
+        self.assertEqual(self.user.balance.balance, 100)
+
+    def test_count_tokens_unknown_model(self, patched_encoding_for_model):
+        """Test counting tokens for an unknown model fails."""
+        payload = {'items': [{'model': 'davinci', 'text': 'Hello'}]}
+
+        res = self.client.post(TOKEN_COUNT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_count_tokens_invalid_item(self, patched_encoding_for_model):
+        """Test an item needs either messages or a text."""
+        payload = {'items': [{'model': 'gpt-4-0613'}]}
+
+        res = self.client.post(TOKEN_COUNT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
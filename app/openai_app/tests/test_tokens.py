@@ -0,0 +1,173 @@
+"""
+Tests for token counting.
+"""
+from unittest.mock import patch
+
+from django.test import (
+    override_settings,
+    SimpleTestCase,
+)
+from openai_app import tokens
+
+
+class FakeEncoding:
+    """Encoding that turns every word into one token."""
+    name = 'fake_base'
+
+    def encode(self, text):
+        return text.split()
+
+    def token_byte_values(self):
+        return [b'a', b'longest-word']
+
+
+@patch('openai_app.tokens.tiktoken.encoding_for_model',
+       return_value=FakeEncoding())
+class TokenizerRegistryTests(SimpleTestCase):
+    """Tests for the tokenizer registry."""
+
+    def setUp(self):
+        tokens._profiles.clear()
+
+    def test_profile_resolved_once(self, patched_encoding_for_model):
+        """Test a model's profile is only resolved on first use."""
+        first = tokens.get_profile('gpt-4-0613')
+        second = tokens.get_profile('gpt-4-0613')
+
+        self.assertIs(first, second)
+        patched_encoding_for_model.assert_called_once_with('gpt-4-0613')
+
+    def test_alias_uses_pinned_profile(self, patched_encoding_for_model):
+        """Test a model alias is counted as its pinned snapshot."""
+        profile = tokens.get_profile('gpt-3.5-turbo')
+
+        self.assertEqual(profile.tokens_per_message, 3)
+        self.assertEqual(profile.tokens_per_name, 1)
+        patched_encoding_for_model.assert_called_once_with(
+            'gpt-3.5-turbo-0613')
+
+    def test_unknown_model_raises(self, patched_encoding_for_model):
+        """Test an unknown model raises every time without a lookup."""
+        for _ in range(2):
+            with self.assertRaises(NotImplementedError):
+                tokens.get_profile('davinci')
+
+        self.assertIn('davinci', tokens._profiles)
+        patched_encoding_for_model.assert_not_called()
+
+    def test_num_tokens_from_messages(self, patched_encoding_for_model):
+        """Test counting the tokens of a list of messages."""
+        messages = [
+            {'role': 'system', 'content': 'You are helpful.'},
+            {'role': 'user', 'content': 'Hello there!', 'name': 'bob'},
+        ]
+
+        num_tokens = tokens.num_tokens_from_messages(
+            messages, model='gpt-3.5-turbo-0301')
+
+        # 2 messages * 4 + 8 words - 1 for the name + 3 for the reply
+        self.assertEqual(num_tokens, 18)
+
+    def test_estimate_message_tokens(self, patched_encoding_for_model):
+        """Test bounding the tokens of messages from their length."""
+        messages = [{'role': 'user', 'content': 'Hello there'}]
+
+        lower, upper = tokens.estimate_message_tokens(
+            messages, model='gpt-4-0613')
+
+        # 3 per message + 3 for the reply, then tokens of 1 to 12 bytes
+        self.assertEqual(lower, 6 + 1 + 1)
+        self.assertEqual(upper, 6 + 4 + 11)
+        exact = tokens.num_tokens_from_messages(messages, model='gpt-4-0613')
+        self.assertTrue(lower <= exact <= upper)
+
+
+class CountTokensTests(SimpleTestCase):
+    """Tests for batched token counting."""
+
+    def test_count_tokens(self):
+        """Test each text is counted in order."""
+        counts = tokens.count_tokens(FakeEncoding(), ['a b', 'c', 'd e f'])
+
+        self.assertEqual(counts, [2, 1, 3])
+
+    @override_settings(TOKEN_COUNT_PARALLEL_THRESHOLD=0, TOKEN_COUNT_THREADS=3)
+    def test_count_tokens_parallel(self):
+        """Test large batches counted on the pool match a serial count."""
+        texts = [' '.join(['word'] * i) for i in range(50)]
+
+        counts = tokens.count_tokens(FakeEncoding(), texts)
+
+        self.assertEqual(counts, list(range(50)))
+
+
+class TokenCountCacheTests(SimpleTestCase):
+    """Tests for the token count cache."""
+
+    def setUp(self):
+        self.cache = tokens.TokenCountCache(
+            max_bytes=2 * tokens.TokenCountCache.ENTRY_SIZE)
+        self.encoding = FakeEncoding()
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full."""
+        keys = [self.cache.make_key(self.encoding, text) for text in 'abc']
+        self.cache.set(keys[0], 1)
+        self.cache.set(keys[1], 2)
+        self.cache.get(keys[0])
+        self.cache.set(keys[2], 3)
+
+        self.assertEqual(self.cache.get(keys[0]), 1)
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.get(keys[2]), 3)
+        self.assertEqual(self.cache.stats()['hits'], 3)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_key_includes_encoding(self):
+        """Test the same text is cached per encoding."""
+        other = FakeEncoding()
+        other.name = 'other_base'
+
+        self.assertNotEqual(
+            self.cache.make_key(self.encoding, 'text'),
+            self.cache.make_key(other, 'text'),
+        )
+
+    @override_settings(TOKEN_CACHE_MIN_LENGTH=5)
+    def test_count_tokens_uses_cache(self):
+        """Test repeated long texts are only encoded once."""
+        texts = ['a long system prompt', 'hi']
+
+        with patch('openai_app.tokens.token_count_cache', self.cache), \
+                patch.object(self.encoding, 'encode',
+                             wraps=self.encoding.encode) as patched_encode:
+            first = tokens.count_tokens(self.encoding, texts)
+            second = tokens.count_tokens(self.encoding, texts)
+
+        self.assertEqual(first, [4, 1])
+        self.assertEqual(second, first)
+        self.assertEqual(patched_encode.call_count, 3)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+
+@patch('openai_app.tokens.tiktoken.get_encoding')
+class PreloadEncodingsTests(SimpleTestCase):
+    """Tests for preloading encodings."""
+
+    def test_preload_encodings(self, patched_get_encoding):
+        """Test each configured encoding is loaded."""
+        tokens.preload_encodings(['cl100k_base', 'p50k_base'])
+
+        self.assertEqual(patched_get_encoding.call_count, 2)
+        patched_get_encoding.assert_called_with('p50k_base')
+
+    def test_preload_encodings_fail_silently(self, patched_get_encoding):
+        """Test a missing encoding is logged instead of raised."""
+        patched_get_encoding.side_effect = ConnectionError
+
+        with self.assertLogs('openai_app.tokens', level='WARNING'):
+            tokens.preload_encodings(['cl100k_base'], fail_silently=True)
+
+        with self.assertRaises(ConnectionError):
+            tokens.preload_encodings(['cl100k_base'])
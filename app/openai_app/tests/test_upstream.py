@@ -0,0 +1,222 @@
+"""
+Tests for the pooled sessions to the OpenAI API.
+"""
+import asyncio
+import threading
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from unittest.mock import (
+    AsyncMock,
+    Mock,
+    patch,
+)
+
+import openai
+from core.circuitbreaker import (
+    CircuitBreaker,
+    CircuitOpen,
+)
+from django.test import (
+    override_settings,
+    SimpleTestCase,
+)
+from openai_app.upstream import (
+    acall_upstream,
+    AsyncUpstreamSessions,
+    call_upstream,
+    UpstreamSession,
+    upstream_session,
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Handler answering every request on a keep-alive connection."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def create_breaker():
+    """
+    Helper function to return a circuit breaker that opens after 3 calls.
+    """
+    return CircuitBreaker(
+        error_rate=0.5, min_calls=3, window=30, reset_timeout=30)
+
+
+def start_server():
+    """
+    Helper function to start and return a local HTTP server.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+class UpstreamSessionTests(SimpleTestCase):
+    """Tests for the upstream session pool."""
+
+    def test_client_uses_pool(self):
+        """Test the openai client uses the process-wide session."""
+        import openai_app.views  # noqa: F401
+
+        self.assertIs(openai.requestssession, upstream_session)
+
+    def test_connections_reused(self):
+        """Test requests reuse the pooled keep-alive connection."""
+        server = start_server()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        session = UpstreamSession()
+        session.mount('http://', session.adapter)
+        url = f'http://127.0.0.1:{server.server_port}/'
+
+        session.get(url)
+        # The openai client closes its sessions every few minutes.
+        session.close()
+        session.get(url)
+        self.addCleanup(session.shutdown)
+
+        stats = session.stats()
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['reuse_rate'], 0.5)
+
+    @override_settings(OPENAI_CONNECT_TIMEOUT=1, OPENAI_READ_TIMEOUT=30)
+    def test_timeouts(self):
+        """Test requests are sent with the upstream timeouts."""
+        session = UpstreamSession()
+
+        with patch('requests.Session.request') as patched_request:
+            session.request('POST', 'https://api.openai.com', timeout=600)
+
+        self.assertEqual(patched_request.call_args.kwargs['timeout'], (1, 30))
+
+    async def test_async_session_per_loop(self):
+        """Test the async views share one session per event loop."""
+        sessions = AsyncUpstreamSessions()
+
+        session = sessions.get()
+        self.assertIs(sessions.get(), session)
+
+        await sessions.close()
+        self.assertTrue(session.closed)
+
+
+@patch('openai_app.upstream.time.sleep')
+@override_settings(OPENAI_MAX_RETRIES=3, OPENAI_RETRY_BUDGET=10)
+class CallUpstreamTests(SimpleTestCase):
+    """Tests for retrying upstream calls."""
+
+    def setUp(self):
+        patcher = patch('openai_app.upstream.upstream_breaker',
+                        create_breaker())
+        self.breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retryable_error_retried(self, patched_sleep):
+        """Test rate limits and server errors are retried."""
+        func = Mock(side_effect=[
+            openai.error.RateLimitError('Rate limited'),
+            openai.error.APIError('Server error', http_status=502),
+            'result',
+        ])
+
+        self.assertEqual(call_upstream(func, 'arg'), 'result')
+
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(patched_sleep.call_count, 2)
+        # Jittered delays stay below the exponential bound.
+        self.assertLessEqual(patched_sleep.call_args_list[1].args[0], 1)
+
+    def test_retry_after(self, patched_sleep):
+        """Test the delay told by Retry-After is honored."""
+        func = Mock(side_effect=[
+            openai.error.RateLimitError(
+                'Rate limited', headers={'retry-after': '2'}),
+            'result',
+        ])
+
+        call_upstream(func)
+
+        patched_sleep.assert_called_once_with(2.0)
+
+    def test_invalid_request_not_retried(self, patched_sleep):
+        """Test errors that would fail again are raised at once."""
+        func = Mock(side_effect=openai.error.InvalidRequestError(
+            'Invalid', param='messages'))
+
+        with self.assertRaises(openai.error.InvalidRequestError):
+            call_upstream(func)
+
+        func.assert_called_once()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    @override_settings(OPENAI_RETRY_BUDGET=1)
+    def test_budget(self, patched_sleep):
+        """Test a call is not retried past the retry budget."""
+        func = Mock(side_effect=openai.error.RateLimitError(
+            'Rate limited', headers={'retry-after': '5'}))
+
+        with self.assertRaises(openai.error.RateLimitError):
+            call_upstream(func)
+
+        func.assert_called_once()
+
+    def test_circuit_opens(self, patched_sleep):
+        """Test calls fail fast once the upstream API keeps failing."""
+        func = Mock(side_effect=openai.error.ServiceUnavailableError('Down'))
+
+        with self.assertRaises(CircuitOpen):
+            call_upstream(func)
+        with self.assertRaises(CircuitOpen):
+            call_upstream(func)
+
+        # The circuit opened while the first call was being retried.
+        self.assertEqual(func.call_count, 3)
+
+    async def test_async_retried(self, patched_sleep):
+        """Test async calls are retried without blocking the loop."""
+        func = AsyncMock(side_effect=[
+            openai.error.Timeout('Timed out'),
+            'result',
+        ])
+
+        with patch('openai_app.upstream.asyncio.sleep') as patched:
+            self.assertEqual(await acall_upstream(func), 'result')
+
+        patched.assert_awaited_once()
+        patched_sleep.assert_not_called()
+
+    async def test_async_trial_cancelled(self, patched_sleep):
+        """Test a cancelled trial call lets a later call through."""
+        for _ in range(3):
+            self.breaker.before_call()
+            self.breaker.record(True)
+        self.breaker.reset_timeout = 0
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(acall_upstream(hang))
+        await started.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(
+            await acall_upstream(AsyncMock(return_value='result')), 'result')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
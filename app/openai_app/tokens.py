@@ -0,0 +1,325 @@
+"""
+Token counting for the OpenAI API.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import tiktoken
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Number of model names whose profile is kept in the registry.
+MAX_PROFILES = 1024
+
+# (tokens_per_message, tokens_per_name) for models with a known format.
+MESSAGE_FORMATS = {
+    "gpt-3.5-turbo-0613": (3, 1),
+    "gpt-3.5-turbo-16k-0613": (3, 1),
+    "gpt-4-0314": (3, 1),
+    "gpt-4-32k-0314": (3, 1),
+    "gpt-4-0613": (3, 1),
+    "gpt-4-32k-0613": (3, 1),
+    # every message follows <|start|>{role/name}\n{content}<|end|>\n
+    # if there's a name, the role is omitted
+    "gpt-3.5-turbo-0301": (4, -1),
+}
+
+# Context window of the models with a known format.
+CONTEXT_TOKENS = {
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k-0613": 16384,
+    "gpt-4-0314": 8192,
+    "gpt-4-32k-0314": 32768,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k-0613": 32768,
+    "gpt-3.5-turbo-0301": 4096,
+}
+
+# Every reply is primed with <|start|>assistant<|message|>
+REPLY_TOKENS = 3
+
+# Models that may update over time, counted as a pinned snapshot.
+MODEL_ALIASES = (
+    ("gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613"),
+    ("gpt-3.5-turbo", "gpt-3.5-turbo-0613"),
+    ("gpt-4-32k", "gpt-4-32k-0613"),
+    ("gpt-4", "gpt-4-0613"),
+)
+
+
+@dataclass(frozen=True)
+class TokenizerProfile:
+    """Encoding and message format used to count a model's tokens."""
+    encoding: tiktoken.Encoding
+    tokens_per_message: int
+    tokens_per_name: int
+    context_tokens: int
+    max_token_bytes: int
+
+
+class TokenCountCache:
+    """
+    Bounded LRU cache of token counts keyed by (encoding name, content hash).
+    Its size is accounted in bytes, using ENTRY_SIZE for every entry.
+    """
+    # Approximate memory used by one entry: key tuple, digest, count and
+    # the OrderedDict slot.
+    ENTRY_SIZE = 200
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(encoding, text):
+        """Return the cache key of a text for an encoding."""
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        return (encoding.name, digest)
+
+    def get(self, key):
+        """Return the cached count for a key, or None."""
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+        return count
+
+    def set(self, key, count):
+        """Cache a count, evicting the least recently used entries."""
+        max_entries = self.max_bytes // self.ENTRY_SIZE
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the counters of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': len(self._entries) * self.ENTRY_SIZE,
+                'max_bytes': self.max_bytes,
+            }
+
+
+token_count_cache = TokenCountCache(settings.TOKEN_CACHE_MAX_BYTES)
+
+# Model name -> TokenizerProfile, or None for unsupported models.
+_profiles = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _resolve_profile(model):
+    """Resolve a model name to its TokenizerProfile, or None."""
+    if model not in MESSAGE_FORMATS:
+        for alias, pinned in MODEL_ALIASES:
+            if alias in model:
+                model = pinned
+                break
+        else:
+            return None
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Default to cl100k_base encoding
+        encoding = tiktoken.get_encoding("cl100k_base")
+    tokens_per_message, tokens_per_name = MESSAGE_FORMATS[model]
+    max_token_bytes = max(map(len, encoding.token_byte_values()))
+
+    return TokenizerProfile(
+        encoding,
+        tokens_per_message,
+        tokens_per_name,
+        CONTEXT_TOKENS[model],
+        max_token_bytes,
+    )
+
+
+def preload_encodings(names, fail_silently=False):
+    """
+    Load encodings into memory so requests never pay for loading them.
+    The BPE files are read from TIKTOKEN_CACHE_DIR when present there.
+    """
+    for name in names:
+        try:
+            tiktoken.get_encoding(name)
+        except Exception:
+            if not fail_silently:
+                raise
+            logger.warning('Could not preload encoding %s.', name,
+                           exc_info=True)
+
+
+def get_profile(model):
+    """Return the cached TokenizerProfile for a model."""
+    try:
+        profile = _profiles[model]
+    except KeyError:
+        profile = _resolve_profile(model)
+        if len(_profiles) < MAX_PROFILES:
+            _profiles[model] = profile
+
+    if profile is None:
+        raise NotImplementedError(
+            f"""
+            num_tokens_from_messages() is not implemented for model \
+            {model}. See \
+            https://github.com/openai/openai-python/blob/main/chatml.md \
+            for information on how messages are converted to tokens.
+            """
+        )
+
+    return profile
+
+
+def _get_executor():
+    """Return the process-wide pool used to encode large payloads."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    settings.TOKEN_COUNT_THREADS,
+                    thread_name_prefix='tokens',
+                )
+
+    return _executor
+
+
+def _count_chunk(encoding, texts):
+    """Return the number of tokens of each text in a chunk, encoding the
+    texts one at a time."""
+    encode = encoding.encode
+    return [len(encode(text)) for text in texts]
+
+
+def _count_batch(encoding, texts):
+    """
+    Return the number of tokens of each text. Each text is encoded on its
+    own, but texts larger than TOKEN_COUNT_PARALLEL_THRESHOLD characters
+    in total are split into chunks encoded on the worker pool, where
+    tiktoken encodes without the GIL.
+    """
+    size = sum(len(text) for text in texts)
+    if size <= settings.TOKEN_COUNT_PARALLEL_THRESHOLD:
+        return _count_chunk(encoding, texts)
+
+    workers = settings.TOKEN_COUNT_THREADS
+    chunk_size = -(-len(texts) // workers)
+    chunks = [
+        texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)
+    ]
+    futures = [
+        _get_executor().submit(_count_chunk, encoding, chunk)
+        for chunk in chunks
+    ]
+
+    return [count for future in futures for count in future.result()]
+
+
+def count_tokens(encoding, texts):
+    """
+    Return the number of tokens of each text.
+    Texts of at least TOKEN_CACHE_MIN_LENGTH characters are looked up in
+    the token count cache first, the rest are counted in one call to
+    _count_batch().
+    """
+    if not token_count_cache.max_bytes:
+        return _count_batch(encoding, texts)
+
+    counts = [None] * len(texts)
+    missed = []
+    keys = []
+    for index, text in enumerate(texts):
+        if len(text) >= settings.TOKEN_CACHE_MIN_LENGTH:
+            key = token_count_cache.make_key(encoding, text)
+            counts[index] = token_count_cache.get(key)
+        else:
+            key = None
+        if counts[index] is None:
+            missed.append(index)
+            keys.append(key)
+
+    encoded = _count_batch(encoding, [texts[index] for index in missed])
+    for index, key, count in zip(missed, keys, encoded):
+        counts[index] = count
+        if key is not None:
+            token_count_cache.set(key, count)
+
+    return counts
+
+
+def count_message_tokens(messages, model):
+    """Return the number of tokens of messages, without priming the reply."""
+    profile = get_profile(model)
+
+    num_tokens = 0
+    texts = []
+    for message in messages:
+        num_tokens += profile.tokens_per_message
+        for key, value in message.items():
+            texts.append(value)
+            if key == "name":
+                num_tokens += profile.tokens_per_name
+    num_tokens += sum(count_tokens(profile.encoding, texts))
+    return num_tokens
+
+
+def estimate_message_tokens(messages, model):
+    """
+    Return a (lower, upper) bound of num_tokens_from_messages without
+    encoding, as every token is between 1 and max_token_bytes bytes long.
+    """
+    profile = get_profile(model)
+
+    lower = upper = REPLY_TOKENS
+    for message in messages:
+        lower += profile.tokens_per_message
+        upper += profile.tokens_per_message
+        for key, value in message.items():
+            size = len(str(value).encode('utf-8', 'surrogatepass'))
+            lower += -(-size // profile.max_token_bytes)
+            upper += size
+            if key == "name":
+                lower += profile.tokens_per_name
+                upper += profile.tokens_per_name
+
+    return lower, upper
+
+
+def num_tokens_from_messages(messages, model='gpt-3.5-turbo-0613'):
+    """
+    Return the number of tokens used by a list of messages.
+    Reference:
+    https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+    """
+    num_tokens = count_message_tokens(messages, model)
+    num_tokens += REPLY_TOKENS
+    return num_tokens
@@ -0,0 +1,244 @@
+"""
+Pooled keep-alive sessions to the OpenAI API, and the limits, retries
+and circuit breaker around its calls.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import aiohttp
+import openai
+import requests
+from core.bulkhead import Bulkhead
+from core.circuitbreaker import CircuitBreaker
+from core.singleflight import SingleFlight
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Retries of failed connections, as done by the openai client.
+MAX_CONNECTION_RETRIES = 2
+
+
+def get_timeout():
+    """Return the (connect, read) timeout of upstream calls."""
+    return settings.OPENAI_CONNECT_TIMEOUT, settings.OPENAI_READ_TIMEOUT
+
+
+class UpstreamSession(requests.Session):
+    """
+    Session kept for the life of the process, whose keep-alive connections
+    to the OpenAI API are shared by every thread. The openai client closes
+    its session every few minutes, which is ignored so that the pooled
+    connections survive.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.OPENAI_POOL_SIZE,
+            max_retries=MAX_CONNECTION_RETRIES,
+        )
+        self.mount('https://', self.adapter)
+
+    def request(self, method, url, **kwargs):
+        """Send a request with the upstream timeouts."""
+        kwargs['timeout'] = get_timeout()
+
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        """Keep the pooled connections when the openai client is done."""
+
+    def shutdown(self):
+        """Close the pooled connections."""
+        super().close()
+
+    def stats(self):
+        """Return the counters of the connection pools."""
+        pools = self.adapter.poolmanager.pools
+        connections = requests_sent = idle = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+            idle += sum(conn is not None for conn in list(pool.pool.queue))
+
+        return {
+            'max_size': settings.OPENAI_POOL_SIZE,
+            'connections_opened': connections,
+            'requests': requests_sent,
+            'idle_connections': idle,
+            'reuse_rate':
+                1 - connections / requests_sent if requests_sent else None,
+        }
+
+
+class AsyncUpstreamSessions:
+    """
+    aiohttp sessions to the OpenAI API, one per event loop, whose
+    connections are kept alive between the calls of the async views.
+    """
+
+    def __init__(self):
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=settings.OPENAI_POOL_SIZE),
+                )
+                self._sessions[loop] = session
+
+        return session
+
+    async def close(self):
+        """Close the session of the running event loop."""
+        with self._lock:
+            session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+upstream_session = UpstreamSession()
+async_upstream_sessions = AsyncUpstreamSessions()
+# Idempotent upstream calls shared by concurrent requests.
+upstream_calls = SingleFlight()
+# Chat completions in flight, by User.
+upstream_bulkhead = Bulkhead(
+    settings.OPENAI_MAX_CONCURRENT,
+    settings.OPENAI_MAX_CONCURRENT_PER_USER,
+    settings.OPENAI_MAX_QUEUED_PER_USER,
+)
+# Opened by upstream outages, shared by every upstream call.
+upstream_breaker = CircuitBreaker(
+    settings.OPENAI_BREAKER_ERROR_RATE,
+    settings.OPENAI_BREAKER_MIN_CALLS,
+    settings.OPENAI_BREAKER_WINDOW,
+    settings.OPENAI_BREAKER_RESET_TIMEOUT,
+)
+
+
+def coalesce(key, func, *args, **kwargs):
+    """
+    Make an idempotent upstream call, or wait for the identical call in
+    flight for as long as the call itself may take.
+    """
+    return upstream_calls.do(
+        key, func, *args, timeout=sum(get_timeout()), **kwargs)
+
+
+def is_retryable(error):
+    """Return whether an upstream call may succeed if made again."""
+    if isinstance(error, openai.error.APIConnectionError):
+        return error.should_retry
+    if isinstance(error, (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.Timeout,
+        openai.error.TryAgain,
+    )):
+        return True
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+
+    return False
+
+
+def get_retry_delay(error, attempt):
+    """
+    Return the seconds to wait before retrying a call for the attempt-th
+    time: Retry-After if the API sent it, or a jittered exponential delay.
+    """
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        pass
+
+    delay = min(
+        settings.OPENAI_RETRY_MAX_DELAY,
+        settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt,
+    )
+    return random.uniform(0, delay)
+
+
+class _Attempts:
+    """Attempts at an upstream call, within the retry budget."""
+
+    def __init__(self):
+        self.deadline = time.monotonic() + settings.OPENAI_RETRY_BUDGET
+        self.attempt = 0
+
+    def retry_delay(self, error):
+        """
+        Return the delay before retrying after an error, or None if the
+        error should be raised. Only retryable errors count as failures
+        of the upstream API.
+        """
+        retryable = is_retryable(error)
+        upstream_breaker.record(retryable)
+        if not retryable or self.attempt >= settings.OPENAI_MAX_RETRIES:
+            return None
+
+        delay = get_retry_delay(error, self.attempt)
+        if time.monotonic() + delay > self.deadline:
+            return None
+
+        self.attempt += 1
+        return delay
+
+
+def call_upstream(func, *args, **kwargs):
+    """
+    Make an upstream call, retrying it on retryable errors. Raise
+    CircuitOpen without calling while the upstream API is failing.
+    """
+    attempts = _Attempts()
+    while True:
+        upstream_breaker.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            delay = attempts.retry_delay(e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        except BaseException:
+            # The call was cancelled: give up a trial call of the breaker.
+            upstream_breaker.record(True)
+            raise
+        else:
+            upstream_breaker.record(False)
+            return result
+
+
+async def acall_upstream(func, *args, **kwargs):
+    """Make an async upstream call, like call_upstream()."""
+    attempts = _Attempts()
+    while True:
+        upstream_breaker.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            delay = attempts.retry_delay(e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        except BaseException:
+            # The call was cancelled: give up a trial call of the breaker.
+            upstream_breaker.record(True)
+            raise
+        else:
+            upstream_breaker.record(False)
+            return result
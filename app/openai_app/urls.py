@@ -3,15 +3,37 @@ URL mappings for the OpenAI API.
 """
 from django.urls import (
     path,
+    include,
 )
-from openai_app import views
+from django.conf import settings
+from rest_framework.routers import DefaultRouter
+from openai_app import (
+    async_views,
+    views,
+)
+
+if settings.OPENAI_ASYNC_VIEWS:
+    ModelListView = async_views.AsyncModelListAPIView
+    ModelView = async_views.AsyncModelAPIView
+    ChatCompletionView = async_views.AsyncChatCompletionAPIView
+else:
+    ModelListView = views.ModelListAPIView
+    ModelView = views.ModelAPIView
+    ChatCompletionView = views.DeductibleChatCompletionAPIView
+
+router = DefaultRouter()
+router.register('conversations', views.ConversationViewSet,
+                basename='conversation')
 
 app_name = 'openai'
 
 urlpatterns = [
-    path('models/', views.ModelListAPIView.as_view(), name='model-list'),
-    path('models/<str:model>/',
-         views.ModelAPIView.as_view(), name='model-detail'),
-    path('chat/completions/', views.DeductibleChatCompletionAPIView.as_view(),
+    path('models/', ModelListView.as_view(), name='model-list'),
+    path('models/<str:model>/', ModelView.as_view(), name='model-detail'),
+    path('chat/completions/', ChatCompletionView.as_view(),
          name='chat-completion'),
+    path('tokens/count/', views.TokenCountAPIView.as_view(),
+         name='token-count'),
+    path('stats/', views.StatsAPIView.as_view(), name='stats'),
+    path('', include(router.urls)),
 ]
@@ -1,30 +1,119 @@
 """
 Views for the OpenAI API.
 """
+import math
+import time
+from collections import defaultdict
+
 import openai
 import openai_app.serializers as serializers
-import tiktoken
-from balance.views import DeductBalanceMixin
+from balance.cache import balance_cache
+from balance.views import (
+    DeductBalanceMixin,
+    IsSuperUser,
+)
+from core.bulkhead import QueueFull
+from core.circuitbreaker import CircuitOpen
+from core.models import Conversation
+from openai_app.catalog import model_catalog
+from openai_app.completion_cache import completion_cache
+from openai_app.streaming import (
+    CompletionMeter,
+    DONE,
+    EventStream,
+    format_error,
+    format_event,
+)
+from openai_app.tokens import (
+    count_message_tokens,
+    count_tokens,
+    estimate_message_tokens,
+    get_profile,
+    num_tokens_from_messages,
+    REPLY_TOKENS,
+    token_count_cache,
+)
+from openai_app.upstream import (
+    call_upstream,
+    upstream_breaker,
+    upstream_bulkhead,
+    upstream_calls,
+    upstream_session,
+)
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+    token_cache,
+)
 from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiResponse,
 )
 from rest_framework import (
+    mixins,
     status,
+    viewsets,
 )
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 openai.organization = settings.OPENAI_ORGANIZATION
 openai.api_key = settings.OPENAI_API_KEY
+openai.requestssession = upstream_session
+
+# Parameters of chat completion requests forwarded to the upstream API.
+SAMPLING_PARAMS = (
+    'temperature',
+    'top_p',
+    'stop',
+    'presence_penalty',
+    'frequency_penalty',
+)
+
+
+def describe_error(error):
+    """Return the data, status code and headers of a failed upstream call."""
+    if isinstance(error, CircuitOpen):
+        return {
+            'message': str(error),
+        }, status.HTTP_503_SERVICE_UNAVAILABLE, {
+            'Retry-After': str(math.ceil(error.retry_after)),
+        }
+
+    return {
+        'message': str(error),
+    }, status.HTTP_500_INTERNAL_SERVER_ERROR, {}
+
+
+def error_response(error):
+    """Return the Response for a failed upstream call."""
+    data, status_code, headers = describe_error(error)
+
+    return Response(data, status=status_code, headers=headers)
+
+
+def create_chat_completion(**params):
+    """Create a chat completion and return it as a Response."""
+    try:
+        response = call_upstream(openai.ChatCompletion.create, **params)
+
+        return Response(response, status=status.HTTP_200_OK)
+    except Exception as e:
+        return error_response(e)
 
 
 class ModelListAPIView(APIView):
     """Reference: https://platform.openai.com/docs/api-reference/models/list"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.ModelListSerializer
 
@@ -32,14 +121,9 @@ class ModelListAPIView(APIView):
         """Lists the currently available models, and provides basic\
         information about each one such as the owner and availability."""
         try:
-            response = openai.Model.list()
-            serializer = self.serializer_class(response)
-
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(model_catalog.list(), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'message': str(e),
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return error_response(e)
 
 
 class ModelAPIView(APIView):
@@ -47,7 +131,10 @@ class ModelAPIView(APIView):
     Reference:
     https://platform.openai.com/docs/api-reference/models/retrieve
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.ModelSerializer
 
@@ -55,105 +142,338 @@ class ModelAPIView(APIView):
         """Retrieves a model instance, providing basic information\
         about the model such as the owner and permissioning."""
         try:
-            response = openai.Model.retrieve(model)
-            serializer = self.serializer_class(response)
-
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(
+                model_catalog.retrieve(model), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'message': str(e),
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return error_response(e)
 
 
 class ChatCompletionAPIView(APIView):
     """Reference: https://platform.openai.com/docs/api-reference/chat/create"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.ChatCompletionRequestSerializer
 
     def post(self, request, model=None, max_tokens=None):
         """Creates a model response for the given chat conversation."""
+        # Check with serializer if the request is valid.
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
         model = request.data.get('model', None)
         messages = request.data.get('messages', None)
-        user_max_tokens = request.data.get('max_tokens', None)
+        user_max_tokens = serializer.validated_data.get('max_tokens', None)
 
         if user_max_tokens and max_tokens:
             max_tokens = min(max_tokens, user_max_tokens)
         elif user_max_tokens:
             max_tokens = user_max_tokens
 
-        # Check with serializer if the request is valid.
-        serializer = self.serializer_class(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        return create_chat_completion(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+        )
+
+
+class DeductibleCompletionMixin(DeductBalanceMixin):
+    """
+    Mixin that holds the most a chat completion can cost \
+    from the User's Balance, then settles it for the actual usage.
+    """
+
+    def estimate_input_cost(self, model, messages, user_balance):
+        """
+        Return the input cost of a chat completion and whether it is exact,
+        bounding it before paying for an exact count.
+        """
+        if not messages or type(messages) != list:
+            return 0, True
+
+        lower, upper = estimate_message_tokens(messages, model)
+        context_tokens = get_profile(model).context_tokens
+
+        if lower > user_balance:
+            return lower, True
+        if upper + context_tokens <= user_balance:
+            # Neither the input nor the completion can exceed the
+            # Balance, so the input is charged from the upstream usage.
+            return upper, False
+
+        return num_tokens_from_messages(messages, model=model), True
+
+    def get_max_tokens(self, user_balance, input_cost, user_max_tokens):
+        """Return the max_tokens the User's Balance can pay for."""
+        max_tokens = user_balance - input_cost
+        if user_max_tokens is None:
+            user_max_tokens = settings.CHAT_COMPLETION_DEFAULT_MAX_TOKENS
+        if user_max_tokens:
+            max_tokens = min(max_tokens, user_max_tokens)
+
+        return max_tokens
+
+    def get_hold_amount(self, model, input_cost, max_tokens):
+        """Return the most a chat completion can cost."""
+        # No completion can be longer than the model's context window.
+        context_tokens = get_profile(model).context_tokens
+
+        return input_cost + min(max_tokens, context_tokens)
+
+    def get_sampling_params(self, validated_data):
+        """Return the sampling parameters of a request to forward."""
+        return {
+            name: validated_data[name]
+            for name in SAMPLING_PARAMS if name in validated_data
+        }
+
+    def get_cache_key(self, model, messages, validated_data, params):
+        """
+        Return the completion cache key of a request, or None unless it
+        asks for a cached completion that is deterministic.
+        """
+        if not validated_data.get('cache') or \
+                validated_data.get('stream') or \
+                params.get('temperature') != 0 or \
+                not completion_cache.max_bytes:
+            return None
+
+        return completion_cache.make_key(model, messages, params)
+
+    def get_cache_hit_cost(self, cost):
+        """Return the charge for a cached completion of a given cost."""
+        billing = settings.CHAT_COMPLETION_CACHE_BILLING
+        if billing == 'free':
+            return 0
+        if billing == 'discount':
+            return math.ceil(
+                cost * (1 - settings.CHAT_COMPLETION_CACHE_DISCOUNT))
+
+        return cost
+
+    def create_cached_completion(self, model, key, user_balance,
+                                 user_max_tokens):
+        """
+        Return a cached completion, charged according to
+        CHAT_COMPLETION_CACHE_BILLING, or None if there is none that
+        fits the request and the User's Balance.
+        """
+        started = time.monotonic()
+        completion = completion_cache.get(key)
+        if completion is None:
+            return None
+
+        usage = completion['usage']
+        if user_max_tokens is None:
+            user_max_tokens = settings.CHAT_COMPLETION_DEFAULT_MAX_TOKENS
+        if user_max_tokens and usage['completion_tokens'] > user_max_tokens:
+            return None
+
+        cost = self.get_cache_hit_cost(
+            usage['prompt_tokens'] + usage['completion_tokens'])
+        if cost > user_balance:
+            return None
+        if cost:
+            res = self.deduct_balance(cost)
+            if res is not None:
+                return res
+
+        self.record_usage(
+            model=model,
+            prompt_tokens=usage['prompt_tokens'],
+            completion_tokens=usage['completion_tokens'],
+            cost=cost,
+            latency_ms=int((time.monotonic() - started) * 1000),
+            request_id=completion.get('id') or '',
+        )
+
+        res = Response(completion, status=status.HTTP_200_OK)
+        res['X-Cache'] = 'HIT'
+
+        return res
+
+    def cache_completion(self, key, completion):
+        """Cache a completion unless it was cut short."""
+        if all(
+            choice.get('finish_reason') == 'stop'
+            for choice in completion['choices']
+        ):
+            completion_cache.set(key, completion)
+
+    def get_usage(self, completion, input_cost, exact_input_cost):
+        """Return the input cost and output cost of a chat completion."""
+        usage = completion.get('usage')
+        if not exact_input_cost:
+            input_cost = usage.get('prompt_tokens', input_cost)
+
+        return input_cost, usage.get('completion_tokens') or 0
+
+    def acquire_upstream_slot(self):
+        """
+        Wait for the User's turn to call the upstream API. Return False
+        if the User's requests already take their share of the slots, or
+        if the turn does not come within OPENAI_QUEUE_TIMEOUT seconds.
+        Waiting holds a worker thread, so a User never has more than
+        OPENAI_MAX_CONCURRENT_PER_USER requests in flight or waiting.
+        """
+        try:
+            upstream_bulkhead.acquire(
+                self.request.user.id,
+                settings.OPENAI_QUEUE_TIMEOUT,
+                wait_over_share=False,
+            )
+        except (QueueFull, TimeoutError):
+            return False
+
+        return True
+
+    async def aacquire_upstream_slot(self):
+        """
+        Wait for the User's turn to call the upstream API without holding
+        a thread, in the User's queue of OPENAI_MAX_QUEUED_PER_USER.
+        """
+        try:
+            await upstream_bulkhead.aacquire(
+                self.request.user.id, settings.OPENAI_QUEUE_TIMEOUT)
+        except (QueueFull, TimeoutError):
+            return False
+
+        return True
+
+    def release_upstream_slot(self):
+        """Let the next queued request call the upstream API."""
+        upstream_bulkhead.release(self.request.user.id)
+
+    def create_deductible_completion(self, model, messages, input_cost,
+                                     max_tokens, exact_input_cost=True,
+                                     **params):
+        """Create a chat completion, paid for from the User's Balance."""
+        hold = self.reserve_balance(
+            self.get_hold_amount(model, input_cost, max_tokens))
+
+        if hold is None:
+            return Response({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        cost = 0
+        usage = {}
+        try:
+            if not self.acquire_upstream_slot():
+                return Response({
+                    'message': 'Too many concurrent requests.',
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+            try:
+                started = time.monotonic()
+                res = create_chat_completion(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    **params,
+                )
+                latency = time.monotonic() - started
+            finally:
+                self.release_upstream_slot()
+
+            if res.status_code == status.HTTP_200_OK:
+                input_cost, outputCost = self.get_usage(
+                    res.data, input_cost, exact_input_cost)
+                cost = input_cost + outputCost
+            if cost:
+                usage = {
+                    'model': model,
+                    'prompt_tokens': input_cost,
+                    'completion_tokens': outputCost,
+                    'latency_ms': int(latency * 1000),
+                    'request_id': res.data.get('id') or '',
+                }
+        finally:
+            self.settle_balance(hold, cost, **usage)
+
+        return res
+
+    def stream_deductible_completion(self, model, messages, input_cost,
+                                     max_tokens, **params):
+        """
+        Stream a chat completion as server-sent events, paid for from the
+        User's Balance as its tokens arrive.
+        """
+        hold = self.reserve_balance(
+            self.get_hold_amount(model, input_cost, max_tokens))
+
+        if hold is None:
+            return Response({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        if not self.acquire_upstream_slot():
+            self.settle_balance(hold, 0)
+            return Response({
+                'message': 'Too many concurrent requests.',
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         try:
-            response = openai.ChatCompletion.create(
+            started = time.monotonic()
+            chunks = call_upstream(
+                openai.ChatCompletion.create,
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
+                stream=True,
+                **params,
             )
-
-            return Response(response, status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'message': str(e),
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self.release_upstream_slot()
+            self.settle_balance(hold, 0)
+            return error_response(e)
 
+        meter = CompletionMeter(model, input_cost, hold.amount)
 
-def num_tokens_from_messages(messages, model='gpt-3.5-turbo-0613'):
-    """
-    Return the number of tokens used by a list of messages.
-    Reference:
-    https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-    """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        # Default to cl100k_base encoding
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model in {
-        "gpt-3.5-turbo-0613",
-        "gpt-3.5-turbo-16k-0613",
-        "gpt-4-0314",
-        "gpt-4-32k-0314",
-        "gpt-4-0613",
-        "gpt-4-32k-0613",
-    }:
-        tokens_per_message = 3
-        tokens_per_name = 1
-    elif model == "gpt-3.5-turbo-0301":
-        # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_message = 4
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif "gpt-3.5-turbo" in model:
-        # gpt-3.5-turbo may update over time.
-        # Returning num tokens assuming gpt-3.5-turbo-0613.
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613")
-    elif "gpt-4" in model:
-        # gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.
-        return num_tokens_from_messages(messages, model="gpt-4-0613")
-    else:
-        raise NotImplementedError(
-            f"""
-            num_tokens_from_messages() is not implemented for model \
-            {model}. See \
-            https://github.com/openai/openai-python/blob/main/chatml.md \
-            for information on how messages are converted to tokens.
-            """
+        def finish():
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            self.release_upstream_slot()
+            self.settle_balance(
+                hold,
+                meter.cost,
+                model=model,
+                prompt_tokens=meter.input_cost,
+                completion_tokens=meter.completion_tokens,
+                latency_ms=int((time.monotonic() - started) * 1000),
+                request_id=meter.request_id,
+            )
+
+        response = StreamingHttpResponse(
+            EventStream(self.stream_events(chunks, meter), finish),
+            content_type='text/event-stream',
         )
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        response['Cache-Control'] = 'no-cache'
+        # Keep proxies from buffering the events.
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    def stream_events(self, chunks, meter):
+        """
+        Yield the chunks of a completion as events, and cut the stream off
+        once it costs more than its limit.
+        """
+        try:
+            for chunk in chunks:
+                if not meter.add(chunk):
+                    yield format_error('Insufficient balance.')
+                    return
+                yield format_event(chunk)
+            yield DONE
+        except Exception as e:
+            yield format_error(str(e))
 
 
 class DeductibleChatCompletionAPIView(
-    DeductBalanceMixin,
+    DeductibleCompletionMixin,
     ChatCompletionAPIView,
 ):
     """
@@ -170,25 +490,240 @@ class DeductibleChatCompletionAPIView(
     )
     def post(self, request, model=None):
         """Creates a model response for the given chat conversation."""
-        user = request.user
-        user_balance = user.balance.balance
+        user_balance = self.available_balance()
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
         model = request.data.get('model', None)
         messages = request.data.get('messages', None)
+        params = self.get_sampling_params(serializer.validated_data)
 
-        input_cost = 0
-        if messages and type(messages) == list:
-            input_cost = num_tokens_from_messages(messages, model=model)
+        key = self.get_cache_key(
+            model, messages, serializer.validated_data, params)
+        if key is not None:
+            res = self.create_cached_completion(
+                model,
+                key,
+                user_balance,
+                serializer.validated_data.get('max_tokens'),
+            )
+            if res is not None:
+                return res
+
+        input_cost, exact_input_cost = self.estimate_input_cost(
+            model, messages, user_balance)
 
         if not self.check_balance(input_cost):
             return Response({
                 'message': 'Insufficient balance.',
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
 
+        max_tokens = self.get_max_tokens(
+            user_balance,
+            input_cost,
+            serializer.validated_data.get('max_tokens'),
+        )
+
+        if serializer.validated_data.get('stream'):
+            if not exact_input_cost:
+                # Streamed completions report no usage to charge it from.
+                input_cost = num_tokens_from_messages(messages, model=model)
+
+            return self.stream_deductible_completion(
+                model, messages, input_cost, max_tokens, **params)
+
         # Make the API call only if the User has sufficient Balance.
-        res = super().post(request, model, max_tokens=user_balance-input_cost)
+        res = self.create_deductible_completion(
+            model, messages, input_cost, max_tokens, exact_input_cost,
+            **params)
+
+        if key is not None and res.status_code == status.HTTP_200_OK:
+            self.cache_completion(key, res.data)
+
+        return res
+
+
+class ConversationViewSet(
+    DeductibleCompletionMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Views for Conversations whose history is kept by the API, \
+    so that each turn only sends and counts its new messages.
+    """
+    serializer_class = serializers.ConversationSerializer
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Retrieve the Conversations of the current User."""
+        return Conversation.objects.filter(
+            user=self.request.user).order_by('-id')
+
+    def get_serializer_class(self):
+        """Return the serializer class for the request."""
+        if self.action == 'messages':
+            return serializers.ConversationMessagesSerializer
+
+        return self.serializer_class
+
+    def perform_create(self, serializer):
+        """Create a Conversation, counting the tokens of its messages."""
+        model = serializer.validated_data['model']
+        messages = serializer.validated_data.get('messages', [])
+
+        try:
+            num_tokens = count_message_tokens(messages, model)
+        except NotImplementedError:
+            raise ValidationError({
+                'model': 'Token counting is not implemented for this model.',
+            })
+
+        serializer.save(user=self.request.user, num_tokens=num_tokens)
+
+    def append_messages(self, conversation, messages, num_tokens):
+        """Append messages and their token count to a Conversation."""
+        with transaction.atomic():
+            conversation = Conversation.objects.select_for_update().get(
+                pk=conversation.pk)
+            conversation.messages += messages
+            conversation.num_tokens += num_tokens
+            conversation.save()
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                response=serializers.ChatCompletionResponseSerializer
+            )
+        }
+    )
+    @action(detail=True, methods=['post'])
+    def messages(self, request, pk=None):
+        """Add messages to a Conversation and create the model's response."""
+        conversation = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        messages = [dict(m) for m in serializer.validated_data['messages']]
+        model = conversation.model
+
+        # Only the new messages are counted, the history is already counted.
+        new_tokens = count_message_tokens(messages, model)
+        input_cost = conversation.num_tokens + new_tokens + REPLY_TOKENS
+
+        if not self.check_balance(input_cost):
+            return Response({
+                'message': 'Insufficient balance.',
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        max_tokens = self.get_max_tokens(
+            self.available_balance(),
+            input_cost,
+            serializer.validated_data.get('max_tokens'),
+        )
+
+        res = self.create_deductible_completion(
+            model, conversation.messages + messages, input_cost, max_tokens)
 
         if res.status_code == status.HTTP_200_OK:
-            outputCost = res.data.get('usage').get('completion_tokens') or 0
-            self.deduct_balance(input_cost + outputCost)
+            reply = res.data['choices'][0]['message']
+            reply = {
+                'role': reply.get('role'),
+                'content': reply.get('content') or '',
+            }
+            reply_tokens = count_message_tokens([reply], model)
+            self.append_messages(
+                conversation,
+                messages + [reply],
+                new_tokens + reply_tokens,
+            )
 
         return res
+
+
+class TokenCountAPIView(APIView):
+    """Count the tokens of many conversations or texts without a completion."""
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    serializer_class = serializers.TokenCountRequestSerializer
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                response=serializers.TokenCountResponseSerializer
+            )
+        }
+    )
+    def post(self, request):
+        """Count the tokens of each item and their total."""
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        for model in {item['model'] for item in items}:
+            try:
+                get_profile(model)
+            except NotImplementedError:
+                raise ValidationError({
+                    'model': f'Token counting is not implemented for {model}.',
+                })
+
+        counts = [0] * len(items)
+        texts = defaultdict(list)
+        try:
+            for index, item in enumerate(items):
+                if 'messages' in item:
+                    counts[index] = num_tokens_from_messages(
+                        item['messages'], model=item['model'])
+                else:
+                    texts[item['model']].append(index)
+
+            # Texts of the same model are counted as one batch.
+            for model, indexes in texts.items():
+                encoding = get_profile(model).encoding
+                batch = [items[index]['text'] for index in indexes]
+                for index, count in zip(indexes,
+                                        count_tokens(encoding, batch)):
+                    counts[index] = count
+        except ValueError as e:
+            raise ValidationError({'items': str(e)})
+
+        return Response({
+            'items': [{'tokens': count} for count in counts],
+            'total': sum(counts),
+        }, status=status.HTTP_200_OK)
+
+
+class StatsAPIView(APIView):
+    """Statistics of the caches of this process. (Superuser only)"""
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated, IsSuperUser]
+
+    def get(self, request):
+        """
+        Retrieve the hit, miss and eviction counters of the caches, and
+        the counters of the upstream connection pool.
+        """
+        return Response({
+            'token_count_cache': token_count_cache.stats(),
+            'completion_cache': completion_cache.stats(),
+            'balance_cache': balance_cache.stats(),
+            'token_cache': token_cache.stats(),
+            'upstream_pool': upstream_session.stats(),
+            'model_catalog': model_catalog.stats(),
+            'upstream_calls': upstream_calls.stats(),
+            'upstream_bulkhead': upstream_bulkhead.stats(),
+            'upstream_breaker': upstream_breaker.stats(),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,162 @@
+"""
+Signed, expiring access tokens verified without the database.
+"""
+import secrets
+import threading
+import time
+from datetime import (
+    datetime,
+    timezone,
+)
+
+from core.models import (
+    RevokedToken,
+    UsedRefreshToken,
+)
+from django.conf import settings
+from django.core.signing import (
+    BadSignature,
+    SignatureExpired,
+)
+from django.db import (
+    IntegrityError,
+    transaction,
+)
+from django.utils.crypto import (
+    constant_time_compare,
+    salted_hmac,
+)
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class RevocationList:
+    """
+    Ids of the revoked tokens that have not expired. Each process reloads
+    them from the database every ACCESS_TOKEN_REVOCATION_REFRESH seconds.
+    """
+
+    def __init__(self):
+        self._ids = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, token_id):
+        refresh = settings.ACCESS_TOKEN_REVOCATION_REFRESH
+        with self._lock:
+            if self._loaded_at is None or \
+                    time.monotonic() - self._loaded_at >= refresh:
+                self._ids = set(RevokedToken.objects.filter(
+                    expires_at__gt=datetime.now(timezone.utc),
+                ).values_list('jti', flat=True))
+                self._loaded_at = time.monotonic()
+
+            return token_id in self._ids
+
+    def revoke(self, token_id, expires):
+        """Revoke a token. Return False if it was already revoked."""
+        now = datetime.now(timezone.utc)
+        RevokedToken.objects.filter(expires_at__lte=now).delete()
+
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(
+                    jti=token_id,
+                    expires_at=datetime.fromtimestamp(expires, timezone.utc),
+                )
+        except IntegrityError:
+            return False
+
+        with self._lock:
+            self._ids.add(token_id)
+
+        return True
+
+    def clear(self):
+        """Reload the revoked tokens with the next check."""
+        with self._lock:
+            self._loaded_at = None
+
+
+revocation_list = RevocationList()
+
+
+def use_refresh_token(token_id, expires):
+    """
+    Mark a refresh token as exchanged. Return False if it already was.
+    Used tokens are only checked when refreshing, so they are kept out of
+    the revocation list checked by every request.
+    """
+    now = datetime.now(timezone.utc)
+    UsedRefreshToken.objects.filter(expires_at__lte=now).delete()
+
+    try:
+        with transaction.atomic():
+            UsedRefreshToken.objects.create(
+                jti=token_id,
+                expires_at=datetime.fromtimestamp(expires, timezone.utc),
+            )
+    except IntegrityError:
+        return False
+
+    return True
+
+
+def sign(version, payload):
+    """Return the HMAC of a token payload with the key of a version."""
+    return salted_hmac(
+        'user.access_tokens',
+        payload,
+        secret=settings.ACCESS_TOKEN_KEYS[version],
+        algorithm='sha256',
+    ).hexdigest()
+
+
+def issue(user, kind):
+    """Return a new token of a kind for a User."""
+    lifetime = settings.ACCESS_TOKEN_LIFETIME if kind == ACCESS \
+        else settings.REFRESH_TOKEN_LIFETIME
+    version = settings.ACCESS_TOKEN_KEY_VERSION
+    payload = '.'.join([
+        version,
+        kind,
+        str(user.pk),
+        str(int(time.time()) + lifetime),
+        secrets.token_hex(16),
+    ])
+
+    return f'{payload}.{sign(version, payload)}'
+
+
+def issue_pair(user):
+    """Return a new access token and refresh token for a User."""
+    return {
+        'access': issue(user, ACCESS),
+        'refresh': issue(user, REFRESH),
+        'expires_in': settings.ACCESS_TOKEN_LIFETIME,
+    }
+
+
+def verify(token, kind=None):
+    """
+    Verify a token, of a kind if given, and return its User id, expiry
+    and id. Raise BadSignature if the token is invalid or revoked, and
+    SignatureExpired if it expired.
+    """
+    try:
+        payload, signature = token.rsplit('.', 1)
+        version, token_kind, user_id, expires, token_id = payload.split('.')
+        user_id, expires = int(user_id), int(expires)
+        valid = constant_time_compare(signature, sign(version, payload))
+    except (KeyError, ValueError):
+        raise BadSignature('Malformed token.')
+
+    if not valid or kind not in (None, token_kind):
+        raise BadSignature('Invalid token.')
+    if expires <= time.time():
+        raise SignatureExpired('Token expired.')
+    if token_id in revocation_list:
+        raise BadSignature('Token revoked.')
+
+    return user_id, expires, token_id
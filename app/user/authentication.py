@@ -0,0 +1,141 @@
+"""
+Authentication for the APIs.
+"""
+import hashlib
+
+from core.cache import TwoLevelCache
+from django.contrib.auth import get_user_model
+from django.core.signing import BadSignature
+from django.db import router
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import (
+    BaseAuthentication,
+    get_authorization_header,
+    TokenAuthentication,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from user.access_tokens import (
+    ACCESS,
+    verify,
+)
+
+
+class TokenCache(TwoLevelCache):
+    """
+    Cache of the User ids of Auth tokens, by key. Neither the tokens nor
+    their Users are written to the default cache.
+    """
+    prefix = 'token-user'
+    ttl_setting = 'AUTH_TOKEN_CACHE_TTL'
+    local_ttl_setting = 'AUTH_TOKEN_CACHE_LOCAL_TTL'
+
+    def load(self, key):
+        """Return the User id of a token from the database."""
+        return Token.objects.filter(key=key).values_list(
+            'user_id', flat=True).first()
+
+    def make_key(self, key):
+        """Return the key of a token in the default cache, without the
+        token itself."""
+        return f'{self.prefix}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+class UserCache(TwoLevelCache):
+    """
+    Cache of Users by id. Only the fields of a User other than its
+    password are cached, and the password is loaded when it is accessed.
+    """
+    prefix = 'user-fields'
+    ttl_setting = 'AUTH_TOKEN_CACHE_TTL'
+    local_ttl_setting = 'AUTH_TOKEN_CACHE_LOCAL_TTL'
+
+    def get_field_names(self):
+        """Return the names of the cached fields of a User."""
+        return [
+            field.attname
+            for field in get_user_model()._meta.concrete_fields
+            if field.name != 'password'
+        ]
+
+    def load(self, user_id):
+        """Return the cached fields of a User from the database."""
+        return get_user_model().objects.filter(pk=user_id).values(
+            *self.get_field_names()).first()
+
+    def get(self, user_id):
+        """Return a User with a deferred password, or None."""
+        fields = super().get(user_id)
+        if fields is None:
+            return None
+
+        model = get_user_model()
+        return model.from_db(
+            router.db_for_read(model), list(fields), list(fields.values()))
+
+
+token_cache = TokenCache()
+user_cache = UserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves tokens through the token cache."""
+
+    def authenticate_credentials(self, key):
+        user_id = token_cache.get(key)
+        if user_id is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        user = user_cache.get(user_id)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, Token(key=key, user=user))
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    Authentication with signed access tokens, verified in memory:
+
+        Authorization: Bearer <access token>
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header.'))
+
+        try:
+            user_id, expires, token_id = verify(auth[1].decode(), ACCESS)
+        except (UnicodeError, BadSignature):
+            raise AuthenticationFailed(_('Invalid or expired token.'))
+
+        user = user_cache.get(user_id)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """Drop a deleted token."""
+    token_cache.delete(instance.key)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user(sender, instance, **kwargs):
+    """Drop a changed, such as deactivated, User."""
+    user_cache.delete(instance.pk)
@@ -70,3 +70,20 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for refreshing a signed access token."""
+    refresh = serializers.CharField()
+
+
+class RevokeTokenSerializer(serializers.Serializer):
+    """Serializer for revoking a signed access or refresh token."""
+    token = serializers.CharField()
+
+
+class AccessTokenSerializer(serializers.Serializer):
+    """Serializer for signed access and refresh tokens."""
+    access = serializers.CharField()
+    refresh = serializers.CharField()
+    expires_in = serializers.IntegerField()
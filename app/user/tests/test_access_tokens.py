@@ -0,0 +1,141 @@
+"""
+Tests for signed access tokens.
+"""
+from core.models import (
+    RevokedToken,
+    UsedRefreshToken,
+)
+from django.contrib.auth import get_user_model
+from django.test import (
+    override_settings,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from user.access_tokens import revocation_list
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_USER_URL = reverse('user:me')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+class AccessTokenTests(TestCase):
+    """Test signed access token requests."""
+
+    def setUp(self):
+        """Create client and User for testing."""
+        revocation_list.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+
+    def create_tokens(self):
+        """Create an access token and a refresh token through the API."""
+        payload = {'email': 'test@example.com', 'password': 'testpass123'}
+        return self.client.post(TOKEN_URL, payload).data
+
+    def get_me(self, access):
+        """Retrieve the User authenticated by an access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get(ME_USER_URL)
+
+    def test_access_token(self):
+        """Test an access token is verified without the database."""
+        tokens = self.create_tokens()
+        self.get_me(tokens['access'])
+
+        with self.assertNumQueries(0):
+            res = self.get_me(tokens['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_bad_credentials(self):
+        """Test no tokens are created for wrong credentials."""
+        payload = {'email': 'test@example.com', 'password': 'wrong'}
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tampered_token(self):
+        """Test a token whose payload was changed is refused."""
+        access = self.create_tokens()['access']
+        version, kind, user_id, rest = access.split('.', 3)
+
+        res = self.get_me('.'.join([version, kind, '0', rest]))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_not_access(self):
+        """Test a refresh token cannot be used as an access token."""
+        res = self.get_me(self.create_tokens()['refresh'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(ACCESS_TOKEN_LIFETIME=0)
+    def test_expired_token(self):
+        """Test an expired access token is refused."""
+        res = self.get_me(self.create_tokens()['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_removed_key(self):
+        """Test tokens signed with a removed key are refused."""
+        access = self.create_tokens()['access']
+
+        with override_settings(ACCESS_TOKEN_KEYS={'2': 'new secret'},
+                               ACCESS_TOKEN_KEY_VERSION='2'):
+            res = self.get_me(access)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh(self):
+        """Test a refresh token is exchanged for new tokens once."""
+        refresh = self.create_tokens()['refresh']
+
+        res = self.client.post(REFRESH_URL, {'refresh': refresh})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_me(res.data['access']).status_code, status.HTTP_200_OK)
+
+        self.client.credentials()
+        res = self.client.post(REFRESH_URL, {'refresh': refresh})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        # Used refresh tokens stay out of the list checked by every request.
+        self.assertFalse(RevokedToken.objects.exists())
+        self.assertEqual(UsedRefreshToken.objects.count(), 1)
+
+    def test_revoke(self):
+        """Test a revoked access token is refused."""
+        access = self.create_tokens()['access']
+
+        res = self.client.post(REVOKE_URL, {'token': access})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        revocation_list.clear()
+        res = self.get_me(access)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """Test the access tokens of a deactivated User are refused."""
+        access = self.create_tokens()['access']
+        self.get_me(access)
+
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.get_me(access)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
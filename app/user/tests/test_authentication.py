@@ -0,0 +1,99 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from user.authentication import (
+    token_cache,
+    user_cache,
+)
+
+ME_USER_URL = reverse('user:me')
+
+
+def create_user(**params):
+    """
+    Helper function to create and return a User.
+    """
+    return get_user_model().objects.create_user(**params)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens."""
+
+    def setUp(self):
+        """Create client with a token for testing."""
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_cached(self):
+        """Test a token is resolved from the database once."""
+        self.client.get(ME_USER_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_USER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token(self):
+        """Test a deleted token is dropped from the cache."""
+        self.client.get(ME_USER_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_USER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """Test the tokens of a deactivated User are dropped."""
+        self.client.get(ME_USER_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_USER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token(self):
+        """Test an unknown token is refused."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_USER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_values(self):
+        """Test neither the token nor the password is in the cache."""
+        self.client.get(ME_USER_URL)
+
+        values = repr([
+            cache.get(token_cache.make_key(self.token.key)),
+            cache.get(user_cache.make_key(self.user.id)),
+        ])
+
+        self.assertIn(self.user.email, values)
+        self.assertNotIn(self.token.key, values)
+        self.assertNotIn(self.user.password, values)
+
+    def test_update_keeps_password(self):
+        """Test updating a cached User keeps its password."""
+        self.client.get(ME_USER_URL)
+
+        res = self.client.patch(ME_USER_URL, {'name': 'New Name'})
+        self.user.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user.name, 'New Name')
+        self.assertTrue(self.user.check_password('testpass123'))
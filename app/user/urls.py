@@ -9,5 +9,10 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('auth/', views.CreateTokenView.as_view(), name='auth'),
+    path('token/', views.CreateAccessTokenView.as_view(), name='token'),
+    path('token/refresh/', views.RefreshAccessTokenView.as_view(),
+         name='token-refresh'),
+    path('token/revoke/', views.RevokeAccessTokenView.as_view(),
+         name='token-revoke'),
     path('me/', views.ManageUserView.as_view(), name='me'),
 ]
@@ -1,16 +1,39 @@
 """
 Views for the User API.
 """
+from django.core.signing import BadSignature
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiResponse,
+)
 from rest_framework import (
-    authentication,
     generics,
-    permissions
+    permissions,
+    status,
 )
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from user.access_tokens import (
+    issue_pair,
+    REFRESH,
+    revocation_list,
+    use_refresh_token,
+    verify,
+)
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+    user_cache,
+)
 from user.serializers import (
+    AccessTokenSerializer,
     UserSerializer,
-    AuthTokenSerializer
+    AuthTokenSerializer,
+    RefreshTokenSerializer,
+    RevokeTokenSerializer,
 )
 
 
@@ -25,10 +48,92 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
+class AccessTokenView(APIView):
+    """Base view for signed tokens, which are sent in request bodies."""
+    authentication_classes = []
+
+    def get_authenticate_header(self, request):
+        """Return the scheme of signed access tokens for 401 responses."""
+        return AccessTokenAuthentication.keyword
+
+
+class CreateAccessTokenView(AccessTokenView):
+    """Create a signed access token and a refresh token for a User."""
+    serializer_class = AuthTokenSerializer
+
+    @extend_schema(
+        responses={200: OpenApiResponse(response=AccessTokenSerializer)}
+    )
+    def post(self, request):
+        """Authenticate with email and password."""
+        serializer = self.serializer_class(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        return Response(
+            issue_pair(serializer.validated_data['user']),
+            status=status.HTTP_200_OK,
+        )
+
+
+class RefreshAccessTokenView(AccessTokenView):
+    """
+    Exchange a refresh token for a new access token and refresh token.
+    Each refresh token can be used once.
+    """
+    serializer_class = RefreshTokenSerializer
+
+    @extend_schema(
+        responses={200: OpenApiResponse(response=AccessTokenSerializer)}
+    )
+    def post(self, request):
+        """Refresh a signed access token."""
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            user_id, expires, token_id = verify(
+                serializer.validated_data['refresh'], REFRESH)
+        except BadSignature:
+            raise AuthenticationFailed('Invalid or expired refresh token.')
+
+        if not use_refresh_token(token_id, expires):
+            raise AuthenticationFailed('Refresh token already used.')
+
+        user = user_cache.get(user_id)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        return Response(issue_pair(user), status=status.HTTP_200_OK)
+
+
+class RevokeAccessTokenView(AccessTokenView):
+    """Revoke a signed access token or refresh token."""
+    serializer_class = RevokeTokenSerializer
+
+    def post(self, request):
+        """Revoke a token before it expires."""
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            user_id, expires, token_id = verify(
+                serializer.validated_data['token'])
+        except BadSignature:
+            raise AuthenticationFailed('Invalid or expired token.')
+
+        revocation_list.revoke(token_id, expires)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated User."""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):